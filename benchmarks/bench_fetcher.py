@@ -0,0 +1,99 @@
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from benchmarks.fixtures import make_submission
+from text_analysis.edgar_fetcher import ConcurrentFetcher
+from text_analysis.rate_governor import RateGovernor
+from text_analysis.sec_scraper import create_session, SEC_MAX_REQUESTS_PER_SECOND
+from text_analysis.sec_transport import EdgarStandIn, ResponseArchive, mount_transport, REPLAY_TRANSPORT
+
+# Full submission texts, as requested by SECScraper.download_10k
+FILING_URL = re.compile(r'https://www\.sec\.gov//?Archives/edgar/data/(\d+)/\d+/([\d-]+)\.txt$')
+
+
+def make_archive(path, filings=40, size_mb=1.0, cik_code='320193'):
+    """
+    Builds an archive of synthetic full submissions, served where SECScraper.download_10k requests them.
+    """
+    archive = ResponseArchive(path)
+    for i in range(filings):
+        accession_number = f'{int(cik_code):010d}-20-{i:06d}'
+        # download_10k joins the host and an endpoint starting with a slash
+        url = (f'https://www.sec.gov//Archives/edgar/data/{cik_code}/{accession_number.replace("-", "")}/'
+               f'{accession_number}.txt')
+        content = make_submission(i, int(size_mb * 1024 ** 2), exhibits=2).encode('utf-8')
+        archive.put('GET', url, 200, {'Content-Type': 'text/plain; charset=utf-8'}, content)
+    return archive
+
+
+def archived_filings(archive):
+    """
+    Returns the (CIK code, accession number) of every full submission in the archive.
+    """
+    return [match.groups() for match in map(FILING_URL.match, archive.urls()) if match]
+
+
+def run(stand_in, filings, workers, max_rate):
+    # A governor of its own, so every run starts from the full rate and the rate shared by the scrapers running on
+    # the host is left alone
+    state_dir = tempfile.mkdtemp()
+    governor = RateGovernor(max_rate, path=os.path.join(state_dir, 'governor.state'))
+    before = stand_in.stats()
+    session = mount_transport(create_session(pool_size=workers), REPLAY_TRANSPORT, stand_in_url=stand_in.url,
+                              pool_size=workers)
+    with ConcurrentFetcher(max_workers=workers, session=session, governor=governor) as fetcher:
+        start_time = time.perf_counter()
+        documents = [document for _, _, document in fetcher.fetch_filings(filings, fetch_mode='full')]
+        elapsed = time.perf_counter() - start_time
+    session.close()
+    rate = governor.rate
+    shutil.rmtree(state_dir, ignore_errors=True)
+    after = stand_in.stats()
+    fetched = [document for document in documents if document is not None]
+    return {'workers': workers, 'filings_per_second': len(fetched) / elapsed,
+            'mb_per_second': sum(map(len, fetched)) / 1024 ** 2 / elapsed, 'failed': len(documents) - len(fetched),
+            'requests': after['requests'] - before['requests'], 'throttled': after['throttled'] - before['throttled'],
+            'seconds': elapsed, 'final_rate': rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures fetcher throughput and retries against a local EDGAR '
+                                                 'stand-in')
+    parser.add_argument('--archive', help='archive recorded with SEC_TRANSPORT=record, synthetic filings when omitted')
+    parser.add_argument('--filings', type=int, default=40, help='number of synthetic filings')
+    parser.add_argument('--size-mb', type=float, default=1, help='size of the synthetic filings')
+    parser.add_argument('--workers', default='1,4,8', help='comma separated fetcher worker counts')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added before every response')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--server-rate', type=float, default=10, help='requests per second before the server '
+                                                                      'answers 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of random 429 responses')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second per response')
+    parser.add_argument('--client-rate', type=float, default=None, help='request rate of the scraper, 10 by default')
+    args = parser.parse_args()
+
+    if args.archive:
+        archive = ResponseArchive(args.archive)
+    else:
+        archive = make_archive(os.path.join(tempfile.mkdtemp(), 'archive.sqlite'), args.filings, args.size_mb)
+    filings = archived_filings(archive)
+
+    with EdgarStandIn(archive, latency=args.latency, jitter=args.jitter, max_requests_per_second=args.server_rate,
+                      error_rate=args.error_rate, bandwidth=args.bandwidth) as stand_in:
+        print(f"{len(filings)} filings, latency {args.latency}s, server rate {args.server_rate}/s, "
+              f"error rate {args.error_rate:.0%}, bandwidth {args.bandwidth or 'unlimited'}")
+        print(f"{'workers':>8}{'filings/s':>12}{'MB/s':>10}{'failed':>8}{'requests':>10}{'429s':>8}{'seconds':>10}"
+              f"{'rate':>8}")
+        for workers in map(int, args.workers.split(',')):
+            result = run(stand_in, filings, workers, args.client_rate or SEC_MAX_REQUESTS_PER_SECOND)
+            print(f"{result['workers']:>8}{result['filings_per_second']:>12.2f}{result['mb_per_second']:>10.2f}"
+                  f"{result['failed']:>8}{result['requests']:>10}{result['throttled']:>8}{result['seconds']:>10.2f}"
+                  f"{result['final_rate']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import time
+
+from benchmarks.fixtures import make_ten_k_html
+from text_analysis.ten_k_extractor import TenKExtractor
+
+
+def time_parse(extractor, document, html_parser, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        sections = extractor.parse_sections(document, html_parser=html_parser)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings), sections
+
+
+def compare(fast_sections, bs4_sections):
+    """
+    Share of sections whose words match between both parsers (line breaks may differ at section edges).
+    """
+    same = sum(fast_sections.get(item, '').split() == text.split() for item, text in bs4_sections.items())
+    return same / len(bs4_sections) if bs4_sections else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares HTMLText with the per-section BeautifulSoup parsing')
+    parser.add_argument('paths', nargs='*', help='10-K HTML documents to parse, synthetic ones when omitted')
+    parser.add_argument('--size-mb', type=float, default=4, help='size of the synthetic documents')
+    parser.add_argument('--documents', type=int, default=3, help='number of synthetic documents')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.paths:
+        documents = {path: open(path, encoding='utf-8', errors='replace').read() for path in args.paths}
+    else:
+        documents = {f'synthetic-{seed}': make_ten_k_html(seed, int(args.size_mb * 1024 ** 2))
+                     for seed in range(args.documents)}
+
+    extractor = TenKExtractor('0', '2020', '2020')
+    print(f"{'document':<30}{'size MB':>10}{'bs4 s':>10}{'fast s':>10}{'speedup':>10}{'match':>10}")
+    for name, html in documents.items():
+        document = {'10-K': html}
+        bs4_time, bs4_sections = time_parse(extractor, document, 'bs4', args.repeat)
+        fast_time, fast_sections = time_parse(extractor, document, 'fast', args.repeat)
+        print(f"{name[-30:]:<30}{len(html) / 1024 ** 2:>10.2f}{bs4_time:>10.3f}{fast_time:>10.3f}"
+              f"{bs4_time / fast_time:>10.1f}{compare(fast_sections, bs4_sections):>10.0%}")
+
+
+if __name__ == '__main__':
+    main()
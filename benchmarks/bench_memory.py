@@ -0,0 +1,99 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.bench_fetcher import make_archive, archived_filings
+from benchmarks.fixtures import make_lm_dictionary, StubSentimentPipeline
+from text_analysis.model_registry import ModelRegistry, SENTIMENT_MODEL, FINBERT_MODEL, LM_DICTIONARY
+from text_analysis.result_sink import ParquetResultSink
+from text_analysis.sec_scraper import create_session
+from text_analysis.sec_transport import EdgarStandIn, ResponseArchive, mount_transport, REPLAY_TRANSPORT
+from text_analysis.sentiment_analyzer import SentimentAnalyzer
+from text_analysis.ten_k_extractor import TenKExtractor
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(mode, filings, stand_in_url, workers, trace):
+    """
+    Extracts, scores and writes the filings in a fresh process, so its peak RSS only covers this run.
+
+    'stream' scores every filing as TenKExtractor.iter_filings yields it, 'collect' extracts all of them with
+    extract_filings first, as the scoring loop used to.
+    """
+    registry = ModelRegistry(device=-1)
+    registry.register(SENTIMENT_MODEL, StubSentimentPipeline())
+    registry.register(FINBERT_MODEL, StubSentimentPipeline())
+    registry.register(LM_DICTIONARY, make_lm_dictionary())
+    analyzer = SentimentAnalyzer(registry=registry)
+    session = mount_transport(create_session(pool_size=workers), REPLAY_TRANSPORT, stand_in_url=stand_in_url,
+                              pool_size=workers)
+    submissions = [{'accessionNumber': accession_number, 'primaryDocument': None, 'filingDate': '2020-01-01'}
+                   for _, accession_number in filings]
+    extractor = TenKExtractor(filings[0][0], '2020', '2020', max_workers=workers, fetch_mode='full')
+    results_path = tempfile.mkdtemp()
+    sink = ParquetResultSink(results_path, batch_rows=10)
+
+    def score(parsed_filings):
+        for accession_number, features in analyzer.analyze_filings(parsed_filings).items():
+            features.update({'cik_code': extractor.cik_code, 'year': 2020, 'accession': accession_number})
+            sink.append([features])
+
+    baseline_mb = peak_rss_mb()
+    if trace:
+        tracemalloc.start()
+    if mode == 'stream':
+        for submission, sections in extractor.iter_filings(submissions, session=session):
+            score({submission['accessionNumber']: sections})
+    else:
+        score(extractor.extract_filings(submissions, session=session))
+    sink.close()
+    traced_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2 if trace else None
+    shutil.rmtree(results_path)
+    return {'mode': mode, 'filings': len(filings), 'rows': sink.rows_written, 'baseline_mb': baseline_mb,
+            'peak_rss_mb': peak_rss_mb(), 'growth_mb': peak_rss_mb() - baseline_mb, 'traced_mb': traced_mb}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the peak memory of extracting and scoring a growing '
+                                                 'number of filings, streamed or collected')
+    parser.add_argument('--filings', default='5,10,20', help='comma separated numbers of filings')
+    parser.add_argument('--size-mb', type=float, default=1, help='size of the synthetic filings')
+    parser.add_argument('--modes', default='stream,collect', help='comma separated modes, stream and collect')
+    parser.add_argument('--workers', type=int, default=4, help='number of concurrent downloads')
+    parser.add_argument('--trace', action='store_true', help='also report the tracemalloc peak (much slower)')
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.filings.split(',')]
+    directory = tempfile.mkdtemp()
+    archive = make_archive(os.path.join(directory, 'archive.sqlite'), max(counts), args.size_mb)
+    filings = archived_filings(archive)
+    # Every measurement runs in a new process: the peak RSS of a process never goes down
+    context = multiprocessing.get_context('spawn')
+    try:
+        with EdgarStandIn(ResponseArchive(archive.path)) as stand_in, context.Pool(1, maxtasksperchild=1) as pool:
+            print(f"{'mode':>8}{'filings':>9}{'rows':>6}{'baseline MB':>13}{'peak MB':>10}{'growth MB':>11}"
+                  f"{'traced MB':>11}")
+            for mode in args.modes.split(','):
+                for count in counts:
+                    result = pool.apply(measure, (mode, filings[:count], stand_in.url, args.workers, args.trace))
+                    traced = f"{result['traced_mb']:>11.1f}" if args.trace else f"{'-':>11}"
+                    print(f"{result['mode']:>8}{result['filings']:>9}{result['rows']:>6}"
+                          f"{result['baseline_mb']:>13.1f}{result['peak_rss_mb']:>10.1f}{result['growth_mb']:>11.1f}"
+                          + traced)
+    finally:
+        archive.close()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
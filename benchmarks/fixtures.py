@@ -0,0 +1,125 @@
+import random
+
+# Vocabulary mixing Loughran-McDonald category words with common 10-K wording
+WORDS = ('the company revenue net income operating results fiscal year increase decrease compared prior period '
+         'risk factors may could adversely affect our business financial condition litigation claims lawsuit '
+         'uncertain uncertainty believe expect anticipate must shall required compliance regulation growth '
+         'decline loss losses impairment profit profitable strong improved weak volatility liquidity capital '
+         'resources cash flows debt credit facility covenant customers products services market competition '
+         'management discussion analysis controls procedures effective internal reporting material weakness '
+         'disclosure quantitative qualitative interest rate foreign currency exchange exposure').split()
+
+ITEMS = [('1', 'Business'), ('1A', 'Risk Factors'), ('1B', 'Unresolved Staff Comments'), ('2', 'Properties'),
+         ('3', 'Legal Proceedings'), ('5', 'Market for Registrant'), ('7', "Management's Discussion and Analysis"),
+         ('7A', 'Quantitative and Qualitative Disclosures About Market Risk'), ('8', 'Financial Statements'),
+         ('9A', 'Controls and Procedures'), ('10', 'Directors')]
+
+SPAN_STYLE = 'color:#000000;font-family:\'Times New Roman\',sans-serif;font-size:10pt;font-weight:400;line-height:120%'
+
+
+def make_sentence(rng, min_words=8, max_words=30):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    words[0] = words[0].capitalize()
+    return ' '.join(words) + '.'
+
+
+def make_paragraph(rng, sentences=6):
+    text = ' '.join(make_sentence(rng) for _ in range(rng.randint(2, sentences)))
+    # Inline XBRL filings wrap almost every run of text in styled spans and use &#160; for spacing
+    text = text.replace(' and ', ' &amp; ', 1).replace('. ', '.&#160; ', 1)
+    return f'<div style="margin-top:6pt;text-align:justify"><span style="{SPAN_STYLE}">{text}</span></div>\n'
+
+
+def make_table(rng, rows=8, columns=5):
+    cells = ''.join(
+        '<tr>' + ''.join(f'<td style="padding:2px 1pt;vertical-align:bottom"><span style="{SPAN_STYLE}">'
+                         f'{rng.randint(1, 99999):,}</span></td>' for _ in range(columns)) + '</tr>\n'
+        for _ in range(rows))
+    return f'<table style="border-collapse:collapse;width:100%">{cells}</table>\n'
+
+
+def make_ten_k_html(seed=0, target_bytes=4 * 1024 ** 2):
+    """
+    Generates a reproducible 10-K HTML document of roughly target_bytes, with a table of contents and the usual
+    item headings, styled spans, entities and tables.
+    """
+    rng = random.Random(seed)
+    parts = ['<html><head><title>10-K</title><style>p {margin:0}</style></head><body>\n']
+    # Table of contents: the first match of every heading, dropped by get_section_boundaries
+    for number, title in ITEMS:
+        parts.append(f'<p><a href="#item{number}">Item&#160;{number}.</a> {title}</p>\n')
+
+    body_size = target_bytes // len(ITEMS)
+    for number, title in ITEMS:
+        parts.append(f'<div id="item{number}"><span style="font-weight:700">Item {number}. {title}</span></div>\n')
+        size = 0
+        while size < body_size:
+            block = make_table(rng) if rng.random() < 0.15 else make_paragraph(rng)
+            parts.append(block)
+            size += len(block)
+    parts.append('</body></html>\n')
+    return ''.join(parts)
+
+
+def make_submission(seed=0, target_bytes=4 * 1024 ** 2, exhibits=5, exhibit_bytes=200 * 1024):
+    """
+    Wraps a generated 10-K document in a full EDGAR submission text with exhibits, as served as {accession}.txt.
+    """
+    rng = random.Random(seed)
+    documents = [f'<DOCUMENT>\n<TYPE>10-K\n<SEQUENCE>1\n<FILENAME>form10k.htm\n<TEXT>\n'
+                 f'{make_ten_k_html(seed, target_bytes)}</TEXT>\n</DOCUMENT>\n']
+    for i in range(exhibits):
+        body = ''.join(make_paragraph(rng) for _ in range(exhibit_bytes // 600))
+        documents.append(f'<DOCUMENT>\n<TYPE>EX-{10 + i}.1\n<SEQUENCE>{i + 2}\n<FILENAME>ex{i}.htm\n<TEXT>\n'
+                         f'<html><body>{body}</body></html>\n</TEXT>\n</DOCUMENT>\n')
+    header = '<SEC-DOCUMENT>0000000000-24-000001.txt : 20240101\n<SEC-HEADER>\n</SEC-HEADER>\n'
+    return header + ''.join(documents) + '</SEC-DOCUMENT>\n'
+
+
+def make_sections(seed=0, words_per_section=8000):
+    """
+    Generates the parsed sections of one filing, as returned by TenKExtractor.parse_sections.
+    """
+    rng = random.Random(seed)
+    sections = {}
+    for item in ('item1', 'item1a', 'item7', 'item7a', 'item9a'):
+        sentences = []
+        count = 0
+        while count < words_per_section:
+            sentence = make_sentence(rng)
+            sentences.append(sentence)
+            count += sentence.count(' ') + 1
+        sections[item] = '\n'.join(sentences)
+    return sections
+
+
+def make_lm_dictionary(seed=0, share=0.3):
+    """
+    Generates a Loughran-McDonald dictionary over the fixture vocabulary, in the format load_lm_dictionary returns
+    (lowercase words as index, lowercase binary category columns).
+    """
+    import pandas as pd
+    from text_analysis.model_registry import LM_SENTIMENT_COLUMNS
+
+    rng = random.Random(seed)
+    words = sorted(set(WORDS))
+    columns = [column.lower() for column in LM_SENTIMENT_COLUMNS]
+    flags = [[int(rng.random() < share) for _ in columns] for _ in words]
+    return pd.DataFrame(flags, index=pd.Index(words, name='word'), columns=columns)
+
+
+class StubSentimentPipeline:
+    """
+    A tiny deterministic stand-in for a transformers sentiment pipeline, so model-bound code paths can be timed
+    without downloading or running a model.
+    """
+
+    def __init__(self, label='positive'):
+        self.label = label
+        self.calls = 0
+
+    def __call__(self, texts, **kwargs):
+        self.calls += 1
+        single = isinstance(texts, str)
+        outputs = [{'label': self.label, 'score': (len(text) % 97) / 97} for text in ([texts] if single else texts)]
+        return outputs
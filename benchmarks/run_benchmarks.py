@@ -0,0 +1,174 @@
+"""
+Times the extractor and analyzer hot paths on a synthetic 10-K and compares them with a baseline run.
+
+Timings depend on the machine, so no baseline is committed: record one on the machine the comparison runs on,
+from the commit to compare against, then run the suite again on the change:
+
+    git checkout main
+    python -m benchmarks.run_benchmarks --output baseline.json
+    git checkout my-branch
+    python -m benchmarks.run_benchmarks --baseline baseline.json
+
+The second run exits with status 1 when a case is more than --threshold slower than in the baseline. The baseline
+should be recorded with the same --seed and --size-mb, as the cases are timed on a different document otherwise.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.fixtures import make_submission, make_lm_dictionary, StubSentimentPipeline
+from text_analysis.model_registry import ModelRegistry, SENTIMENT_MODEL, FINBERT_MODEL, LM_DICTIONARY
+from text_analysis.sentiment_analyzer import SentimentAnalyzer
+from text_analysis.ten_k_extractor import TenKExtractor
+
+
+def build_cases(seed=0, size_mb=4):
+    """
+    Builds the benchmark cases on a synthetic 10-K submission of roughly size_mb megabytes.
+
+    Returns:
+    -------
+    dict
+        Mapping of case name to (function, setup). setup runs before every repetition and is not timed.
+    """
+    extractor = TenKExtractor('0', '2020', '2020')
+    submission = make_submission(seed, int(size_mb * 1024 ** 2))
+    ten_k = extractor.clean_ten_k(submission)
+    sections = extractor.parse_sections(ten_k)
+    # The longest section, like Item 1A or Item 7 in real filings, dominates the analyzer's time
+    section_text = max(sections.values(), key=len)
+
+    # A stub model and a synthetic dictionary keep the suite offline and independent of model speed
+    registry = ModelRegistry(device=-1)
+    registry.register(SENTIMENT_MODEL, StubSentimentPipeline())
+    registry.register(FINBERT_MODEL, StubSentimentPipeline())
+    registry.register(LM_DICTIONARY, make_lm_dictionary(seed))
+    analyzer = SentimentAnalyzer(registry=registry)
+    chunk = analyzer.tokenize_section(section_text).chunks()[0]
+    chunk_text = ' '.join(chunk)
+
+    def clear_analyzer_caches():
+        analyzer._tokenized_sections.clear()
+
+    return {
+        'clean_ten_k': (lambda: extractor.clean_ten_k(submission), None),
+        'get_section_boundaries': (lambda: extractor.get_section_boundaries(ten_k), None),
+        'parse_sections': (lambda: extractor.parse_sections(ten_k), None),
+        'preprocess_text': (lambda: analyzer.preprocess_text(section_text), clear_analyzer_caches),
+        'analyze_loughran_mcdonald': (lambda: analyzer.analyze_loughran_mcdonald(section_text), None),
+        'extract_text_metrics': (lambda: analyzer.extract_text_metrics(chunk_text), None),
+        'process_chunk': (lambda: analyzer.process_chunk(chunk), None),
+    }
+
+
+def run_case(function, setup=None, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return {'min_s': min(timings), 'median_s': statistics.median(timings), 'repeat': repeat}
+
+
+def run_suite(cases, repeat=5, selected=None):
+    """
+    Times every case (or the selected ones) and returns the results with the environment they were measured in.
+    """
+    results = {}
+    for name, (function, setup) in cases.items():
+        if selected and name not in selected:
+            continue
+        # One untimed call warms caches that every real run would have warm (regexes, dictionaries)
+        function()
+        results[name] = run_case(function, setup, repeat)
+        print(f"{name:<28}{results[name]['min_s'] * 1000:>12.2f} ms{results[name]['median_s'] * 1000:>12.2f} ms")
+    return {'metadata': {'timestamp': datetime.now().isoformat(timespec='seconds'),
+                         'python': platform.python_version(), 'platform': platform.platform(),
+                         'processor': platform.processor()},
+            'results': results}
+
+
+def compare(results, baseline, threshold=0.2, thresholds=None):
+    """
+    Compares the minimum times with a baseline run.
+
+    Parameters:
+    ----------
+    results : dict
+        The results of run_suite.
+    baseline : dict
+        The results of an earlier run_suite, loaded from JSON.
+    threshold : float
+        Relative slowdown above which a case is a regression, e.g. 0.2 for 20%.
+    thresholds : dict
+        Per-case thresholds overriding threshold.
+
+    Returns:
+    -------
+    list
+        The names of the regressed cases.
+    """
+    thresholds = thresholds or {}
+    regressions = []
+    print(f"\n{'case':<28}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:<28}{'-':>14}{result['min_s'] * 1000:>14.2f}{'new':>10}")
+            continue
+        before = baseline['results'][name]['min_s']
+        change = result['min_s'] / before - 1
+        regressed = change > thresholds.get(name, threshold)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28}{before * 1000:>14.2f}{result['min_s'] * 1000:>14.2f}{change:>+10.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the extractor and analyzer hot paths on synthetic 10-Ks')
+    parser.add_argument('cases', nargs='*', help='cases to run, all when omitted')
+    parser.add_argument('--size-mb', type=float, default=4, help='size of the synthetic 10-K submission')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with, as written by --output')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown counted as a regression')
+    parser.add_argument('--case-threshold', action='append', default=[], metavar='CASE=THRESHOLD',
+                        help='threshold for one case, e.g. process_chunk=0.5')
+    args = parser.parse_args()
+
+    cases = build_cases(args.seed, args.size_mb)
+    unknown = set(args.cases) - set(cases)
+    if unknown:
+        parser.error(f"unknown cases {sorted(unknown)}, expected some of {sorted(cases)}")
+
+    print(f"{'case':<28}{'min':>15}{'median':>15}")
+    results = run_suite(cases, args.repeat, args.cases)
+    results['metadata'].update({'seed': args.seed, 'size_mb': args.size_mb})
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        for option in ('seed', 'size_mb'):
+            if baseline['metadata'].get(option) != results['metadata'][option]:
+                print(f"The baseline was recorded with {option} {baseline['metadata'].get(option)}, not "
+                      f"{results['metadata'][option]}, so the cases ran on a different document")
+        thresholds = {name: float(value) for name, value in (item.split('=') for item in args.case_threshold)}
+        regressions = compare(results, baseline, args.threshold, thresholds)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
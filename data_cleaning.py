@@ -1,6 +1,6 @@
 import pandas as pd
-from tqdm import tqdm
 
+from text_analysis.cik_resolver import CIKResolver
 from text_analysis.utils import timeit
 from text_analysis.sec_scraper import SECScraper
 from text_analysis.sentiment_analyzer import SentimentAnalyzer
@@ -22,24 +22,12 @@ def download_cik_codes():
     scraper = SECScraper()
     df_names = pd.read_csv(bc_names_path)
     df_data = pd.read_csv(bc_data_path)
-    company_names = df_names['NameCorp'].tolist()
-    cik_codes = []
-    for company in tqdm(company_names):
-        cik_code = scraper.lookup_company_name(company)
-        if cik_code == 'Perform another Company-CIK Lookup.':
-            cik_code = None
-        cik_codes.append(cik_code)
-    df_names['CIK_extracted'] = cik_codes
+    # Resolve the names of both files with the same resolver so the company list is loaded once
+    resolver = CIKResolver.from_file() if os.getenv("CIK_LOOKUP_PATH") else None
+    df_names['CIK_extracted'] = scraper.lookup_company_names(df_names['NameCorp'], resolver)
     df_names.to_csv(bc_names_path)
 
-    company_names = df_data['Ragione sociale'].tolist()
-    cik_codes = []
-    for company in tqdm(company_names):
-        cik_code = scraper.lookup_company_name(company)
-        if cik_code == 'Perform another Company-CIK Lookup.':
-            cik_code = None
-        cik_codes.append(cik_code)
-    df_data['CIK_extracted'] = cik_codes
+    df_data['CIK_extracted'] = scraper.lookup_company_names(df_data['Ragione sociale'], resolver)
     df_data.to_csv(bc_data_path)
 
     return df_names, df_data
@@ -3,6 +3,8 @@ import pandas as pd
 from typing import List
 from dotenv import load_dotenv
 
+from text_analysis.result_sink import open_result_dataset
+
 load_dotenv()
 
 
@@ -52,9 +54,42 @@ def merge_csv_files(folder_path: str, output_file: str) -> None:
         print("No CSV files found to merge")
 
 
+def merge_parquet_dataset(dataset_path: str, output_file: str, columns: List[str] = None) -> None:
+    """
+    Merge a result dataset written by ParquetResultSink into a single file.
+    The dataset is scanned lazily, so only the selected columns are read. Filings scored again after an
+    interrupted run are kept once.
+
+    Args:
+        dataset_path (str): Path to the dataset directory (partitioned by year)
+        output_file (str): Path where the merged file will be saved, as Parquet or CSV depending on the extension
+        columns (List[str]): Columns to keep, all when None
+    """
+    dataset = open_result_dataset(dataset_path)
+    merged_df = dataset.to_table(columns=columns).to_pandas()
+    if merged_df.empty:
+        print("No Parquet files found to merge")
+        return
+
+    print(f"Total rows: {len(merged_df)}")
+    # remove duplicates, keeping the latest score of each filing
+    keys = [column for column in ('cik_code', 'year', 'date') if column in merged_df.columns]
+    merged_df.drop_duplicates(subset=keys or None, keep='last', inplace=True)
+    if output_file.endswith('.csv'):
+        merged_df.to_csv(output_file, index=False)
+    else:
+        merged_df.to_parquet(output_file, index=False)
+    print(f"Successfully merged {len(dataset.files)} files into {output_file}")
+
+
 if __name__ == '__main__':
     # Example usage
     folder_path = f'{os.getenv("BASE_PATH")}/data/sentiment_results'
     output_file = f'{os.getenv("BASE_PATH")}/data/merged_sentiment_results.csv'
 
     merge_csv_files(folder_path, output_file)
+
+    # Results of extract_data_companies are Parquet datasets, one directory per input file
+    dataset_path = f'{folder_path}/transformed_companies'
+    if os.path.isdir(dataset_path):
+        merge_parquet_dataset(dataset_path, f'{os.getenv("BASE_PATH")}/data/merged_sentiment_results.parquet')
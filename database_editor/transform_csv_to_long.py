@@ -1,28 +1,212 @@
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ID_COLUMNS = ['CIK_extracted', 'Ragione sociale', 'Codice NACE Rev. 2, core code (4 cifre)',
+              'Codice di consolidamento', 'Ultimo anno disp.']
+YEAR_PATTERN = re.compile(r'\d{4}')
+
+
+def parse_header(columns: List[str], id_columns: List[str] = ID_COLUMNS) -> Tuple[List[int], List[str], np.ndarray]:
+    """
+    Parse the year/measure layout of the wide export from its header, once.
+    Every column other than the id columns is named after a measure and a year, e.g. 'Ricavi delle vendite 2020'.
+    Columns without a year are not part of the panel.
+
+    Args:
+        columns (List[str]): The header of the wide file
+        id_columns (List[str]): Columns identifying a company
+
+    Returns:
+        Tuple[List[int], List[str], np.ndarray]: The years, the measures, and a (years x measures) array with the
+        position of each column among the year columns, -1 where the export has no such column
+    """
+    layout: Dict[Tuple[int, str], int] = {}
+    year_columns = [column for column in columns if column not in id_columns and YEAR_PATTERN.search(column)]
+    skipped = [column for column in columns if column not in id_columns and not YEAR_PATTERN.search(column)]
+    if skipped:
+        logging.info(f"Columns without a year are left out of the panel: {skipped}")
+
+    for position, column in enumerate(year_columns):
+        year = int(YEAR_PATTERN.search(column).group())
+        measure = YEAR_PATTERN.sub('', column).strip()
+        # A measure repeated for the same year keeps its first column
+        layout.setdefault((year, measure), position)
+
+    years = sorted({year for year, _ in layout})
+    measures = list(dict.fromkeys(measure for _, measure in layout))
+    positions = np.full((len(years), len(measures)), -1, dtype=np.int64)
+    for (year, measure), position in layout.items():
+        positions[years.index(year), measures.index(measure)] = position
+    return years, measures, positions
+
+
+def reshape_chunk(chunk: pd.DataFrame, year_columns: List[str], years: List[int], measures: List[str],
+                  positions: np.ndarray, value_dtype: str = 'float64',
+                  coerced: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """
+    Reshape a chunk of the wide export into one row per company and year.
+    The year columns are stacked into a (companies x years x measures) array by indexing with the header layout, so
+    no long intermediate frame is built. Company-years without any value are dropped, as pivot_table does.
+    Cells that are not numbers (e.g. 'n.d.') become NaN, unlike the old melt/pivot which kept them as strings.
+
+    Args:
+        chunk (pd.DataFrame): Rows of the wide export
+        year_columns (List[str]): The year columns, in the order positions refers to
+        years (List[int]): The years of the layout
+        measures (List[str]): The measures of the layout
+        positions (np.ndarray): The layout returned by parse_header
+        value_dtype (str): Type the measures are stored as
+        coerced (Optional[Dict[str, int]]): When given, the number of non-numeric cells turned into NaN is added to
+            it for each year column
+
+    Returns:
+        pd.DataFrame: The id columns, the year and one column per measure
+    """
+    rows = len(chunk)
+    values = np.empty((rows, len(year_columns) + 1), dtype=value_dtype)
+    for i, column in enumerate(year_columns):
+        numbers = pd.to_numeric(chunk[column], errors='coerce')
+        if coerced is not None:
+            lost = int((numbers.isna() & chunk[column].notna()).sum())
+            if lost:
+                coerced[column] = coerced.get(column, 0) + lost
+        values[:, i] = numbers
+    # The extra last column is all NaN and fills the measures a year has no column for
+    values[:, -1] = np.nan
+    panel_values = values[:, positions].reshape(rows * len(years), len(measures))
+
+    keep = ~np.isnan(panel_values).all(axis=1)
+    panel = chunk[ID_COLUMNS].iloc[np.repeat(np.arange(rows), len(years))[keep]].reset_index(drop=True)
+    panel['year'] = np.tile(np.array(years, dtype=np.int16), rows)[keep]
+    measure_frame = pd.DataFrame(panel_values[keep], columns=measures)
+    return pd.concat([panel, measure_frame], axis=1)
+
+
+ID_DTYPES = {'Ragione sociale': 'string', 'Codice NACE Rev. 2, core code (4 cifre)': 'string',
+             'Codice di consolidamento': 'string', 'CIK_extracted': 'float64', 'Ultimo anno disp.': 'float64'}
+
+
+def prepare_ids(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop the rows with a missing id column, as pivot_table did, and type the CIK and the last available year.
+
+    Args:
+        frame (pd.DataFrame): Rows of the wide export, with at least the id columns
+
+    Returns:
+        pd.DataFrame: The rows with complete ids
+    """
+    frame = frame.dropna(subset=ID_COLUMNS).copy()
+    frame['CIK_extracted'] = frame['CIK_extracted'].astype('int64')
+    frame['Ultimo anno disp.'] = frame['Ultimo anno disp.'].astype('Int16')
+    return frame
+
+
+def transform_csv_to_long(input_file: str, output_file: str, chunksize: int = 20000, value_dtype: str = 'float64',
+                          sep: str = ',', decimal: str = '.', thousands: Optional[str] = None,
+                          na_values: Tuple[str, ...] = ('n.d.',), max_coerced_fraction: float = 0.5) -> int:
+    """
+    Transform the wide AIDA export (one column per measure and year) into a (CIK, year) panel.
+    The file is read in row chunks and every chunk is reshaped and written as a row group of a Parquet file, so
+    memory is bounded by the chunk size instead of the size of the export. The Parquet file is written under a
+    temporary name and renamed once complete.
+    As with the old melt/pivot_table, rows missing any id column are dropped, and rows of the same company (equal id
+    columns) are combined into one, keeping the first value of every cell. The id columns are read once first to
+    find those companies; only their rows are held until the end.
+    The measures are stored as numbers: cells that cannot be parsed as one are written as missing values and
+    counted per column in the log, whereas the old melt/pivot output kept them as strings. Exports with Italian
+    number formats need sep=';', decimal=',' and thousands='.', otherwise most cells would fail to parse, which
+    raises an error once more than max_coerced_fraction of the values are lost.
+
+    Args:
+        input_file (str): Path of the wide CSV export
+        output_file (str): Path of the Parquet panel
+        chunksize (int): Number of companies reshaped at a time
+        value_dtype (str): Type the measures are stored as, 'float32' halves the size of the panel at the cost of
+            precision above 7 significant digits
+        sep (str): Field separator of the export
+        decimal (str): Decimal separator of the numbers
+        thousands (Optional[str]): Thousands separator of the numbers, None when there is none
+        na_values (Tuple[str, ...]): Cells read as missing values rather than counted as unparseable ('n.d.' is
+            AIDA's "not available")
+        max_coerced_fraction (float): Fraction of the non-empty cells that may fail to parse before the transform
+            fails and no output is written
+
+    Returns:
+        int: The number of company-years written
+    """
+    read_options = {'sep': sep, 'decimal': decimal, 'thousands': thousands, 'na_values': list(na_values)}
+    columns = pd.read_csv(input_file, nrows=0, sep=sep).columns.tolist()
+    years, measures, positions = parse_header(columns)
+    year_columns = [column for column in columns if column not in ID_COLUMNS and YEAR_PATTERN.search(column)]
+    logging.info(f"Panel of {len(measures)} measures over {len(years)} years ({years[0]}-{years[-1]})")
 
-# Read the CSV file into a DataFrame
-df = pd.read_csv('../data/merged_data_original.csv')
+    ids = prepare_ids(pd.read_csv(input_file, usecols=ID_COLUMNS, dtype=ID_DTYPES, **read_options))[ID_COLUMNS]
+    duplicated_ids = pd.MultiIndex.from_frame(ids[ids.duplicated(ID_COLUMNS, keep=False)].drop_duplicates())
+    if len(duplicated_ids):
+        logging.info(f"{len(duplicated_ids)} companies have several rows, their rows are combined")
+    del ids
 
-# Drop rows with missing CIK codes
-df.dropna(subset=['CIK_extracted'], inplace=True)
+    schema = pa.schema([('CIK_extracted', pa.int64()), ('Ragione sociale', pa.string()),
+                        ('Codice NACE Rev. 2, core code (4 cifre)', pa.string()),
+                        ('Codice di consolidamento', pa.string()), ('Ultimo anno disp.', pa.int16()),
+                        ('year', pa.int16())] + [(measure, pa.from_numpy_dtype(np.dtype(value_dtype)))
+                                                 for measure in measures])
 
-# Melt the DataFrame to long format
-long_df = pd.melt(df, id_vars=['CIK_extracted', 'Ragione sociale', 'Codice NACE Rev. 2, core code (4 cifre)',
-                               'Codice di consolidamento', 'Ultimo anno disp.'], var_name='variable',
-                  value_name='value')
+    temporary_file = f'{output_file}.tmp'
+    rows_written = 0
+    cells = 0
+    coerced: Dict[str, int] = {}
+    duplicate_rows = []
 
-# Extract the year and type of data from the variable column
-long_df['year'] = long_df['variable'].str.extract(r'(\d{4})')
+    def write(frame: pd.DataFrame) -> int:
+        nonlocal cells
+        cells += int(frame[year_columns].notna().to_numpy().sum())
+        panel = reshape_chunk(frame, year_columns, years, measures, positions, value_dtype, coerced)
+        writer.write_table(pa.Table.from_pandas(panel, schema=schema, preserve_index=False))
+        return len(panel)
 
-long_df['data_type'] = long_df['variable'].str.replace(r'\d{4}', '', regex=True).str.strip()
+    try:
+        with pq.ParquetWriter(temporary_file, schema) as writer:
+            for chunk in pd.read_csv(input_file, usecols=ID_COLUMNS + year_columns, dtype=ID_DTYPES,
+                                     chunksize=chunksize, **read_options):
+                chunk = prepare_ids(chunk)
+                is_duplicate = pd.MultiIndex.from_frame(chunk[ID_COLUMNS]).isin(duplicated_ids)
+                if is_duplicate.any():
+                    duplicate_rows.append(chunk[is_duplicate])
+                    chunk = chunk[~is_duplicate]
+                if not chunk.empty:
+                    rows_written += write(chunk)
+            if duplicate_rows:
+                # 'first' takes the first non-missing value of each column, as pivot_table(aggfunc='first') did
+                combined = pd.concat(duplicate_rows).groupby(ID_COLUMNS, sort=False).first().reset_index()
+                rows_written += write(combined)
 
-# Drop the original variable column
-long_df.drop(columns=['variable'], inplace=True)
+        lost = sum(coerced.values())
+        if coerced:
+            logging.warning(f"{lost} non-numeric cells were written as missing values: {coerced}")
+        if cells and lost / cells > max_coerced_fraction:
+            raise ValueError(f"{lost} of {cells} values of {input_file} are not numbers, check the sep, decimal "
+                             f"and thousands separators of the export")
+        os.replace(temporary_file, output_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+    logging.info(f"Wrote {rows_written} company-years to {output_file}")
+    return rows_written
 
-# Pivot the DataFrame to have one column per variable type
-wide_df = long_df.pivot_table(
-    index=['CIK_extracted', 'Ragione sociale', 'Codice NACE Rev. 2, core code (4 cifre)', 'Codice di consolidamento',
-           'Ultimo anno disp.', 'year'], columns='data_type', values='value', aggfunc='first').reset_index()
 
-# Save the transformed DataFrame to a new CSV file
-wide_df.to_csv('../data/transformed_companies.csv', index=False)
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    transform_csv_to_long(f'{os.getenv("BASE_PATH")}/data/merged_data_original.csv',
+                          f'{os.getenv("BASE_PATH")}/data/transformed_companies.parquet')
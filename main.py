@@ -1,23 +1,38 @@
 import logging
+from functools import partial
 
 import pandas as pd
-from tqdm import tqdm
 
 from text_analysis.utils import timeit
-from text_analysis.sec_scraper import SECScraper
+from text_analysis.edgar_fetcher import ConcurrentFetcher
+from text_analysis.filing_cache import FilingCache
+from text_analysis.inference_cache import InferenceCache
+from text_analysis.model_registry import model_registry
+from text_analysis.pipeline import Pipeline, Stage
+from text_analysis.result_sink import ParquetResultSink
+from text_analysis.run_manifest import RunManifest
+from text_analysis.section_store import SectionStore
+from text_analysis.sec_scraper import SECScraper, get_shared_session
 from text_analysis.sentiment_analyzer import SentimentAnalyzer
+from text_analysis.sharded_scoring import ShardedRunner, merge_shard_results, shard_result_path, shard_result_paths
+from text_analysis.telemetry import telemetry
 from text_analysis.ten_k_extractor import TenKExtractor
 from dotenv import load_dotenv
 import os
-from datetime import datetime
 
 load_dotenv()
 
 
-def extract_data_companies(file_name: str, excluded_companies_file_names: str = None):
-    start_time = datetime.now()
+def extract_data_companies(file_name: str, excluded_companies_file_names: str = None, batch_size: int = 16,
+                           chunking: str = 'words', offline: bool = False, pipeline: bool = False,
+                           workers: int = 1, threads_per_worker: int = None, backend: str = None,
+                           inference_threads: int = None):
     merged_companies_path = f'{os.getenv("BASE_PATH")}/data/{file_name}'
-    df = pd.read_csv(merged_companies_path)
+    # The panel written by database_editor/transform_csv_to_long.py, or a CSV of the same columns
+    if file_name.endswith('.parquet'):
+        df = pd.read_parquet(merged_companies_path)
+    else:
+        df = pd.read_csv(merged_companies_path)
     # remove rows with missing CIK codes
     df = df[df['CIK_extracted'].notna()]
 
@@ -35,46 +50,361 @@ def extract_data_companies(file_name: str, excluded_companies_file_names: str =
     df.index = df.index.map(lambda x: (str(int(x[0])), x[1]))
     df = df[~df.index.duplicated(keep='first')]
 
-    codes_years = df.index.tolist()
-    cik_codes = [code[0] for code in codes_years]
+    # Companies excluded for a year (already analyzed) are skipped for that year
+    skipped = set(df.index[~df['run_analysis']])
+    # The index has one row per company and year, but every company is analyzed for every year
+    cik_codes = list(dict.fromkeys(code[0] for code in df.index))
     years = df.index.get_level_values('year').unique().tolist()
+    work_items = [(cik_code, year) for cik_code in cik_codes for year in years if (cik_code, year) not in skipped]
+    results_path = f'{os.getenv("BASE_PATH")}/data/sentiment_results/{os.path.splitext(file_name)[0]}'
 
-    chunks = [cik_codes[i:i + 200] for i in range(0, len(cik_codes), 200)]
-    for j, chunk in enumerate(chunks):
-        sentiment_results = []
-        df = []
-        for i, cik_code in enumerate(chunk):
-            cik_code = str(cik_code)
-            for year in years:
-                extractor = TenKExtractor(cik_code, str(year), str(year))
-                ten_k_filings = extractor.get_ten_k_filings()
-
-                for date, document in ten_k_filings.items():
-                    logging.info(
-                        f"Analyzing document for company {i + j * 200}/{len(cik_codes) + 1}: {cik_code} on date {date}")
-                    analyzer = SentimentAnalyzer()
-                    features = analyzer.analyze_sections(document)
-                    features['cik_code'] = cik_code
-                    features['year'] = year
-                    features['date'] = date
-                    sentiment_results.append(features)
-
-                if i % 5 == 0:
-                    results_df = pd.DataFrame(sentiment_results)
-                    # save file with starting minute
-                    results_df.to_csv(
-                        f'{os.getenv("BASE_PATH")}/data/sentiment_results/{file_name[:-4]}_{start_time.day}_'
-                        f'{start_time.hour}_{start_time.minute}_{j}.csv', index=False)
-
-        results_df = pd.DataFrame(sentiment_results)
-        results_df.to_csv(
-            f'{os.getenv("BASE_PATH")}/data/sentiment_results/{file_name[:-4]}_{start_time.day}_{start_time.hour}'
-            f'_{start_time.minute}_{j}.csv', index=False)
-
-        # Clear sentiment_results to free up memory
-        sentiment_results = []
-
-    return sentiment_results
+    if workers > 1:
+        # Every worker process scores its own shard into its own dataset, merged once all of them are done
+        runner = ShardedRunner(workers, threads_per_worker)
+        runner.run(score_shard, work_items, results_path=results_path, batch_size=batch_size, chunking=chunking,
+                   offline=offline, backend=backend)
+        # Shards left by a crashed run, possibly with another number of workers, hold filings the manifest already
+        # marks as scored, so every shard found is merged, not only those of this run
+        shard_paths = shard_result_paths(results_path)
+        merged_rows = merge_shard_results(shard_paths, results_path)
+        logging.info(f"Merged {merged_rows} results from {len(shard_paths)} shards into {results_path}")
+        return results_path
+
+    # Downloads are cached on disk so reruns can replay them, offline if requested
+    filing_cache = FilingCache()
+    try:
+        # Parsed sections are kept too, so filings parsed by an earlier run are not parsed again
+        section_store = SectionStore()
+        # Filings already scored by a previous run of the same file are skipped, failed ones are retried
+        manifest = RunManifest(f'{results_path}_manifest.sqlite')
+        # Results are appended to a Parquet dataset partitioned by year; filings are only marked as scored once written
+        sink = ParquetResultSink(results_path)
+
+        # Scores of chunks seen before (boilerplate, reruns) are reused instead of running the models again
+        inference_cache = InferenceCache()
+
+        # Load the models once and share them for every filing
+        model_registry.configure(backend, inference_threads)
+        model_registry.warm_up()
+        analyzer = SentimentAnalyzer(chunking=chunking, inference_cache=inference_cache)
+        logging.info(f"Model load report:\n{model_registry.report()}")
+
+        if pipeline:
+            filings = ((cik_code, year, submission) for cik_code, year in work_items
+                       for submission in filings_to_process(
+                           TenKExtractor(cik_code, str(year), str(year), cache=filing_cache, offline=offline),
+                           manifest))
+            score_filings_pipelined(filings, analyzer, manifest, sink, filing_cache=filing_cache, offline=offline,
+                                    batch_size=batch_size, section_store=section_store)
+        else:
+            score_filings_sequential(work_items, analyzer, manifest, sink, filing_cache=filing_cache,
+                                     offline=offline, batch_size=batch_size, section_store=section_store)
+
+        sink.close()
+        manifest.log_progress()
+        manifest.close()
+        logging.info(f"Filing cache: {filing_cache.stats()}")
+        logging.info(f"Section store: {section_store.stats()}")
+        section_store.close()
+        logging.info(f"Inference cache hit rates:\n{inference_cache.report()}")
+        inference_cache.close()
+        model_registry.release()
+        # Exports the counters and latencies when TELEMETRY_ENABLED is set
+        telemetry.flush()
+    finally:
+        filing_cache.close()
+    return results_path
+
+
+def score_filings_sequential(work_items, analyzer, manifest, sink, filing_cache=None, offline=False, batch_size=16,
+                             checkpoint_every=5, section_store=None, filings_per_batch=4, fetch_workers=4):
+    """
+    Fetches, parses and scores the filings of each company and year in turn.
+
+    Parameters:
+    ----------
+    work_items : list
+        (CIK code, year) tuples.
+    analyzer : SentimentAnalyzer
+        The analyzer scoring the filings.
+    manifest : RunManifest
+        The manifest recording the state of every filing.
+    sink : ParquetResultSink
+        The sink receiving the results.
+    filing_cache : FilingCache
+        Cache for the downloads, or None to always download.
+    offline : bool
+        Serve filings only from the cache.
+    batch_size : int
+        Number of chunks per forward pass.
+    checkpoint_every : int
+        Number of work items between writes of the results.
+    section_store : SectionStore
+        Store the parsed sections are read from and written to, or None.
+    filings_per_batch : int
+        Number of parsed filings scored together.
+    fetch_workers : int
+        Number of filings downloaded concurrently.
+    """
+    def score(cik_code, year, filings):
+        try:
+            filing_features = analyzer.analyze_filings(
+                {submission['accessionNumber']: sections for submission, sections in filings}, batch_size=batch_size)
+        except Exception as e:
+            logging.error(f"Failed to score filings of company {cik_code} in year {year}: {e}")
+            for submission, _ in filings:
+                manifest.mark(cik_code, submission['accessionNumber'], 'failed', repr(e))
+            return
+        for submission, _ in filings:
+            features = filing_features[submission['accessionNumber']]
+            features['cik_code'] = cik_code
+            features['year'] = year
+            features['date'] = submission['filingDate']
+            sink.append([features])
+            unsaved_filings.append((cik_code, submission['accessionNumber']))
+
+    unsaved_filings = []
+    # One fetcher serves every work item, so its threads and the process-wide session's connections are reused
+    with ConcurrentFetcher(max_workers=fetch_workers, cache=filing_cache, offline=offline,
+                           session=get_shared_session()) as fetcher:
+        for i, (cik_code, year) in enumerate(work_items):
+            extractor = TenKExtractor(cik_code, str(year), str(year), cache=filing_cache, offline=offline,
+                                      section_store=section_store, fetcher=fetcher)
+            submissions = filings_to_process(extractor, manifest)
+            if submissions:
+                logging.info(f"Analyzing {len(submissions)} documents for work item "
+                             f"{i + 1}/{len(work_items)}: {cik_code} in year {year}")
+                # Filings are scored as they are parsed, a few at a time to share batches, so only those few are
+                # held in memory however many filings the company made in the year
+                filings = []
+                for filing in extractor.iter_filings(submissions, on_state=partial(manifest.mark, cik_code)):
+                    filings.append(filing)
+                    if len(filings) == filings_per_batch:
+                        score(cik_code, year, filings)
+                        filings = []
+                if filings:
+                    score(cik_code, year, filings)
+
+            if i % checkpoint_every == 0 or i == len(work_items) - 1:
+                sink.flush()
+                manifest.mark_many(unsaved_filings, 'scored')
+                unsaved_filings = []
+                manifest.log_progress()
+
+
+def score_shard(shard_id, work_items, results_path, batch_size=16, chunking='words', offline=False, backend=None):
+    """
+    Scores one shard of the work items in a worker process of a ShardedRunner.
+
+    The shard loads its own models and writes its own result dataset; the run manifest is shared by all shards.
+
+    Returns:
+    -------
+    str
+        Path of the shard's result dataset.
+    """
+    shard_path = shard_result_path(results_path, shard_id)
+    filing_cache = FilingCache()
+    section_store = SectionStore()
+    manifest = RunManifest(f'{results_path}_manifest.sqlite')
+    sink = ParquetResultSink(shard_path)
+    inference_cache = InferenceCache()
+    # The worker's thread count was set by the ShardedRunner, the backend uses it
+    model_registry.configure(backend)
+    model_registry.warm_up()
+    analyzer = SentimentAnalyzer(chunking=chunking, inference_cache=inference_cache)
+
+    score_filings_sequential(work_items, analyzer, manifest, sink, filing_cache=filing_cache, offline=offline,
+                             batch_size=batch_size, section_store=section_store)
+
+    sink.close()
+    manifest.close()
+    filing_cache.close()
+    section_store.close()
+    logging.info(f"Inference cache hit rates of shard {shard_id}:\n{inference_cache.report()}")
+    inference_cache.close()
+    model_registry.release()
+    telemetry.flush()
+    return shard_path
+
+
+def filings_to_process(extractor, manifest):
+    """
+    Lists the filings of the extractor's company and year in the run manifest, the first time only, and returns
+    those not scored yet.
+
+    When the submissions cannot be fetched the work item is left unlisted, so a later run lists it again; online
+    failures count towards the manifest's max_attempts.
+    """
+    cik_code, year = extractor.cik_code, extractor.year_start
+    if not manifest.is_listed(cik_code, year):
+        if not manifest.can_list(cik_code, year):
+            return []
+        submissions = extractor.get_submissions()
+        if submissions is None:
+            logging.warning(f"Could not list the filings of company {cik_code} in year {year}")
+            # A cache miss offline is not a failure of the company, the next online run fetches it
+            if not extractor.offline:
+                manifest.mark_listing_failed(cik_code, year, 'submissions could not be fetched')
+            return []
+        manifest.add_filings(cik_code, year, submissions)
+    return manifest.filings_to_process(cik_code, year)
+
+
+def score_filings_pipelined(work_items, analyzer, manifest, sink, filing_cache=None, offline=False, batch_size=16,
+                            fetch_workers=8, parse_workers=2, filings_per_batch=4, checkpoint_every=20,
+                            section_store=None):
+    """
+    Fetches, parses and scores filings in concurrent stages connected by bounded queues, so the models keep scoring
+    while the next filings are downloaded and parsed.
+
+    Parameters:
+    ----------
+    work_items : iterable
+        (CIK code, year, submission) tuples, with the submissions as listed by the run manifest.
+    analyzer : SentimentAnalyzer
+        The analyzer scoring the filings.
+    manifest : RunManifest
+        The manifest recording the state of every filing.
+    sink : ParquetResultSink
+        The sink receiving the results.
+    filing_cache : FilingCache
+        Cache for the downloads, or None to always download.
+    offline : bool
+        Serve filings only from the cache.
+    batch_size : int
+        Number of chunks per forward pass.
+    fetch_workers : int
+        Number of filings downloaded concurrently.
+    parse_workers : int
+        Number of threads parsing sections.
+    filings_per_batch : int
+        Maximum number of parsed filings scored together, taken from those already waiting.
+    checkpoint_every : int
+        Number of scored filings between writes of the results.
+    section_store : SectionStore
+        Store the parsed sections are read from and written to, or None.
+    """
+    fetcher = ConcurrentFetcher(max_workers=fetch_workers, cache=filing_cache, offline=offline)
+
+    def fetch(item):
+        cik_code, year, submission = item
+        if section_store is not None:
+            sections = section_store.get_filing(cik_code, submission['filingDate'])
+            if sections:
+                # Parsed by an earlier run, the parse stage passes the sections on as they are
+                return cik_code, year, submission, sections
+        _, accession_number, ten_k_filing = fetcher.fetch_filing(cik_code, submission['accessionNumber'],
+                                                                 submission['primaryDocument'], fetch_mode='primary')
+        if ten_k_filing is None:
+            manifest.mark(cik_code, accession_number, 'failed', 'download failed')
+            return None
+        manifest.mark(cik_code, accession_number, 'fetched')
+        return cik_code, year, submission, ten_k_filing
+
+    def parse(item):
+        cik_code, year, submission, ten_k_filing = item
+        if isinstance(ten_k_filing, dict):
+            sections = ten_k_filing
+        else:
+            sections = TenKExtractor(cik_code, str(year), str(year)).parse_filing(ten_k_filing)
+            if section_store is not None:
+                section_store.put_filing(cik_code, submission['filingDate'], sections, submission['accessionNumber'])
+        manifest.mark(cik_code, submission['accessionNumber'], 'parsed')
+        return cik_code, year, submission, sections
+
+    def score(items):
+        filing_features = analyzer.analyze_filings(
+            {(cik_code, submission['accessionNumber']): sections for cik_code, _, submission, sections in items},
+            batch_size=batch_size)
+        results = []
+        for cik_code, year, submission, _ in items:
+            features = filing_features[(cik_code, submission['accessionNumber'])]
+            features['cik_code'] = cik_code
+            features['year'] = year
+            features['date'] = submission['filingDate']
+            results.append((cik_code, submission['accessionNumber'], features))
+        return results
+
+    def mark_failed(items, error):
+        for cik_code, _, submission, *_ in (items if isinstance(items, list) else [items]):
+            manifest.mark(cik_code, submission['accessionNumber'], 'failed', repr(error))
+
+    stages = Pipeline([
+        Stage('fetch', fetch, workers=fetch_workers, queue_size=2 * fetch_workers, on_error=mark_failed),
+        Stage('parse', parse, workers=parse_workers, queue_size=2 * filings_per_batch, on_error=mark_failed),
+        # Parsed filings waiting for the models are scored together to fill the batches
+        Stage('score', score, queue_size=2 * filings_per_batch, batch_size=filings_per_batch,
+              on_error=mark_failed),
+    ])
+    unsaved_filings = []
+    for cik_code, accession_number, features in stages.run(work_items):
+        sink.append([features])
+        unsaved_filings.append((cik_code, accession_number))
+        if len(unsaved_filings) >= checkpoint_every:
+            sink.flush()
+            manifest.mark_many(unsaved_filings, 'scored')
+            unsaved_filings = []
+            manifest.log_progress()
+    sink.flush()
+    manifest.mark_many(unsaved_filings, 'scored')
+    fetcher.close()
+
+
+def score_section_store(section_store, analyzer, sink, cik_codes=None, years=None, items=None, batch_size=16,
+                        filings_per_batch=8):
+    """
+    Scores the filings kept in a section store without downloading or parsing them again, e.g. with a new model or
+    a new Loughran-McDonald category.
+
+    Parameters:
+    ----------
+    section_store : SectionStore
+        The store the sections are read from.
+    analyzer : SentimentAnalyzer
+        The analyzer scoring the filings.
+    sink : ParquetResultSink
+        The sink receiving the results.
+    cik_codes : list
+        Only score the filings of these companies.
+    years : list
+        Only score filings made in these years.
+    items : list
+        Only score these sections.
+    batch_size : int
+        Number of chunks per forward pass.
+    filings_per_batch : int
+        Number of filings scored together.
+
+    Returns:
+    -------
+    int
+        The number of filings scored.
+    """
+    def score(filings):
+        filing_features = analyzer.analyze_filings({(cik_code, filing_date): sections
+                                                    for cik_code, filing_date, sections in filings},
+                                                   batch_size=batch_size)
+        for (cik_code, filing_date), features in filing_features.items():
+            features['cik_code'] = cik_code
+            features['year'] = int(filing_date[:4])
+            features['date'] = filing_date
+            sink.append([features])
+        sink.flush()
+
+    scored = 0
+    filings = []
+    for filing in section_store.iter_filings(cik_codes, years, items):
+        filings.append(filing)
+        if len(filings) == filings_per_batch:
+            score(filings)
+            scored += len(filings)
+            filings = []
+    if filings:
+        score(filings)
+        scored += len(filings)
+    logging.info(f"Scored {scored} stored filings")
+    return scored
 
 
 def download_cik_codes():
@@ -85,15 +415,7 @@ def download_cik_codes():
     data_path = f'{os.getenv("BASE_PATH")}/data/merged_data.csv'
     scraper = SECScraper()
     df_data = pd.read_csv(data_path)
-
-    company_names = df_data['Ragione sociale'].tolist()
-    cik_codes = []
-    for company in tqdm(company_names):
-        cik_code = scraper.lookup_company_name(company)
-        if cik_code == 'Perform another Company-CIK Lookup.':
-            cik_code = None
-        cik_codes.append(cik_code)
-    df_data['CIK_extracted'] = cik_codes
+    df_data['CIK_extracted'] = scraper.lookup_company_names(df_data['Ragione sociale'])
     df_data.to_csv(data_path)
 
     return df_data
@@ -104,10 +426,10 @@ def main():
     date_range = ('2020', '2020')
     extractor = TenKExtractor(cik_code, date_range[0], date_range[1])
     ten_k_filings = extractor.get_ten_k_filings()
+    analyzer = SentimentAnalyzer()
 
     for date, document in ten_k_filings.items():
         logging.info(f"Analyzing document for company {cik_code} on date {date}")
-        analyzer = SentimentAnalyzer()
         features = analyzer.analyze_sections(document)
         logging.info(f"Analysis complete for company {cik_code} on date {date}")
 
@@ -116,4 +438,4 @@ def main():
 
 
 if __name__ == '__main__':
-    extract_data_companies('transformed_companies.csv', 'already_analyzed.csv')
+    extract_data_companies('transformed_companies.parquet', 'already_analyzed.csv')
@@ -0,0 +1,69 @@
+import pytest
+
+from text_analysis.document_stream import TenKDocumentParser, extract_ten_k_document
+from text_analysis.ten_k_extractor import TenKExtractor
+
+
+def make_submission(ten_k_body='<html><body><p>Item 1. Business</p><p>We sell things.</p></body></html>'):
+    return ('<SEC-DOCUMENT>0000320193-20-000096.txt : 20201030\n<SEC-HEADER>header</SEC-HEADER>\n'
+            '<DOCUMENT>\n<TYPE>10-K/A\n<SEQUENCE>1\n<TEXT>amended</TEXT>\n</DOCUMENT>\n'
+            f'<DOCUMENT>\n<TYPE>10-K\n<SEQUENCE>2\n<FILENAME>aapl-20200926.htm\n<TEXT>\n{ten_k_body}\n</TEXT>\n'
+            '</DOCUMENT>\n'
+            '<DOCUMENT>\n<TYPE>EX-21.1\n<SEQUENCE>3\n<TEXT>subsidiaries</TEXT>\n</DOCUMENT>\n</SEC-DOCUMENT>\n')
+
+
+def clean_ten_k(raw_document):
+    return TenKExtractor('320193', '2020', '2020').clean_ten_k(raw_document).get('10-K')
+
+
+def feed_in_pieces(raw_document, cuts):
+    parser = TenKDocumentParser()
+    previous = 0
+    for cut in list(cuts) + [len(raw_document)]:
+        if parser.feed(raw_document[previous:cut]):
+            break
+        previous = cut
+    return parser
+
+
+def test_whole_submission_matches_clean_ten_k():
+    raw_document = make_submission()
+
+    assert extract_ten_k_document(raw_document) == clean_ten_k(raw_document)
+
+
+def test_type_line_split_across_reads():
+    raw_document = make_submission()
+    type_start = raw_document.index('<TYPE>10-K\n')
+
+    # Every cut from just before the <TYPE> tag of the 10-K to after the newline ending its type
+    for cut in range(type_start - 1, type_start + len('<TYPE>10-K\n') + 1):
+        parser = feed_in_pieces(raw_document, [cut])
+        assert parser.document == clean_ten_k(raw_document), cut
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64])
+def test_fixed_size_reads_match_clean_ten_k(size):
+    raw_document = make_submission()
+
+    parser = feed_in_pieces(raw_document, range(size, len(raw_document), size))
+
+    assert parser.document == clean_ten_k(raw_document)
+
+
+def test_stops_at_the_end_of_the_ten_k():
+    raw_document = make_submission()
+    ten_k_end = raw_document.index('</DOCUMENT>', raw_document.index('<TYPE>10-K\n')) + len('</DOCUMENT>')
+
+    parser = TenKDocumentParser()
+
+    assert parser.feed(raw_document[:ten_k_end])
+    assert parser.feed('anything after the 10-K is ignored')
+    assert parser.bytes_read == ten_k_end
+
+
+def test_submission_without_ten_k():
+    raw_document = make_submission().replace('<TYPE>10-K\n', '<TYPE>10-Q\n')
+
+    assert extract_ten_k_document(raw_document) is None
+    assert clean_ten_k(raw_document) is None
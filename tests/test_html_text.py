@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.fixtures import make_ten_k_html
+from text_analysis.html_text import HTMLText
+
+BeautifulSoup = pytest.importorskip('bs4').BeautifulSoup
+pytest.importorskip('lxml')
+
+DOCUMENTS = [
+    '<html><body><p>a</p>\n  <p>b</p></body></html>',
+    '<html><body><div>a</div>   <div>b</div><div>\t</div><div>c</div></body></html>',
+    '<html><body><p>a</p><p>  b  c </p>\n</body></html>\n',
+    '<html><body><table>\n<tr>\n  <td>1,234</td>\n  <td>&#160;</td>\n</tr>\n</table></body></html>',
+    '<html><body><p>Item&#160;7.</p>&#32;&#32;<p>x &amp; y</p>&nbsp;<p>a < b</p></body></html>',
+    '<html><body><p>a</p>\n<!-- note -->\n<script>var x;</script>\n<p>b</p></body></html>',
+    '<html><body><pre>a\n  <b>x</b>\n  </pre>\n  <p>b</p></body></html>',
+]
+
+
+@pytest.mark.parametrize('raw', DOCUMENTS)
+def test_text_matches_beautifulsoup(raw):
+    assert HTMLText(raw).text == BeautifulSoup(raw, 'lxml').get_text("\n")
+
+
+def test_ten_k_text_matches_beautifulsoup():
+    raw = make_ten_k_html(seed=0, target_bytes=200 * 1024)
+
+    assert HTMLText(raw).text == BeautifulSoup(raw, 'lxml').get_text("\n")
+
+
+def test_slices_follow_the_collapsed_text():
+    raw = '<html><body><p>a</p>\n    <p>Item 7. b</p>\n    <p>c</p></body></html>'
+    html_text = HTMLText(raw)
+
+    assert html_text.slice(raw.index('Item 7.')) == 'Item 7. b\n\n\nc'
+    assert html_text.slice(raw.index('<p>c'), raw.index('</body>')) == 'c'
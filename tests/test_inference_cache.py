@@ -0,0 +1,45 @@
+from text_analysis.inference_cache import InferenceCache
+
+
+def count_queries(cache):
+    statements = []
+    cache._connection.set_trace_callback(statements.append)
+    return lambda: sum('COUNT(*)' in statement for statement in statements)
+
+
+def test_puts_below_the_limit_do_not_count_the_table(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache.sqlite'), max_entries=1000)
+    queries = count_queries(cache)
+
+    for i in range(30):
+        cache.put_many('model', 'rev', {f'{i}-{j}': 0.5 for j in range(10)})
+    # A chunk stored again is not a new entry
+    cache.put_many('model', 'rev', {'0-0': 0.5})
+
+    assert queries() == 0
+    assert cache._count == 300
+
+
+def test_eviction_keeps_the_most_recent_scores(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache.sqlite'), max_entries=100)
+
+    for i in range(30):
+        cache.put_many('model', 'rev', {f'{i}-{j}': i for j in range(10)})
+
+    assert cache._count == cache._connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0] <= 100
+    assert cache.get_many('model', 'rev', ['29-0', '0-0']) == {'29-0': 29.0}
+
+
+def test_entries_of_other_processes_are_counted(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = InferenceCache(path, max_entries=100)
+    cache.recount_every = 2
+    other = InferenceCache(path, max_entries=100)
+    other.put_many('model', 'rev', {f'other-{j}': 0.5 for j in range(100)})
+
+    # The running count of this process only includes its own entries until the table is counted again
+    cache.put_many('model', 'rev', {'first': 0.5})
+    assert cache._count == 1
+    cache.put_many('model', 'rev', {'second': 0.5})
+
+    assert cache._count == InferenceCache(path)._count <= 100
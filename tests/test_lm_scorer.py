@@ -0,0 +1,58 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from text_analysis.lm_scorer import LM_CATEGORIES, LMScorer, score_loughran_mcdonald
+
+
+@pytest.fixture
+def lm_dict():
+    # Binary categories with lowercase index and columns, as load_lm_dictionary returns them
+    words = ['profit', 'loss', 'may', 'lawsuit', 'must', 'always', 'could', 'growth', 'decline', 'risk']
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.integers(0, 2, (len(words), len(LM_CATEGORIES))), index=words, columns=LM_CATEGORIES)
+
+
+def per_chunk_counts(tokens, lm_dict):
+    """
+    The counting loop analyze_loughran_mcdonald ran on every chunk before LMScorer.
+    """
+    scores = dict.fromkeys(LM_CATEGORIES, 0)
+    for word, count in Counter(tokens).items():
+        word = word.lower()
+        if word in lm_dict.index:
+            for key in scores:
+                scores[key] += lm_dict.at[word, key] * count
+    return {key: float(value) for key, value in scores.items()}
+
+
+def test_sparse_counts_match_per_chunk_counts(lm_dict):
+    rng = np.random.default_rng(1)
+    vocabulary = list(lm_dict.index) + ['revenue', 'the', 'Profit', 'RISK', 'company']
+    chunks = [list(rng.choice(vocabulary, size)) for size in (0, 1, 7, 512, 300)]
+
+    scores = LMScorer(lm_dict).score_batch(chunks)
+
+    assert scores.shape == (len(chunks), len(LM_CATEGORIES))
+    for chunk, row in zip(chunks, scores):
+        assert LMScorer.to_dict(row) == per_chunk_counts(chunk, lm_dict)
+
+
+def test_duplicate_and_nan_words_are_ignored(lm_dict):
+    # pandas reads words such as 'null' as NaN, and a word listed twice keeps its first row
+    extra = pd.DataFrame([[1] * len(LM_CATEGORIES), [0] * len(LM_CATEGORIES)], index=[np.nan, 'profit'],
+                         columns=LM_CATEGORIES)
+    scorer = LMScorer(pd.concat([lm_dict, extra]))
+
+    assert scorer.score_tokens(['profit', 'nan']) == per_chunk_counts(['profit'], lm_dict)
+
+
+def test_score_loughran_mcdonald_keeps_the_index(lm_dict):
+    chunks = [['profit', 'risk'], ['loss']]
+
+    frame = score_loughran_mcdonald(chunks, lm_dict, index=['a', 'b'])
+
+    assert list(frame.index) == ['a', 'b']
+    assert frame.loc['b'].to_dict() == per_chunk_counts(['loss'], lm_dict)
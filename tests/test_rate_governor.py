@@ -0,0 +1,167 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+from retrying import RetryError
+
+from text_analysis import rate_governor
+from text_analysis.rate_governor import (RateGovernor, RejectedError, ThrottledError, governed_request,
+                                         parse_retry_after)
+from text_analysis.sec_scraper import SECScraper
+
+
+@pytest.fixture
+def governor(tmp_path):
+    return RateGovernor(max_rate=10.0, min_rate=0.5, increase=0.5, decrease_factor=0.5,
+                        path=str(tmp_path / 'governor.state'))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Records the sleeps of the governor and of the retries instead of waiting.
+    """
+    recorded = []
+    monkeypatch.setattr(rate_governor.time, 'sleep', recorded.append)
+    return recorded
+
+
+def test_throttling_halves_the_rate_once_per_cooldown(governor):
+    governor.throttled()
+    assert governor.rate == 5.0
+
+    # A second throttled response right after the first comes from a request sent at the old rate
+    governor.throttled()
+    assert governor.rate == 5.0
+
+
+def test_rate_never_drops_below_min_rate(governor, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_governor.time, 'time', lambda: now[0])
+    for _ in range(10):
+        governor.throttled()
+        now[0] += 2
+
+    assert governor.rate == 0.5
+
+
+def test_successes_raise_the_rate_up_to_max_rate(governor, monkeypatch):
+    monkeypatch.setattr(rate_governor.time, 'time', lambda: 1000.0)
+    governor.throttled()
+    rate = governor.rate
+
+    governor.succeeded()
+    assert governor.rate == pytest.approx(rate + 0.5 / rate)
+
+    for _ in range(1000):
+        governor.succeeded()
+    assert governor.rate == 10.0
+
+
+def test_state_is_shared_through_the_file(governor):
+    other = RateGovernor(max_rate=10.0, path=governor.path)
+
+    governor.throttled()
+
+    assert other.rate == 5.0
+
+
+def test_retry_after_blocks_the_next_slot(governor, sleeps):
+    governor.throttled(retry_after=30)
+
+    governor.acquire()
+
+    assert sleeps and sleeps[-1] == pytest.approx(30, abs=1)
+
+
+def test_slots_are_spaced_by_the_rate(governor, sleeps, monkeypatch):
+    monkeypatch.setattr(rate_governor.time, 'time', lambda: 1000.0)
+    for _ in range(3):
+        governor.acquire()
+
+    assert sleeps == pytest.approx([0.1, 0.2])
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(None, default=5) == 5
+    assert parse_retry_after('soon', default=5) == 5
+    assert parse_retry_after(formatdate(time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
+
+
+def test_governed_request_retries_throttled_and_failed_requests(governor, sleeps):
+    responses = [ThrottledError(429, retry_after=1), requests.ConnectionError('reset'), 'ok']
+
+    @governed_request(governor, max_attempts=4, base_delay=0)
+    def fetch():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert fetch() == 'ok'
+    assert responses == []
+    assert governor.rate < 10.0
+
+
+def test_governed_request_gives_up_after_max_attempts(governor, sleeps):
+    calls = []
+
+    @governed_request(governor, max_attempts=3, base_delay=0)
+    def fetch():
+        calls.append(1)
+        raise requests.ConnectionError('reset')
+
+    with pytest.raises(RetryError):
+        fetch()
+    assert len(calls) == 3
+
+
+def test_governed_request_does_not_retry_rejections(governor, sleeps):
+    calls = []
+
+    @governed_request(governor, max_attempts=4, base_delay=0)
+    def fetch():
+        calls.append(1)
+        raise RejectedError(404)
+
+    with pytest.raises(RetryError, match='rejected'):
+        fetch()
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('status_code, headers, error', [
+    (429, {'Retry-After': '7'}, ThrottledError),
+    (503, {}, ThrottledError),
+    (404, {}, RejectedError),
+    (403, {}, RejectedError),
+    (500, {}, RetryError),
+])
+def test_responses_are_classified_for_the_governor(status_code, headers, error):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+
+    with pytest.raises(error) as raised:
+        SECScraper._check_response(response, '320193')
+    if 'Retry-After' in headers:
+        assert raised.value.retry_after == 7.0
+
+
+def test_governed_request_uses_the_governor_of_the_instance(governor, sleeps, tmp_path):
+    class Client:
+        def __init__(self, governor):
+            self.governor = governor
+
+        @governed_request(lambda client: client.governor, max_attempts=2, base_delay=0)
+        def fetch(self):
+            raise ThrottledError(429)
+
+    other = RateGovernor(max_rate=10.0, path=str(tmp_path / 'other.state'))
+
+    with pytest.raises(RetryError):
+        Client(governor).fetch()
+    assert governor.rate == 5.0
+    assert other.rate == 10.0
+    assert SECScraper(governor=governor).governor is governor
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from textstat import textstat
+
+from text_analysis.readability import ReadabilityEngine, SyllableTable, flesch_reading_ease_from_totals
+
+WORDS = ['company', 'revenue', 'increased', 'significantly', 'during', 'fiscal', 'year', 'operating', 'expenses',
+         'litigation', 'uncertainty', 'a', 'risk', 'management', 'believes', 'extraordinary', 'items', 'tax']
+
+
+class Section:
+    """
+    The part of TokenizedSection the engine reads, so the tests do not need the NLTK stop words.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+@pytest.fixture
+def section():
+    rng = np.random.default_rng(0)
+    return Section(list(rng.choice(WORDS, 1300)))
+
+
+def test_chunk_scores_match_textstat(section):
+    engine = ReadabilityEngine(SyllableTable())
+
+    scores = engine.chunk_scores(section, max_length=512)
+
+    chunks = [' '.join(section.tokens[start:start + 512]) for start in range(0, len(section), 512)]
+    assert list(scores) == [textstat.flesch_reading_ease(chunk) for chunk in chunks]
+
+
+def test_section_score_matches_textstat(section):
+    engine = ReadabilityEngine(SyllableTable())
+
+    # Every chunk counts as one sentence, so the section reads like its chunks ended by periods
+    chunks = [' '.join(section.tokens[start:start + 512]) for start in range(0, len(section), 512)]
+    assert engine.section_score(section) == textstat.flesch_reading_ease('. '.join(chunks) + '.')
+
+
+def test_short_and_empty_sections():
+    engine = ReadabilityEngine(SyllableTable())
+
+    assert list(engine.chunk_scores(Section(['risk']))) == [textstat.flesch_reading_ease('risk')]
+    assert len(engine.chunk_scores(Section([]))) == 0
+    assert flesch_reading_ease_from_totals(0, 0, 0) == 0.0
+
+
+def test_syllable_table_round_trip(tmp_path, section):
+    path = str(tmp_path / 'syllables.csv')
+    table = SyllableTable(path=path)
+    ReadabilityEngine(table).chunk_scores(section)
+    table.save()
+
+    loaded = SyllableTable(path=path)
+
+    assert loaded.syllables == table.syllables
+    assert all(loaded.syllables[word] == textstat.syllable_count(word) for word in WORDS)
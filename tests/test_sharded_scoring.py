@@ -0,0 +1,64 @@
+import os
+
+from text_analysis.result_sink import ParquetResultSink, read_results
+from text_analysis.sharded_scoring import (RESULT_KEY_COLUMNS, merge_shard_results, shard_result_path,
+                                           shard_result_paths, split_work)
+
+
+def write_shard(results_path, shard_id, rows):
+    sink = ParquetResultSink(shard_result_path(results_path, shard_id), batch_rows=2)
+    sink.append(rows)
+    sink.close()
+
+
+def result(cik_code, year, score):
+    return {'cik_code': cik_code, 'year': year, 'date': f'{year}-03-01', 'score': score}
+
+
+def test_merge_includes_shards_of_an_earlier_run(tmp_path):
+    results_path = str(tmp_path / 'results')
+    # shard-003 was left by a crashed run with four workers, this run has two
+    write_shard(results_path, 3, [result('3', 2020, 0.3), result('7', 2021, 0.7)])
+    write_shard(results_path, 0, [result('2', 2020, 0.2), result('4', 2020, 0.4), result('4', 2021, 0.5)])
+    write_shard(results_path, 1, [result('1', 2021, 0.1)])
+
+    shard_paths = shard_result_paths(results_path)
+    merged_rows = merge_shard_results(shard_paths, results_path)
+
+    merged = read_results(results_path).sort_values(RESULT_KEY_COLUMNS, ignore_index=True)
+    assert merged_rows == 6
+    assert list(zip(merged['cik_code'], merged['year'])) == [('1', 2021), ('2', 2020), ('3', 2020), ('4', 2020),
+                                                            ('4', 2021), ('7', 2021)]
+    assert not any(os.path.exists(path) for path in shard_paths)
+
+
+def test_merge_into_existing_results_and_again(tmp_path):
+    results_path = str(tmp_path / 'results')
+    sink = ParquetResultSink(results_path)
+    sink.append([result('9', 2019, 0.9)])
+    sink.close()
+    write_shard(results_path, 0, [result('2', 2020, 0.2)])
+
+    assert merge_shard_results(shard_result_paths(results_path), results_path) == 1
+    # Nothing is left to merge, so a second merge adds no duplicates
+    assert merge_shard_results(shard_result_paths(results_path), results_path) == 0
+    assert sorted(read_results(results_path)['cik_code']) == ['2', '9']
+
+
+def test_merge_keeping_the_shards_does_not_duplicate(tmp_path):
+    results_path = str(tmp_path / 'results')
+    write_shard(results_path, 0, [result('2', 2020, 0.2), result('4', 2021, 0.4)])
+
+    for _ in range(2):
+        merge_shard_results(shard_result_paths(results_path), results_path, remove_shards=False)
+
+    assert len(read_results(results_path)) == 2
+    assert shard_result_paths(results_path) == [shard_result_path(results_path, 0)]
+
+
+def test_split_work_keeps_companies_together():
+    work_items = [('10', 2020), ('11', 2020), ('10', 2021), ('12', 2021)]
+
+    shards = split_work(work_items, 2)
+
+    assert shards == [[('10', 2020), ('10', 2021), ('12', 2021)], [('11', 2020)]]
@@ -0,0 +1,61 @@
+import re
+
+import pytest
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+from text_analysis.tokenized_section import TokenizedSection
+
+try:
+    stopwords.words('english')
+    word_tokenize('Data. Loaded')
+except LookupError:
+    pytest.skip("The NLTK stopwords and punkt_tab data are not installed", allow_module_level=True)
+
+TEXT = ("ITEM 7. Management's Discussion and Analysis of Financial Condition.\n\n  Net sales increased 6% to "
+        "$274.5 billion during 2020, compared to 2019; the increase was driven by iPhone, Mac and Services. "
+        "Risks include: litigation, (uncertain) economic conditions & foreign-exchange rates!\t") * 40
+
+
+def preprocess_text(text):
+    """
+    SentimentAnalyzer.preprocess_text before the sections were tokenized once.
+    """
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s]', '', text)
+    text = text.lower()
+    stop_words = set(stopwords.words('english'))
+    return ' '.join(word for word in word_tokenize(text) if word not in stop_words)
+
+
+def split_chunks(preprocessed_text, max_length=512):
+    tokens = word_tokenize(preprocessed_text)
+    return [tokens[i:i + max_length] for i in range(0, len(tokens), max_length)]
+
+
+@pytest.mark.parametrize('max_length', [512, 100])
+def test_chunks_match_the_old_path(max_length):
+    section = TokenizedSection(TEXT)
+    preprocessed = preprocess_text(TEXT)
+
+    assert section.text == preprocessed
+    assert section.chunks(max_length) == split_chunks(preprocessed, max_length)
+    assert section.chunk_texts(max_length) == [' '.join(chunk) for chunk in split_chunks(preprocessed, max_length)]
+
+
+def test_word_stats_match_the_chunk_texts():
+    section = TokenizedSection(TEXT)
+
+    word_counts, avg_word_lengths = section.chunk_word_stats(100)
+
+    for chunk_text, word_count, avg_word_length in zip(section.chunk_texts(100), word_counts, avg_word_lengths):
+        assert word_count == len(chunk_text.split())
+        assert avg_word_length == pytest.approx(len(chunk_text) / len(chunk_text.split()))
+
+
+def test_empty_section():
+    section = TokenizedSection('  the and of  ')
+
+    assert len(section) == 0
+    assert section.chunks() == []
+    assert section.chunk_texts() == []
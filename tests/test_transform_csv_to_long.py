@@ -0,0 +1,149 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from database_editor.transform_csv_to_long import ID_COLUMNS, parse_header, transform_csv_to_long
+
+MEASURES = ['Ricavi delle vendite migl EUR', 'Totale attivo migl EUR', 'Dipendenti']
+YEARS = range(2018, 2024)
+
+
+@pytest.fixture
+def wide_file(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 200
+    wide = pd.DataFrame({'Ragione sociale': [f'Company {i}' for i in range(rows)],
+                         'CIK_extracted': np.where(rng.random(rows) < 0.1, np.nan, rng.integers(1000, 2000000, rows)),
+                         'Codice NACE Rev. 2, core code (4 cifre)': rng.integers(1000, 9999, rows),
+                         'Codice di consolidamento': rng.choice(['C1', 'U1', 'C2'], rows),
+                         'Ultimo anno disp.': rng.integers(2018, 2024, rows),
+                         'Note': 'not part of the panel'})
+    for measure in MEASURES:
+        for year in YEARS:
+            values = rng.normal(1e5, 1e4, rows).round(1)
+            values[rng.random(rows) < 0.3] = np.nan
+            wide[f'{measure} {year}'] = values
+    # A company without any value, and a measure the export lacks for one year
+    wide.loc[5, [column for column in wide if column[-4:].isdigit()]] = np.nan
+    wide = wide.drop(columns=['Dipendenti 2019'])
+    path = tmp_path / 'wide.csv'
+    wide.to_csv(path, index=False)
+    return path
+
+
+def melt_and_pivot(input_file):
+    """
+    The reshape transform_csv_to_long replaced.
+    """
+    wide = pd.read_csv(input_file).drop(columns=['Note'])
+    wide = wide.dropna(subset=['CIK_extracted'])
+    long = pd.melt(wide, id_vars=ID_COLUMNS, var_name='variable', value_name='value')
+    long['year'] = long['variable'].str.extract(r'(\d{4})')
+    long['data_type'] = long['variable'].str.replace(r'\d{4}', '', regex=True).str.strip()
+    long = long.drop(columns=['variable'])
+    return long.pivot_table(index=ID_COLUMNS + ['year'], columns='data_type', values='value',
+                            aggfunc='first').reset_index()
+
+
+def sort_panel(panel):
+    panel = panel.assign(year=panel['year'].astype(int), CIK_extracted=panel['CIK_extracted'].astype('int64'))
+    return panel.sort_values(['CIK_extracted', 'Ragione sociale', 'year']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('chunksize', [7, 1000])
+def test_panel_matches_melt_and_pivot(wide_file, tmp_path, chunksize):
+    output_file = tmp_path / 'panel.parquet'
+
+    rows = transform_csv_to_long(str(wide_file), str(output_file), chunksize=chunksize)
+
+    panel = sort_panel(pd.read_parquet(output_file))
+    expected = sort_panel(melt_and_pivot(wide_file))
+    assert rows == len(panel) == len(expected)
+    assert (panel['Ragione sociale'] == expected['Ragione sociale']).all()
+    assert (panel['year'] == expected['year']).all()
+    np.testing.assert_array_equal(panel[MEASURES].to_numpy(), expected[MEASURES].to_numpy())
+
+
+def test_header_layout_marks_missing_columns():
+    columns = ID_COLUMNS + ['Ricavi 2020', 'Utile 2020', 'Ricavi 2021', 'Note']
+
+    years, measures, positions = parse_header(columns)
+
+    assert years == [2020, 2021]
+    assert measures == ['Ricavi', 'Utile']
+    assert positions.tolist() == [[0, 1], [2, -1]]
+
+
+def test_duplicate_companies_and_missing_ids_match_melt_and_pivot(wide_file, tmp_path):
+    wide = pd.read_csv(wide_file)
+    measure_columns = [column for column in wide if column[-4:].isdigit()]
+    # A company listed twice, the first row missing values the second has, the second row far down the file
+    duplicate = wide.iloc[[10]].copy()
+    wide.loc[10, measure_columns[:6]] = np.nan
+    duplicate[measure_columns[6:]] = np.nan
+    # Rows with a missing id column are dropped
+    wide.loc[20, 'Codice di consolidamento'] = np.nan
+    wide.loc[21, 'Ultimo anno disp.'] = np.nan
+    wide = pd.concat([wide, wide.iloc[[30]], duplicate], ignore_index=True)
+    input_file = tmp_path / 'duplicates.csv'
+    wide.to_csv(input_file, index=False)
+    output_file = tmp_path / 'panel.parquet'
+
+    rows = transform_csv_to_long(str(input_file), str(output_file), chunksize=7)
+
+    panel = sort_panel(pd.read_parquet(output_file))
+    expected = sort_panel(melt_and_pivot(input_file))
+    assert rows == len(panel) == len(expected)
+    assert not panel.duplicated(['CIK_extracted', 'Ragione sociale', 'year']).any()
+    assert (panel['Ragione sociale'] == expected['Ragione sociale']).all()
+    np.testing.assert_array_equal(panel[MEASURES].to_numpy(), expected[MEASURES].to_numpy())
+
+
+def italian(value):
+    """
+    A number as AIDA writes it, e.g. 1.234.567,8.
+    """
+    return '' if np.isnan(value) else f'{value:,.1f}'.translate(str.maketrans(',.', '.,'))
+
+
+def test_italian_number_format(wide_file, tmp_path):
+    wide = pd.read_csv(wide_file)
+    wide['CIK_extracted'] = wide['CIK_extracted'].astype('Int64')
+    measure_columns = [column for column in wide if column[-4:].isdigit()]
+    # Large enough for thousands separators
+    wide[measure_columns] = wide[measure_columns] * 100
+    italian_wide = wide.copy()
+    for column in measure_columns:
+        italian_wide[column] = wide[column].map(italian)
+    input_file = tmp_path / 'italian.csv'
+    italian_wide.to_csv(input_file, index=False, sep=';')
+    output_file = tmp_path / 'panel.parquet'
+
+    with pytest.raises(ValueError, match='separators'):
+        transform_csv_to_long(str(input_file), str(output_file), sep=';')
+    assert not output_file.exists() and not (tmp_path / 'panel.parquet.tmp').exists()
+
+    transform_csv_to_long(str(input_file), str(output_file), sep=';', decimal=',', thousands='.')
+    expected_file = tmp_path / 'expected.parquet'
+    wide.to_csv(tmp_path / 'plain.csv', index=False)
+    transform_csv_to_long(str(tmp_path / 'plain.csv'), str(expected_file))
+    pd.testing.assert_frame_equal(pd.read_parquet(output_file), pd.read_parquet(expected_file))
+
+
+def test_non_numeric_cells_are_counted(tmp_path, caplog):
+    wide = pd.DataFrame({'CIK_extracted': [1, 2], 'Ragione sociale': ['a', 'b'],
+                         'Codice NACE Rev. 2, core code (4 cifre)': ['1', '2'],
+                         'Codice di consolidamento': ['C1', 'C2'], 'Ultimo anno disp.': [2020, 2020],
+                         'Ricavi 2020': ['1.5', 'n.d.'], 'Utile 2020': ['n.s.', '2'], 'Costi 2020': ['3', '4']})
+    wide.to_csv(tmp_path / 'wide.csv', index=False)
+
+    with caplog.at_level(logging.WARNING):
+        transform_csv_to_long(str(tmp_path / 'wide.csv'), str(tmp_path / 'panel.parquet'))
+
+    panel = pd.read_parquet(tmp_path / 'panel.parquet')
+    assert panel['Ricavi'].tolist()[0] == 1.5
+    assert panel['Utile'].tolist() == [None, 2.0] or panel['Utile'].isna().tolist() == [True, False]
+    # 'n.d.' is AIDA's missing value, only the other text is counted
+    assert "{'Utile 2020': 1}" in caplog.text
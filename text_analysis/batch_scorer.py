@@ -0,0 +1,147 @@
+import logging
+import time
+from collections import namedtuple, Counter
+
+from text_analysis.inference_cache import chunk_digest, model_identity
+from text_analysis.telemetry import telemetry
+
+ChunkKey = namedtuple('ChunkKey', ['filing', 'section', 'chunk'])
+
+
+class BatchScorer:
+    """
+    A class to score text chunks from many sections and filings with padded, length-grouped batches.
+
+    Attributes:
+    ----------
+    pipelines : dict
+        Mapping of score name (e.g. 'finbert_score') to a transformers text-classification pipeline.
+    batch_size : int
+        Number of chunks sent to a pipeline in one forward pass.
+    max_length : int
+        Maximum number of subword tokens per chunk; longer chunks are truncated by the tokenizer.
+    cache : InferenceCache
+        Persistent cache of scores checked before running the models, or None.
+    """
+
+    def __init__(self, pipelines, batch_size=16, max_length=512, cache=None):
+        """
+        Constructs all the necessary attributes for the BatchScorer object.
+
+        Parameters:
+        ----------
+        pipelines : dict
+            Mapping of score name to pipeline.
+        batch_size : int
+            Number of chunks per forward pass.
+        max_length : int
+            Maximum number of subword tokens per chunk.
+        cache : InferenceCache
+            Persistent cache of scores checked before running the models, or None.
+        """
+        self.pipelines = pipelines
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache = cache
+        self.pending = []
+
+    def add(self, key, text, score_name=None):
+        """
+        Queues a chunk for scoring.
+
+        Parameters:
+        ----------
+        key : ChunkKey
+            The (filing, section, chunk) the text belongs to.
+        text : str
+            The chunk text.
+        score_name : str
+            Only score the chunk with this pipeline. By default every pipeline scores it.
+        """
+        self.pending.append((key, text, score_name))
+
+    def batches(self, score_name, items=None):
+        """
+        Groups the chunks queued for a pipeline into batches of similar length so padding is kept to a minimum.
+
+        Parameters:
+        ----------
+        score_name : str
+            The pipeline the batches are meant for.
+        items : list
+            The (key, text) tuples to batch. Defaults to every chunk queued for the pipeline.
+
+        Returns:
+        -------
+        list
+            A list of batches, each a list of (key, text) tuples.
+        """
+        if items is None:
+            items = self.queued(score_name)
+        ordered = sorted(items, key=lambda item: len(item[1]), reverse=True)
+        return [ordered[i:i + self.batch_size] for i in range(0, len(ordered), self.batch_size)]
+
+    def queued(self, score_name):
+        return [(key, text) for key, text, name in self.pending if name is None or name == score_name]
+
+    def _cached_scores(self, score_name, pipe, items, scores):
+        # Fills the scores found in the cache and returns the items still to score with their digests
+        model_id, revision = model_identity(pipe)
+        digests = [chunk_digest(text) for _, text in items]
+        cached = self.cache.get_many(model_id, revision, digests)
+        hits, misses = Counter(), Counter()
+        remaining = []
+        for (key, text), digest in zip(items, digests):
+            if digest in cached:
+                scores[key][score_name] = cached[digest]
+                hits[key.section] += 1
+            else:
+                remaining.append((key, text, digest))
+                misses[key.section] += 1
+        for section in hits.keys() | misses.keys():
+            self.cache.record(section, hits[section], misses[section])
+        return remaining
+
+    def score(self):
+        """
+        Runs every pipeline over the queued chunks and clears the queue.
+
+        Returns:
+        -------
+        dict
+            Mapping of ChunkKey to a dictionary of scores, one entry per pipeline.
+        """
+        scores = {key: {} for key, _, _ in self.pending}
+        num_batches = 0
+        start_time = time.time()
+        num_scored = 0
+        for score_name, pipe in self.pipelines.items():
+            items = self.queued(score_name)
+            duplicates = []
+            if self.cache is not None:
+                remaining = self._cached_scores(score_name, pipe, items, scores)
+                # Chunks repeated within the call (e.g. boilerplate of several filings) are scored once
+                first_keys = {}
+                for key, _, digest in remaining:
+                    first_keys.setdefault(digest, key)
+                items = [(key, text) for key, text, digest in remaining if first_keys[digest] == key]
+                duplicates = [(key, first_keys[digest]) for key, _, digest in remaining if first_keys[digest] != key]
+            batches = self.batches(score_name, items)
+            num_batches += len(batches)
+            num_scored += len(items)
+            for batch in batches:
+                texts = [text for _, text in batch]
+                with telemetry.span('model_inference', model=score_name, chunks=len(texts)):
+                    outputs = pipe(texts, batch_size=len(texts), truncation=True, max_length=self.max_length)
+                telemetry.count('model_chunks_total', len(texts), model=score_name)
+                for (key, _), output in zip(batch, outputs):
+                    scores[key][score_name] = output['score']
+            if self.cache is not None:
+                for key, first_key in duplicates:
+                    scores[key][score_name] = scores[first_key][score_name]
+                self.cache.put_many(*model_identity(pipe), {digest: scores[key][score_name]
+                                                            for digest, key in first_keys.items()})
+        logging.info(f"Scored {num_scored} chunk inputs for {len(self.pending)} chunks in {num_batches} batches of up "
+                     f"to {self.batch_size} in {time.time() - start_time:.2f} seconds")
+        self.pending = []
+        return scores
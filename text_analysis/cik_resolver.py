@@ -0,0 +1,201 @@
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from scipy.sparse import csr_matrix
+
+load_dotenv()
+cik_lookup_path = os.getenv("CIK_LOOKUP_PATH")
+
+# Endings such as /DE/, (THE), US MARKET AGGREGATE or anything after a comma or a dot are not part of the name
+COMPANY_SUFFIX_PATTERN = re.compile(r'(.+?)(\([^\)]*\)|/[A-Z]{2,3}/?|(US MARKET AGGREGATE)|(THE)|,|\.)')
+
+
+def strip_company_suffix(company_name):
+    """
+    Removes state suffixes like /DE/ and other endings from a company name, as expected by EDGAR's cik_lookup.
+    """
+    match = COMPANY_SUFFIX_PATTERN.match(company_name)
+    if match:
+        company_name = match.group(1)
+    return company_name
+
+
+def normalize_company_name(company_name):
+    """
+    Strips the suffixes of a company name, converts it to uppercase and collapses whitespace.
+    """
+    return ' '.join(strip_company_suffix(str(company_name)).upper().split())
+
+
+def name_ngrams(name, n=3):
+    padded = f' {name} '
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+
+class CIKResolver:
+    """
+    A class to resolve company names to CIK codes from EDGAR's bulk company-name/CIK list (cik-lookup-data.txt).
+
+    Names are matched exactly on their normalized form first. The remaining names are matched by cosine similarity of
+    character trigram TF-IDF vectors, computed with one sparse matrix product per batch.
+
+    Attributes:
+    ----------
+    names : np.ndarray
+        Normalized company names, one entry per distinct name.
+    ciks : np.ndarray
+        CIK codes without leading zeros, aligned with names.
+    """
+
+    def __init__(self, names, ciks, max_df=0.01):
+        """
+        Constructs all the necessary attributes for the CIKResolver object.
+
+        Parameters:
+        ----------
+        names : list
+            Company names as listed by EDGAR.
+        ciks : list
+            CIK codes aligned with names.
+        max_df : float
+            Trigrams found in more than this share of the names (e.g. 'INC') are ignored for fuzzy matching.
+        """
+        companies = pd.DataFrame({'name': [normalize_company_name(name) for name in names],
+                                  'cik': [str(cik).lstrip('0') for cik in ciks]})
+        # EDGAR lists several spellings per company; like cik_lookup, the first listed match wins
+        companies = companies[companies['name'] != ''].drop_duplicates(subset=['name'], keep='first')
+        self.names = companies['name'].to_numpy()
+        self.ciks = companies['cik'].to_numpy()
+        self.index = dict(zip(self.names, self.ciks))
+        self._build_ngram_matrix(max_df)
+
+    @classmethod
+    def from_file(cls, path=None, **kwargs):
+        """
+        Builds the resolver from a local copy of https://www.sec.gov/Archives/edgar/cik-lookup-data.txt.
+
+        Parameters:
+        ----------
+        path : str
+            Path of the file, lines formatted NAME:CIK:. Defaults to CIK_LOOKUP_PATH.
+        """
+        names, ciks = [], []
+        with open(path or cik_lookup_path, encoding='latin-1') as file:
+            for line in file:
+                # Names may contain colons themselves, the CIK is always the second to last field
+                parts = line.rstrip('\n').rsplit(':', 2)
+                if len(parts) == 3 and parts[1].isdigit():
+                    names.append(parts[0])
+                    ciks.append(parts[1])
+        logging.info(f"Loaded {len(names)} company names from {path or cik_lookup_path}")
+        return cls(names, ciks, **kwargs)
+
+    def _build_ngram_matrix(self, max_df):
+        vocabulary = {}
+        rows, cols = [], []
+        for i, name in enumerate(self.names):
+            for ngram in set(name_ngrams(name)):
+                cols.append(vocabulary.setdefault(ngram, len(vocabulary)))
+                rows.append(i)
+        counts = csr_matrix((np.ones(len(cols), dtype=np.float32), (rows, cols)),
+                            shape=(len(self.names), len(vocabulary)))
+
+        document_frequency = np.bincount(cols, minlength=len(vocabulary))
+        idf = np.log((1 + len(self.names)) / (1 + document_frequency)).astype(np.float32) + 1
+        # Very common trigrams match almost every name and would make the similarity product dense
+        idf[document_frequency > max(1, max_df * len(self.names))] = 0
+
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.ngram_matrix = self._normalize_rows(counts.multiply(idf).tocsr())
+
+    @staticmethod
+    def _normalize_rows(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return csr_matrix(matrix.multiply(1 / norms[:, None]))
+
+    def _vectorize(self, names):
+        rows, cols = [], []
+        for i, name in enumerate(names):
+            for ngram in set(name_ngrams(name)):
+                if ngram in self.vocabulary:
+                    cols.append(self.vocabulary[ngram])
+                    rows.append(i)
+        counts = csr_matrix((np.ones(len(cols), dtype=np.float32), (rows, cols)),
+                            shape=(len(names), len(self.vocabulary)))
+        return self._normalize_rows(counts.multiply(self.idf).tocsr())
+
+    def best_matches(self, names, batch_size=1000):
+        """
+        Finds the most similar indexed name for each of the given normalized names.
+
+        Returns:
+        -------
+        tuple
+            Index of the best match in self.names and its cosine similarity, one entry per name.
+        """
+        best = np.zeros(len(names), dtype=np.int64)
+        similarity = np.zeros(len(names), dtype=np.float32)
+        for start in range(0, len(names), batch_size):
+            scores = (self._vectorize(names[start:start + batch_size]) @ self.ngram_matrix.T).tocsr()
+            for row in range(scores.shape[0]):
+                row_start, row_end = scores.indptr[row], scores.indptr[row + 1]
+                if row_start == row_end:
+                    continue
+                position = row_start + np.argmax(scores.data[row_start:row_end])
+                best[start + row] = scores.indices[position]
+                similarity[start + row] = scores.data[position]
+        return best, similarity
+
+    def candidates(self, company_name, top_n=5):
+        """
+        Returns the top_n most similar indexed companies as (name, cik, similarity) tuples.
+        """
+        scores = (self._vectorize([normalize_company_name(company_name)]) @ self.ngram_matrix.T).toarray().ravel()
+        top = np.argsort(scores)[::-1][:top_n]
+        return [(self.names[i], self.ciks[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def resolve(self, company_name, fuzzy=True, min_similarity=0.75):
+        """
+        Resolves one company name to a CIK code, or None when nothing matches.
+        """
+        return self.resolve_series(pd.Series([company_name]), fuzzy=fuzzy, min_similarity=min_similarity).iloc[0]
+
+    def resolve_series(self, company_names, fuzzy=True, min_similarity=0.75):
+        """
+        Resolves a whole column of company names at once.
+
+        Parameters:
+        ----------
+        company_names : pd.Series
+            The company names.
+        fuzzy : bool
+            Match names without an exact normalized match by trigram similarity.
+        min_similarity : float
+            Minimum cosine similarity of a fuzzy match.
+
+        Returns:
+        -------
+        pd.Series
+            CIK codes without leading zeros (None when unresolved), aligned with company_names.
+        """
+        # Names repeat across files, so each distinct name is resolved once
+        unique_names = pd.Series(company_names.dropna().unique())
+        normalized = unique_names.map(normalize_company_name)
+        resolved = normalized.map(self.index)
+
+        missing = resolved.isna().to_numpy()
+        if fuzzy and missing.any():
+            best, similarity = self.best_matches(normalized[missing].tolist())
+            matches = np.where(similarity >= min_similarity, self.ciks[best], None)
+            resolved[missing] = matches
+
+        logging.info(f"Resolved {resolved.notna().sum()} of {len(unique_names)} distinct company names "
+                     f"({(~missing).sum()} exact)")
+        cik_codes = company_names.map(dict(zip(unique_names, resolved)))
+        return cik_codes.astype(object).where(cik_codes.notna(), None)
@@ -0,0 +1,87 @@
+DOCUMENT_START = '<DOCUMENT>'
+DOCUMENT_END = '</DOCUMENT>'
+TYPE_TAG = '<TYPE>'
+
+
+class TenKDocumentParser:
+    """
+    An incremental parser that extracts the 10-K document from a full EDGAR submission fed in pieces.
+
+    Only the document being read is buffered; exhibits are discarded as soon as their type is known, and parsing
+    stops at the </DOCUMENT> closing the 10-K, so callers can stop reading the response there.
+
+    Attributes:
+    ----------
+    document_type : str
+        The <TYPE> of the document to extract.
+    document : str
+        The content between <DOCUMENT> and </DOCUMENT> of the 10-K once found, None before.
+    bytes_read : int
+        Number of characters fed to the parser.
+    """
+
+    def __init__(self, document_type='10-K'):
+        self.document_type = document_type
+        self.document = None
+        self.bytes_read = 0
+        self._buffer = ''
+        self._in_document = False
+        self._is_target = None
+
+    @property
+    def done(self):
+        return self.document is not None
+
+    def feed(self, chunk):
+        """
+        Parses the next piece of the submission.
+
+        Returns:
+        -------
+        bool
+            True once the 10-K document is complete and the rest of the submission can be skipped.
+        """
+        if self.done:
+            return True
+        self.bytes_read += len(chunk)
+        self._buffer += chunk
+
+        while True:
+            if not self._in_document:
+                start = self._buffer.find(DOCUMENT_START)
+                if start < 0:
+                    # Keep just enough to recognise a tag split across two pieces
+                    self._buffer = self._buffer[-len(DOCUMENT_START):]
+                    return False
+                self._buffer = self._buffer[start + len(DOCUMENT_START):]
+                self._in_document = True
+                self._is_target = None
+
+            if self._is_target is None:
+                type_start = self._buffer.find(TYPE_TAG)
+                type_end = self._buffer.find('\n', type_start) if type_start >= 0 else -1
+                if type_end < 0:
+                    return False
+                self._is_target = self._buffer[type_start + len(TYPE_TAG):type_end] == self.document_type
+
+            end = self._buffer.find(DOCUMENT_END)
+            if end < 0:
+                if not self._is_target:
+                    self._buffer = self._buffer[-len(DOCUMENT_END):]
+                return False
+
+            if self._is_target:
+                self.document = self._buffer[:end]
+                self._buffer = ''
+                return True
+            self._buffer = self._buffer[end + len(DOCUMENT_END):]
+            self._in_document = False
+
+
+def extract_ten_k_document(raw_document, document_type='10-K'):
+    """
+    Extracts the 10-K document from a complete submission text, or returns None when it has none.
+    """
+    parser = TenKDocumentParser(document_type)
+    parser.feed(raw_document)
+    return parser.document
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from text_analysis.sec_scraper import SECScraper, create_session
+from text_analysis.telemetry import telemetry
+
+
+class ConcurrentFetcher:
+    """
+    A class to download many EDGAR filings concurrently through one pooled session.
+
+    The worker threads are started on first use and kept until close(), so one fetcher can serve every work item of
+    a run. Every request still draws from the host-wide sec_rate_governor (or the governor given), so the workers
+    together stay under the SEC limit of 10 requests per second while round-trip latency is overlapped.
+
+    Attributes:
+    ----------
+    max_workers : int
+        Number of downloads in flight at the same time.
+    cache : FilingCache
+        Cache for the downloads, or None to always download.
+    offline : bool
+        Serve filings only from the cache.
+    """
+
+    def __init__(self, max_workers=8, cache=None, offline=False, session=None, governor=None):
+        """
+        Constructs all the necessary attributes for the ConcurrentFetcher object.
+
+        Parameters:
+        ----------
+        max_workers : int
+            Number of downloads in flight at the same time.
+        cache : FilingCache
+            Cache for the downloads, or None to always download.
+        offline : bool
+            Serve filings only from the cache.
+        session : requests.Session
+            Session shared by the workers. Defaults to a new session pooling max_workers connections, closed by
+            close().
+        governor : RateGovernor
+            Governor the requests draw from. Defaults to the host-wide sec_rate_governor.
+        """
+        self.max_workers = max_workers
+        self.cache = cache
+        self.offline = offline
+        self.governor = governor
+        self._owns_session = session is None
+        self.session = session or create_session(pool_size=max_workers)
+        self._local = threading.local()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _pool(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='edgar-fetch')
+            return self._executor
+
+    def close(self):
+        """
+        Stops the worker threads, and closes the session if the fetcher created it; a session passed in is left to
+        its owner.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _scraper(self):
+        # SECScraper keeps per-request state, so each worker thread gets its own one on the shared session
+        if not hasattr(self._local, 'scraper'):
+            self._local.scraper = SECScraper(cache=self.cache, offline=self.offline, session=self.session,
+                                             governor=self.governor)
+        return self._local.scraper
+
+    def fetch_filing(self, cik_code, accession_number, primary_document=None, fetch_mode='full'):
+        """
+        Downloads one filing on the calling thread, returning (CIK code, accession number, text or None).
+        """
+        with telemetry.span('fetch_filing', kind=fetch_mode, cik=cik_code, accession=accession_number) as span:
+            if fetch_mode == 'primary':
+                document = self._scraper().download_10k_document(cik_code, accession_number, primary_document)
+            else:
+                document = self._scraper().download_10k(cik_code, accession_number)
+            span.set(status='ok' if document is not None else 'failed')
+        return cik_code, accession_number, document
+
+    @staticmethod
+    def _results(done):
+        # Futures are dropped as their results are handed out, so a document is freed as soon as its consumer is
+        # done with it instead of staying referenced until the next downloads complete
+        while done:
+            yield done.pop().result()
+
+    def fetch_filings(self, filings, fetch_mode='full'):
+        """
+        Downloads the given filings and yields them as they finish.
+
+        Parameters:
+        ----------
+        filings : iterable
+            (CIK code, accession number) pairs, or (CIK code, accession number, primary document) triples.
+        fetch_mode : str
+            'full' downloads the complete submission text, 'primary' only the 10-K document (see
+            SECScraper.download_10k_document).
+
+        Yields:
+        ------
+        tuple
+            (CIK code, accession number, text). The text is None when the download failed.
+        """
+        start_time = time.time()
+        count = 0
+        executor = self._pool()
+        # Keep a bounded window of submitted downloads so long work lists do not pile up in memory
+        in_flight = set()
+        try:
+            for filing in filings:
+                in_flight.add(executor.submit(self.fetch_filing, *filing, fetch_mode=fetch_mode))
+                if len(in_flight) < 2 * self.max_workers:
+                    continue
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                count += len(done)
+                yield from self._results(done)
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                count += len(done)
+                yield from self._results(done)
+        finally:
+            # A consumer that stops early leaves no queued downloads behind on the shared threads
+            for future in in_flight:
+                future.cancel()
+
+        elapsed = time.time() - start_time
+        logging.info(f"Fetched {count} filings in {elapsed:.2f} seconds "
+                     f"({count / elapsed if elapsed > 0 else 0:.2f} filings per second)")
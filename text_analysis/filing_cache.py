@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class FilingCache:
+    """
+    A persistent, compressed, content-addressed cache for EDGAR downloads.
+
+    Entries are keyed by CIK, accession number (or any other document id) and kind. The content itself is stored
+    once per SHA-256 digest as a gzip blob, and an SQLite index keeps the key to digest mapping, sizes and access
+    times for LRU eviction.
+
+    Attributes:
+    ----------
+    cache_dir : str
+        Directory holding the index and the blobs.
+    max_bytes : int
+        Size cap of the compressed blobs; least recently used entries are evicted beyond it.
+    hits : int
+        Number of lookups served from the cache.
+    misses : int
+        Number of lookups not found in the cache.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Constructs all the necessary attributes for the FilingCache object.
+
+        Parameters:
+        ----------
+        cache_dir : str
+            Directory of the cache. Defaults to FILING_CACHE_DIR, or BASE_PATH/data/filing_cache.
+        max_bytes : int
+            Size cap in bytes. Defaults to FILING_CACHE_MAX_BYTES, or 20 GB.
+        """
+        self.cache_dir = cache_dir or os.getenv("FILING_CACHE_DIR") or f'{os.getenv("BASE_PATH")}/data/filing_cache'
+        self.max_bytes = max_bytes or int(os.getenv("FILING_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(self.cache_dir, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        # The worker processes of a sharded run share the index, so writers wait for each other's transactions
+        self._connection = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), timeout=60,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, '
+                                     'digest TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, '
+                                     'last_access REAL NOT NULL)')
+
+    @staticmethod
+    def make_key(cik_code, document_id, kind='full'):
+        return f'{int(cik_code)}/{document_id}/{kind}'
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, 'blobs', digest[:2], f'{digest}.gz')
+
+    def get(self, cik_code, document_id, kind='full', max_age=None):
+        """
+        Returns the cached content, or None when it is missing or older than max_age.
+
+        Parameters:
+        ----------
+        cik_code : str
+            The CIK code of the company.
+        document_id : str
+            The accession number, or another id such as 'submissions'.
+        kind : str
+            The kind of download, e.g. 'full' for the complete submission text.
+        max_age : float
+            Maximum age of the entry in seconds. None accepts entries of any age.
+
+        Returns:
+        -------
+        str
+            The cached content.
+        """
+        key = self.make_key(cik_code, document_id, kind)
+        with self._lock:
+            row = self._connection.execute('SELECT digest, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and (max_age is None or time.time() - row[1] <= max_age):
+                try:
+                    with gzip.open(self._blob_path(row[0]), 'rt', encoding='utf-8') as blob:
+                        content = blob.read()
+                except FileNotFoundError:
+                    logging.warning(f"Blob of {key} is missing from the filing cache")
+                    self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    self._connection.commit()
+                else:
+                    self._connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+                    self._connection.commit()
+                    self.hits += 1
+                    return content
+            self.misses += 1
+            return None
+
+    def put(self, cik_code, document_id, content, kind='full'):
+        """
+        Stores the content under the given key, replacing any previous entry.
+        """
+        key = self.make_key(cik_code, document_id, kind)
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        with self._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                # Write to a temporary file first so a crash never leaves a truncated blob behind
+                temp_path = f'{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with gzip.open(temp_path, 'wb', compresslevel=6) as blob:
+                    blob.write(data)
+                os.replace(temp_path, blob_path)
+            size = os.path.getsize(blob_path)
+            now = time.time()
+            self._connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                                     (key, digest, size, now, now))
+            self._connection.commit()
+            self._evict()
+
+    def _evict(self):
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        rows = self._connection.execute('SELECT key, digest, size FROM entries ORDER BY last_access').fetchall()
+        for key, digest, size in rows:
+            if total_size <= self.max_bytes:
+                break
+            self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total_size -= size
+            # Blobs are shared by identical downloads, only remove them once nothing points to them
+            if self._connection.execute('SELECT 1 FROM entries WHERE digest = ?', (digest,)).fetchone() is None:
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+            logging.debug(f"Evicted {key} from the filing cache")
+        self._connection.commit()
+
+    def stats(self):
+        """
+        Returns hit and miss counts, the hit rate and the number and total size of the cached entries.
+        """
+        with self._lock:
+            entries, size = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries, "size_bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
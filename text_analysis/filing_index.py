@@ -0,0 +1,125 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Annual report forms, including the pre-2008 small business and transition variants
+TEN_K_FORMS = ('10-K', '10-K405', '10-KSB', '10-KSB40', '10-KT', '10-KT405')
+INDEX_COLUMNS = ['accessionNumber', 'filingDate', 'form', 'primaryDocument', 'primaryDocDescription']
+
+
+class FilingIndex:
+    """
+    The complete list of filings of one company, fetched once and kept in memory for range queries.
+
+    The index combines 'filings' -> 'recent' of the submissions JSON with every extra page listed in
+    'filings' -> 'files', which hold the older filings. Downloads go through the scraper, so they are also cached on
+    disk when the scraper has a FilingCache.
+
+    Attributes:
+    ----------
+    cik_code : str
+        The CIK code of the company.
+    filings : pd.DataFrame
+        One row per filing with the columns of INDEX_COLUMNS.
+    """
+
+    max_cached_indexes = 512
+    _indexes = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, cik_code, filings):
+        self.cik_code = cik_code
+        self.filings = filings
+
+    @classmethod
+    def for_company(cls, cik_code, scraper):
+        """
+        Returns the index of the company, building it on first use.
+
+        Parameters:
+        ----------
+        cik_code : str
+            The CIK code of the company.
+        scraper : SECScraper
+            Scraper used to download the submissions JSON and its extra pages.
+
+        Returns:
+        -------
+        FilingIndex
+            The index, or None when the submissions could not be fetched.
+        """
+        key = str(int(cik_code))
+        with cls._lock:
+            if key in cls._indexes:
+                cls._indexes.move_to_end(key)
+                return cls._indexes[key]
+
+        filing_index = cls.build(cik_code, scraper)
+        if filing_index is None:
+            return None
+
+        with cls._lock:
+            cls._indexes[key] = filing_index
+            if len(cls._indexes) > cls.max_cached_indexes:
+                cls._indexes.popitem(last=False)
+        return filing_index
+
+    @classmethod
+    def build(cls, cik_code, scraper):
+        """
+        Downloads the submissions JSON of the company and all of its extra pages.
+        """
+        scraper.cik_code = cik_code
+        response = scraper.get_submissions_json()
+        if response is None:
+            return None
+
+        pages = [response['filings']['recent']]
+        for page in response['filings'].get('files', []):
+            page_response = scraper.get_submissions_json(file_name=page['name'])
+            if page_response is None:
+                logging.warning(f"Missing submissions page {page['name']} for company {cik_code}, "
+                                f"filings from {page.get('filingFrom')} to {page.get('filingTo')} are skipped")
+                continue
+            pages.append(page_response)
+
+        filings = pd.concat([cls.page_frame(page) for page in pages], ignore_index=True)
+        filings = filings.drop_duplicates(subset=['accessionNumber'])
+        logging.info(f"Indexed {len(filings)} filings for company {cik_code} from {len(pages)} pages")
+        return cls(cik_code, filings)
+
+    @staticmethod
+    def page_frame(page):
+        """
+        Returns one page of the submissions JSON as a frame with the columns of INDEX_COLUMNS. Older pages do not
+        always have every column, the missing ones are filled with None.
+        """
+        num_filings = max((len(page[column]) for column in INDEX_COLUMNS if column in page), default=0)
+        return pd.DataFrame({column: page.get(column, [None] * num_filings) for column in INDEX_COLUMNS})
+
+    def query(self, date_start, date_end, forms=('10-K',)):
+        """
+        Returns the filings of the given forms filed within a date range.
+
+        Parameters:
+        ----------
+        date_start : str
+            First filing date, formatted YYYY-MM-DD.
+        date_end : str
+            Last filing date, formatted YYYY-MM-DD.
+        forms : tuple
+            Form types to keep. TEN_K_FORMS selects the whole 10-K family.
+
+        Returns:
+        -------
+        list
+            One dictionary per filing with its accession number, filing date, primary document and description.
+        """
+        filings = self.filings
+        forms = [form.upper() for form in forms]
+        mask = (filings['form'].str.upper().isin(forms)
+                & (filings['filingDate'] >= date_start) & (filings['filingDate'] <= date_end))
+        return filings.loc[mask, ['accessionNumber', 'filingDate', 'primaryDocument',
+                                  'primaryDocDescription']].to_dict('records')
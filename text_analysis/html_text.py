@@ -0,0 +1,95 @@
+import html
+import re
+from bisect import bisect_right
+from itertools import chain
+
+# Comments, script and style blocks are dropped with their content, every other tag is dropped on its own. A tag
+# starts with a name (or ! / ? for declarations), so a stray '<' in the text, as in "a < b", is kept as text
+MARKUP_PATTERN = re.compile(r'<!--.*?-->|<(script|style)\b[^>]*>.*?</\1\s*>|</?[A-Za-z!?][^>]*>',
+                            re.DOTALL | re.IGNORECASE)
+# Tags inside which BeautifulSoup keeps whitespace-only text as it is
+PRESERVE_WHITESPACE_PATTERN = re.compile(r'<(/?)(pre|textarea)\b', re.IGNORECASE)
+ASCII_SPACES = ' \n\t\f\r'
+
+
+class HTMLText:
+    """
+    The plain text of an HTML document, extracted in one pass, with a map from raw offsets to text offsets.
+
+    The text matches BeautifulSoup's get_text("\\n") with the lxml parser: every run of text between two tags
+    becomes one line with its entities decoded, and a run of ASCII whitespace only (such as the indentation between
+    two tags) becomes a single newline if it contains one, a single space otherwise, except inside <pre> and
+    <textarea>. Unlike lxml, line endings are not normalized to \\n and whitespace at the start of the document is
+    kept. Because the map is kept, boundaries found with regular expressions on the raw HTML (such as 10-K item
+    headings) can be applied to the clean text afterwards, without parsing each slice again.
+
+    Attributes:
+    ----------
+    raw : str
+        The HTML document.
+    text : str
+        The extracted text.
+    """
+
+    def __init__(self, raw):
+        """
+        Constructs all the necessary attributes for the HTMLText object.
+
+        Parameters:
+        ----------
+        raw : str
+            The HTML document.
+        """
+        self.raw = raw
+        raw_starts, raw_ends, text_starts, segments = [], [], [], []
+        text_length = 0
+        position = 0
+        preserve_depth = 0
+        for match in chain(MARKUP_PATTERN.finditer(raw), [None]):
+            end = len(raw) if match is None else match.start()
+            if end > position:
+                segment = html.unescape(raw[position:end])
+                if not preserve_depth and not segment.strip(ASCII_SPACES):
+                    segment = '\n' if '\n' in segment or '\r' in segment else ' '
+                raw_starts.append(position)
+                raw_ends.append(end)
+                text_starts.append(text_length)
+                segments.append(segment)
+                text_length += len(segment) + 1
+            if match is None:
+                break
+            position = match.end()
+            preserve = PRESERVE_WHITESPACE_PATTERN.match(raw, match.start())
+            if preserve:
+                preserve_depth = max(preserve_depth + (-1 if preserve.group(1) else 1), 0)
+
+        self.text = '\n'.join(segments)
+        self._raw_starts = raw_starts
+        self._raw_ends = raw_ends
+        self._text_starts = text_starts
+        self._segment_lengths = [len(segment) for segment in segments]
+
+    def text_offset(self, raw_offset):
+        """
+        Maps an offset in the raw HTML to the corresponding offset in the text.
+
+        Offsets inside markup map to the start of the next run of text.
+        """
+        i = bisect_right(self._raw_starts, raw_offset) - 1
+        if i < 0:
+            return 0
+        if raw_offset < self._raw_ends[i]:
+            # Decode the part of the run before the offset to account for entities
+            prefix = html.unescape(self.raw[self._raw_starts[i]:raw_offset])
+            return self._text_starts[i] + min(len(prefix), self._segment_lengths[i])
+        if i + 1 < len(self._text_starts):
+            return self._text_starts[i + 1]
+        return len(self.text)
+
+    def slice(self, raw_start, raw_end=None):
+        """
+        Returns the text of the raw HTML between raw_start and raw_end (the end of the document when None).
+        """
+        start = self.text_offset(raw_start)
+        end = len(self.text) if raw_end is None else self.text_offset(raw_end)
+        return self.text[start:end]
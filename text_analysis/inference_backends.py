@@ -0,0 +1,191 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from dotenv import load_dotenv
+from transformers import pipeline, AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+load_dotenv()
+
+TORCH_BACKEND = 'torch'
+TORCH_INT8_BACKEND = 'torch-int8'
+ONNX_BACKEND = 'onnx'
+BACKENDS = (TORCH_BACKEND, TORCH_INT8_BACKEND, ONNX_BACKEND)
+
+
+def onnx_export_dir(model_name):
+    """
+    Returns the directory holding the exported and optimized ONNX graph of a model.
+    """
+    base_dir = os.getenv("ONNX_EXPORT_DIR") or f'{os.getenv("BASE_PATH")}/data/onnx'
+    return os.path.join(base_dir, model_name.replace('/', '--'))
+
+
+def source_revision(model_name):
+    """
+    Returns the commit of the model's files on the hub (the locally cached one when offline), or None for a local
+    model.
+    """
+    return getattr(AutoConfig.from_pretrained(model_name), '_commit_hash', None)
+
+
+def _load_torch_int8(model_name):
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    # Linear layers hold almost all of the weights and time of a transformer encoder
+    quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline('sentiment-analysis', model=quantized, tokenizer=AutoTokenizer.from_pretrained(model_name),
+                    device=-1)
+
+
+def _load_onnx(model_name, num_threads=None):
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTOptimizer
+        from optimum.onnxruntime.configuration import OptimizationConfig
+    except ImportError as e:
+        raise ImportError("The onnx backend needs optimum with ONNX Runtime: pip install optimum[onnxruntime]") from e
+
+    export_dir = onnx_export_dir(model_name)
+    optimized_file = 'model_optimized.onnx'
+    revision_file = os.path.join(export_dir, 'source_revision.txt')
+    revision = source_revision(model_name)
+    exported_revision = None
+    if os.path.exists(revision_file):
+        with open(revision_file) as file:
+            exported_revision = file.read().strip() or None
+    # The export is redone when the model was updated upstream, or when an earlier export did not finish
+    if not os.path.exists(os.path.join(export_dir, optimized_file)) or not os.path.exists(revision_file) \
+            or exported_revision != revision:
+        logging.info(f"Exporting {model_name} at revision {revision} to ONNX in {export_dir}")
+        model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+        model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+        # Level 2 fuses attention, layer norm and GELU nodes; it stays hardware independent unlike level 99
+        ORTOptimizer.from_pretrained(model).optimize(save_dir=export_dir,
+                                                     optimization_config=OptimizationConfig(optimization_level=2))
+        # Written last, so it only exists for a complete export
+        with open(revision_file, 'w') as file:
+            file.write(revision or '')
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = num_threads or torch.get_num_threads()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    model = ORTModelForSequenceClassification.from_pretrained(export_dir, file_name=optimized_file,
+                                                              session_options=session_options)
+    pipe = pipeline('sentiment-analysis', model=model, tokenizer=AutoTokenizer.from_pretrained(export_dir))
+    # The exported config has no commit of its own, the inference cache keys the scores by the source model's
+    pipe.source_revision = revision
+    return pipe
+
+
+def load_pipeline(model_name, backend=TORCH_BACKEND, device=-1, num_threads=None):
+    """
+    Loads a sentiment-analysis pipeline running on the given inference backend.
+
+    Parameters:
+    ----------
+    model_name : str
+        The Hugging Face model identifier.
+    backend : str
+        'torch' runs the fp32 model on the given device, 'torch-int8' the dynamically int8-quantized model on CPU,
+        'onnx' the exported ONNX graph with graph optimizations on ONNX Runtime (needs optimum[onnxruntime]).
+    device : int
+        Device index for the 'torch' backend.
+    num_threads : int
+        Intra-op threads of torch or ONNX Runtime, the current torch setting when None.
+
+    Returns:
+    -------
+    transformers.Pipeline
+        The pipeline, with a 'backend' attribute naming its backend.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of {BACKENDS}")
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if backend == TORCH_INT8_BACKEND:
+        if device != -1:
+            logging.warning(f"The {backend} backend runs on CPU only, ignoring device {device}")
+        pipe = _load_torch_int8(model_name)
+    elif backend == ONNX_BACKEND:
+        pipe = _load_onnx(model_name, num_threads)
+    else:
+        pipe = pipeline('sentiment-analysis', model=model_name, device=device)
+    # The inference cache keys scores by backend too, since quantized scores differ slightly
+    pipe.backend = backend
+    return pipe
+
+
+def label_probabilities(pipe, texts, batch_size=16, max_length=512):
+    """
+    Returns the probability of every label for every text, as an array with labels in sorted order.
+    """
+    outputs = pipe(texts, batch_size=batch_size, truncation=True, max_length=max_length, top_k=None)
+    return np.array([[score['score'] for score in sorted(output, key=lambda score: score['label'])]
+                     for output in outputs])
+
+
+def parity_check(model_name, texts, backends=(TORCH_INT8_BACKEND, ONNX_BACKEND), num_threads=None, batch_size=16):
+    """
+    Scores a sample corpus with the fp32 torch baseline and each backend, and reports how far the backends drift.
+
+    Parameters:
+    ----------
+    model_name : str
+        The Hugging Face model identifier.
+    texts : list
+        The sample corpus, e.g. preprocessed 10-K chunks.
+    backends : tuple
+        The backends compared with the baseline. Backends that cannot be loaded are reported as unavailable.
+    num_threads : int
+        Intra-op threads of every backend.
+    batch_size : int
+        Number of texts per forward pass.
+
+    Returns:
+    -------
+    pd.DataFrame
+        One row per backend: throughput, speedup over the baseline, mean and maximum absolute difference of the
+        label probabilities, and share of texts with the same top label.
+    """
+    rows = []
+    baseline = None
+    for backend in (TORCH_BACKEND, *backends):
+        try:
+            pipe = load_pipeline(model_name, backend, device=-1, num_threads=num_threads)
+        except ImportError as e:
+            logging.warning(f"Skipping the {backend} backend: {e}")
+            rows.append({'backend': backend, 'available': False})
+            continue
+        start_time = time.time()
+        probabilities = label_probabilities(pipe, texts, batch_size=batch_size)
+        elapsed = time.time() - start_time
+        if baseline is None:
+            baseline = probabilities
+        difference = np.abs(probabilities - baseline)
+        rows.append({'backend': backend, 'available': True, 'texts_per_second': len(texts) / elapsed,
+                     'mean_abs_diff': difference.mean(), 'max_abs_diff': difference.max(),
+                     'label_agreement': (probabilities.argmax(axis=1) == baseline.argmax(axis=1)).mean()})
+        del pipe
+
+    report = pd.DataFrame(rows).set_index('backend')
+    report['speedup'] = report['texts_per_second'] / report.loc[TORCH_BACKEND, 'texts_per_second']
+    logging.info(f"Backend parity for {model_name} on {len(texts)} texts:\n{report}")
+    return report
+
+
+if __name__ == '__main__':
+    from benchmarks.fixtures import make_sections
+    from text_analysis.model_registry import SENTIMENT_MODEL, FINBERT_MODEL
+    from text_analysis.tokenized_section import TokenizedSection
+
+    logging.basicConfig(level=logging.INFO)
+    sample = [chunk_text for text in make_sections(0, words_per_section=2000).values()
+              for chunk_text in TokenizedSection(text).chunk_texts()]
+    for name in (FINBERT_MODEL, SENTIMENT_MODEL):
+        print(parity_check(name, sample))
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def normalize_chunk(text):
+    """
+    Normalizes a chunk before hashing, so chunks differing only in case or whitespace share one entry.
+    """
+    return ' '.join(text.lower().split())
+
+
+def chunk_digest(text):
+    return hashlib.sha256(normalize_chunk(text).encode('utf-8')).hexdigest()
+
+
+def model_identity(pipe):
+    """
+    Returns the (model id, revision) of a transformers pipeline. The revision is the commit of the downloaded
+    weights, so scores are not reused after the model is updated on the hub (for exported models, the commit of
+    the source model they were exported from), followed by the inference backend when it is not plain torch,
+    since quantized or ONNX scores differ slightly.
+    """
+    model = getattr(pipe, 'model', None)
+    config = getattr(model, 'config', None)
+    model_id = getattr(config, 'name_or_path', None) or getattr(model, 'name_or_path', None) or type(pipe).__name__
+    revision = getattr(pipe, 'source_revision', None) or getattr(config, '_commit_hash', None) or 'unknown'
+    backend = getattr(pipe, 'backend', 'torch')
+    if backend != 'torch':
+        revision = f'{revision}+{backend}'
+    return model_id, revision
+
+
+class InferenceCache:
+    """
+    A persistent cache of model scores keyed by (model id, model revision, normalized chunk hash), stored in SQLite.
+
+    Boilerplate such as Item 9A controls text repeats across years and reruns, so its chunks are scored once.
+    Beyond max_entries the least recently used scores are evicted. The number of entries is counted once when the
+    cache is opened and kept up to date on insert and eviction; it is read again from the table before evicting and
+    every recount_every puts, since other processes may share the database. Hits and misses are counted per
+    section so the report shows where the cache pays off.
+
+    Attributes:
+    ----------
+    path : str
+        Path of the SQLite database.
+    max_entries : int
+        Maximum number of cached scores.
+    """
+
+    recount_every = 1000
+
+    def __init__(self, path=None, max_entries=None):
+        """
+        Constructs all the necessary attributes for the InferenceCache object.
+
+        Parameters:
+        ----------
+        path : str
+            Path of the database. Defaults to INFERENCE_CACHE_PATH, or BASE_PATH/data/inference_cache.sqlite.
+        max_entries : int
+            Maximum number of cached scores. Defaults to INFERENCE_CACHE_MAX_ENTRIES, or 5 million.
+        """
+        self.path = path or os.getenv("INFERENCE_CACHE_PATH") or \
+            f'{os.getenv("BASE_PATH")}/data/inference_cache.sqlite'
+        self.max_entries = max_entries or int(os.getenv("INFERENCE_CACHE_MAX_ENTRIES", 5000000))
+        self.section_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS scores (model TEXT NOT NULL, revision TEXT NOT NULL, '
+                                     'digest TEXT NOT NULL, score REAL NOT NULL, last_access REAL NOT NULL, '
+                                     'PRIMARY KEY (model, revision, digest))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS scores_last_access ON scores (last_access)')
+        self._count = self._connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        self._puts = 0
+
+    def get_many(self, model_id, revision, digests):
+        """
+        Looks up the scores of many chunks and refreshes their access time.
+
+        Returns:
+        -------
+        dict
+            Mapping of digest to score for the digests found.
+        """
+        found = {}
+        digests = list(dict.fromkeys(digests))
+        with self._lock, self._connection:
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                rows = self._connection.execute(
+                    f'SELECT digest, score FROM scores WHERE model = ? AND revision = ? '
+                    f'AND digest IN ({",".join("?" * len(batch))})', [model_id, revision, *batch]).fetchall()
+                found.update(rows)
+            now = time.time()
+            self._connection.executemany('UPDATE scores SET last_access = ? WHERE model = ? AND revision = ? '
+                                         'AND digest = ?', [(now, model_id, revision, digest) for digest in found])
+        return found
+
+    def put_many(self, model_id, revision, scores):
+        """
+        Stores the scores of many chunks, given as a mapping of digest to score.
+
+        A chunk already stored for the same model and revision keeps its entry: it was scored by the same model,
+        e.g. in another process, so only the new chunks add to the number of entries.
+        """
+        if not scores:
+            return
+        now = time.time()
+        with self._lock, self._connection:
+            changes = self._connection.total_changes
+            self._connection.executemany('INSERT OR IGNORE INTO scores VALUES (?, ?, ?, ?, ?)',
+                                         [(model_id, revision, digest, score, now) for digest, score in scores.items()])
+            self._count += self._connection.total_changes - changes
+            self._evict()
+
+    def _evict(self):
+        self._puts += 1
+        if self._count <= self.max_entries and self._puts % self.recount_every:
+            return
+        # The table is counted again to include the entries other processes added or evicted
+        self._count = self._connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        # Evict a little more than needed so eviction does not run on every insert
+        excess = self._count - self.max_entries + self.max_entries // 20
+        deleted = self._connection.execute('DELETE FROM scores WHERE rowid IN (SELECT rowid FROM scores '
+                                           'ORDER BY last_access LIMIT ?)', (excess,)).rowcount
+        self._count -= deleted
+        logging.info(f"Evicted {deleted} cached scores")
+
+    def record(self, section, hits, misses):
+        with self._lock:
+            self.section_stats[section]["hits"] += hits
+            self.section_stats[section]["misses"] += misses
+
+    def report(self):
+        """
+        Returns the hits, misses and hit rate of every section type.
+
+        Returns:
+        -------
+        pd.DataFrame
+            One row per section.
+        """
+        with self._lock:
+            report = pd.DataFrame.from_dict(dict(self.section_stats), orient='index', columns=['hits', 'misses'])
+        report['hit_rate'] = report['hits'] / (report['hits'] + report['misses'])
+        return report.sort_index()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
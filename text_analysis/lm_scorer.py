@@ -0,0 +1,118 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from nltk.tokenize import word_tokenize
+from scipy.sparse import csr_matrix
+
+LM_CATEGORIES = ["positive", "negative", "uncertainty", "litigious", "constraining", "strong_modal", "weak_modal"]
+
+
+class LMScorer:
+    """
+    A class to score token lists against the Loughran-McDonald dictionary with sparse matrix products.
+
+    The dictionary is turned into a word-id vocabulary and a (vocabulary x category) matrix, so scoring a batch of
+    documents is one sparse count matrix multiplied by the category matrix.
+
+    Attributes:
+    ----------
+    vocabulary : dict
+        Mapping of lowercase word to its row in the category matrix.
+    matrix : np.ndarray
+        Category indicators, one row per word and one column per entry of LM_CATEGORIES.
+    """
+
+    def __init__(self, lm_dict):
+        """
+        Constructs all the necessary attributes for the LMScorer object.
+
+        Parameters:
+        ----------
+        lm_dict : pd.DataFrame
+            The dictionary as returned by load_lm_dictionary (lowercase index and columns, binary categories).
+        """
+        # Words read as NaN by pandas cannot be matched by any token
+        lm_dict = lm_dict[[isinstance(word, str) for word in lm_dict.index]]
+        lm_dict = lm_dict[~lm_dict.index.duplicated(keep='first')]
+
+        missing = [category for category in LM_CATEGORIES if category not in lm_dict.columns]
+        if missing:
+            logging.warning(f"Categories {missing} are missing from the LM dictionary and will score 0")
+
+        self.vocabulary = {word: i for i, word in enumerate(lm_dict.index)}
+        self.matrix = lm_dict.reindex(columns=LM_CATEGORIES, fill_value=0).to_numpy(dtype=np.float64)
+
+    def word_ids(self, tokens):
+        """
+        Maps tokens to vocabulary ids, dropping the ones that are not in the dictionary.
+        """
+        vocabulary = self.vocabulary
+        ids = [vocabulary.get(token.lower(), -1) for token in tokens]
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        return ids[ids >= 0]
+
+    def count_matrix(self, token_lists):
+        """
+        Builds the sparse (documents x vocabulary) count matrix of a batch of token lists.
+        """
+        ids = [self.word_ids(tokens) for tokens in token_lists]
+        rows = np.repeat(np.arange(len(ids)), [len(x) for x in ids])
+        cols = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        data = np.ones(len(cols), dtype=np.float64)
+        # Duplicate (row, column) entries are summed into word counts
+        return csr_matrix((data, (rows, cols)), shape=(len(ids), len(self.vocabulary)))
+
+    def score_batch(self, token_lists):
+        """
+        Scores a batch of token lists.
+
+        Parameters:
+        ----------
+        token_lists : list
+            One list of tokens per document, section or chunk.
+
+        Returns:
+        -------
+        np.ndarray
+            Category counts with one row per token list and one column per entry of LM_CATEGORIES.
+        """
+        return np.asarray(self.count_matrix(token_lists) @ self.matrix)
+
+    def score_tokens(self, tokens):
+        """
+        Scores a single token list.
+
+        Returns:
+        -------
+        dict
+            Category counts keyed by category name.
+        """
+        return self.to_dict(self.score_batch([tokens])[0])
+
+    @staticmethod
+    def to_dict(row):
+        return {category: float(value) for category, value in zip(LM_CATEGORIES, row)}
+
+
+def score_loughran_mcdonald(documents, lm_dict, index=None):
+    """
+    Scores an already parsed corpus against the Loughran-McDonald dictionary.
+
+    Parameters:
+    ----------
+    documents : list
+        The documents, either as raw strings (tokenized with word_tokenize) or as token lists.
+    lm_dict : pd.DataFrame or LMScorer
+        The dictionary as returned by load_lm_dictionary, or a scorer built from it.
+    index : list
+        Optional index of the returned DataFrame, e.g. (cik, date, item) tuples.
+
+    Returns:
+    -------
+    pd.DataFrame
+        Category counts, one row per document.
+    """
+    scorer = lm_dict if isinstance(lm_dict, LMScorer) else LMScorer(lm_dict)
+    token_lists = [word_tokenize(document) if isinstance(document, str) else document for document in documents]
+    return pd.DataFrame(scorer.score_batch(token_lists), columns=LM_CATEGORIES, index=index)
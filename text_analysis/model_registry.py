@@ -0,0 +1,233 @@
+import atexit
+import gc
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import psutil
+import torch
+from dotenv import load_dotenv
+
+from text_analysis.inference_backends import load_pipeline, TORCH_BACKEND
+from text_analysis.lm_scorer import LMScorer
+from text_analysis.readability import SyllableTable
+
+load_dotenv()
+lm_dictionary_path = os.getenv("LM_DICTIONARY_PATH")
+syllable_table_path = os.getenv("SYLLABLE_TABLE_PATH")
+inference_backend = os.getenv("INFERENCE_BACKEND", TORCH_BACKEND)
+inference_threads = int(os.getenv("INFERENCE_THREADS", 0)) or None
+syllable_table_max_words = int(os.getenv("SYLLABLE_TABLE_MAX_WORDS", 500000))
+
+SENTIMENT_MODEL = 'soleimanian/financial-roberta-large-sentiment'  # FinRoBERTa model for financial text
+FINBERT_MODEL = 'yiyanghkust/finbert-tone'
+LM_DICTIONARY = 'loughran-mcdonald'
+LM_SCORER = 'loughran-mcdonald-scorer'
+SYLLABLE_TABLE = 'syllable-table'
+
+LM_SENTIMENT_COLUMNS = ["Positive", "Negative", "Uncertainty", "Litigious", "Constraining", "Strong_Modal",
+                        "Weak_Modal"]
+
+
+def get_device():
+    """
+    Returns the device index used by the transformers pipelines (MPS if available, CPU otherwise).
+    """
+    return 0 if torch.backends.mps.is_available() else -1
+
+
+def load_lm_dictionary(path=None):
+    """
+    Loads the Loughran-McDonald dictionary with lowercase words and binary category indicators.
+
+    Parameters:
+    ----------
+    path : str
+        Path to the Loughran-McDonald master dictionary CSV. Defaults to LM_DICTIONARY_PATH.
+
+    Returns:
+    -------
+    pd.DataFrame
+        The dictionary indexed by lowercase word.
+    """
+    lm_dict = pd.read_csv(path or lm_dictionary_path, index_col=0)
+    lm_dict.index = lm_dict.index.str.lower()  # Ensure lowercase index for consistency
+
+    # Convert year values to binary indicators
+    for col in LM_SENTIMENT_COLUMNS:
+        if col in lm_dict.columns:
+            lm_dict[col] = lm_dict[col].apply(lambda x: 1 if x != 0 else 0)
+    lm_dict.columns = lm_dict.columns.str.lower()
+    return lm_dict
+
+
+def current_rss():
+    """
+    Returns the resident set size of the current process in bytes.
+    """
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+class ModelRegistry:
+    """
+    A process-wide registry that loads each model once and shares it between all SentimentAnalyzer objects.
+
+    Attributes:
+    ----------
+    device : int
+        The device index passed to the transformers pipelines.
+    backend : str
+        The inference backend of the pipelines (see inference_backends.load_pipeline).
+    num_threads : int
+        Intra-op threads of the backend, or None for the torch default.
+    load_stats : dict
+        Load time (seconds) and resident memory delta (bytes) for every loaded model.
+    """
+
+    def __init__(self, device=None, backend=None, num_threads=None):
+        """
+        Constructs all the necessary attributes for the ModelRegistry object.
+
+        Parameters:
+        ----------
+        device : int
+            The device index for the pipelines. Defaults to MPS if available, CPU otherwise.
+        backend : str
+            The inference backend. Defaults to INFERENCE_BACKEND, or 'torch'.
+        num_threads : int
+            Intra-op threads of the backend. Defaults to INFERENCE_THREADS, or the torch default.
+        """
+        self.device = device
+        self.backend = backend or inference_backend
+        self.num_threads = num_threads or inference_threads
+        self.load_stats = {}
+        self._models = {}
+        self._lock = threading.RLock()
+
+    def _load(self, name, loader):
+        with self._lock:
+            if name in self._models:
+                return self._models[name]
+            rss_before = current_rss()
+            start_time = time.time()
+            model = loader()
+            load_time = time.time() - start_time
+            rss_delta = current_rss() - rss_before
+            self._models[name] = model
+            self.load_stats[name] = {"load_time": load_time, "rss_delta": rss_delta}
+            logging.info(f"Loaded {name} in {load_time:.2f} seconds (+{rss_delta / 1024 ** 2:.1f} MB resident)")
+            return model
+
+    def get_pipeline(self, model_name):
+        """
+        Returns the sentiment-analysis pipeline for the given model, loading it on first use.
+
+        Parameters:
+        ----------
+        model_name : str
+            The Hugging Face model identifier.
+
+        Returns:
+        -------
+        transformers.Pipeline
+            The shared pipeline.
+        """
+        if self.device is None:
+            self.device = get_device()
+            logging.info(f"Using device {self.device} and the {self.backend} backend for sentiment analysis")
+        return self._load(model_name, lambda: load_pipeline(model_name, self.backend, self.device, self.num_threads))
+
+    def configure(self, backend=None, num_threads=None):
+        """
+        Selects the inference backend and thread count for this run. Pipelines loaded with other settings are
+        released so they are loaded again with the new ones.
+        """
+        backend = backend or self.backend
+        num_threads = num_threads or self.num_threads
+        if (backend, num_threads) != (self.backend, self.num_threads):
+            with self._lock:
+                for name in [name for name, model in self._models.items() if hasattr(model, 'backend')]:
+                    del self._models[name]
+                    self.load_stats.pop(name, None)
+        self.backend = backend
+        self.num_threads = num_threads
+
+    def get_lm_dictionary(self, path=None):
+        """
+        Returns the Loughran-McDonald dictionary, reading the CSV on first use.
+        """
+        return self._load(LM_DICTIONARY, lambda: load_lm_dictionary(path))
+
+    def get_lm_scorer(self):
+        """
+        Returns the vectorized Loughran-McDonald scorer built from the shared dictionary.
+        """
+        return self._load(LM_SCORER, lambda: LMScorer(self.get_lm_dictionary()))
+
+    def get_syllable_table(self):
+        """
+        Returns the syllable table shared by the readability scores, loaded from SYLLABLE_TABLE_PATH if it exists.
+        """
+        return self._load(SYLLABLE_TABLE, lambda: SyllableTable(syllable_table_max_words, syllable_table_path))
+
+    def register(self, name, model):
+        """
+        Registers an already constructed model (e.g. a stub pipeline) under the given name.
+        """
+        with self._lock:
+            self._models[name] = model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warm_up(self, model_names=(SENTIMENT_MODEL, FINBERT_MODEL), sample_text="Revenue increased this year."):
+        """
+        Loads the given models and the LM dictionary ahead of time and runs one inference per pipeline.
+
+        Parameters:
+        ----------
+        model_names : tuple
+            The models to load.
+        sample_text : str
+            Text used for the warm-up inference.
+        """
+        for model_name in model_names:
+            self.get_pipeline(model_name)(sample_text)
+        self.get_lm_scorer()
+
+    def release(self):
+        """
+        Drops every loaded model and frees the memory they hold.
+        """
+        with self._lock:
+            if not self._models:
+                return
+            logging.info(f"Releasing {len(self._models)} models")
+            # The syllable counts outlive the process so the next run starts with them
+            if SYLLABLE_TABLE in self._models:
+                self._models[SYLLABLE_TABLE].save()
+            self._models.clear()
+        gc.collect()
+        if torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+        elif torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def report(self):
+        """
+        Returns the load time and resident memory of each model loaded by this registry.
+
+        Returns:
+        -------
+        pd.DataFrame
+            One row per model with columns 'load_time' (seconds) and 'rss_mb'.
+        """
+        report = pd.DataFrame.from_dict(self.load_stats, orient='index', columns=['load_time', 'rss_delta'])
+        report['rss_mb'] = report.pop('rss_delta') / 1024 ** 2
+        return report
+
+
+model_registry = ModelRegistry()
+atexit.register(model_registry.release)
@@ -0,0 +1,232 @@
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from text_analysis.telemetry import telemetry
+
+# Marks the end of the items flowing through a queue
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline, run by a pool of worker threads.
+
+    Attributes:
+    ----------
+    name : str
+        Name of the stage in logs and reports.
+    function : callable
+        Called with one item (or a list of up to batch_size items) and returns the output (or list of outputs).
+        Outputs that are None are dropped.
+    workers : int
+        Number of threads running the stage.
+    queue_size : int
+        Capacity of the queue feeding the stage; a full queue blocks the previous stage (backpressure).
+    batch_size : int
+        When above 1, the function receives the items already waiting in the queue, up to batch_size at once.
+    on_error : callable
+        Called as on_error(item, exception) when the function raises; the item is then dropped.
+    """
+
+    def __init__(self, name, function, workers=1, queue_size=8, batch_size=1, on_error=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.reset()
+
+    def reset(self):
+        self.items = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.starved_time = 0.0
+        self.blocked_time = 0.0
+        self._lock = threading.Lock()
+        self._running = self.workers
+
+    def record(self, items=0, errors=0, busy_time=0.0, starved_time=0.0, blocked_time=0.0):
+        with self._lock:
+            self.items += items
+            self.errors += errors
+            self.busy_time += busy_time
+            self.starved_time += starved_time
+            self.blocked_time += blocked_time
+
+    def worker_finished(self):
+        """
+        Returns True for the last worker of the stage to finish.
+        """
+        with self._lock:
+            self._running -= 1
+            return self._running == 0
+
+
+class Pipeline:
+    """
+    A chain of stages connected by bounded queues, e.g. fetch -> parse -> score.
+
+    Every stage works on the next items while the following stages process the previous ones, so downloads, parsing
+    and inference overlap. The bounded queues keep fast stages from running ahead of slow ones, and closing the
+    output generator stops every thread.
+
+    Attributes:
+    ----------
+    stages : list
+        The stages, in order.
+    """
+
+    def __init__(self, stages):
+        """
+        Constructs all the necessary attributes for the Pipeline object.
+
+        Parameters:
+        ----------
+        stages : list
+            The stages, in order.
+        """
+        self.stages = stages
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(self, items, target):
+        try:
+            for item in items:
+                if not self._put(target, item):
+                    return
+        except Exception as e:
+            logging.error(f"Pipeline input failed: {e}")
+        finally:
+            self._put(target, _DONE)
+
+    def _next_batch(self, stage, source):
+        start = time.perf_counter()
+        item = self._get(source)
+        starved_time = time.perf_counter() - start
+        if item is _DONE:
+            return [], True, starved_time
+        batch = [item]
+        while len(batch) < stage.batch_size:
+            try:
+                item = source.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True, starved_time
+            batch.append(item)
+        return batch, False, starved_time
+
+    def _work(self, stage, source, target):
+        done = False
+        while not done and not self._stop.is_set():
+            batch, done, starved_time = self._next_batch(stage, source)
+            stage.record(starved_time=starved_time)
+            telemetry.observe('pipeline_wait_seconds', starved_time, stage=stage.name, wait='starved')
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                outputs = stage.function(batch) if stage.batch_size > 1 else [stage.function(batch[0])]
+                errors = 0
+            except Exception as e:
+                logging.error(f"Pipeline stage {stage.name} failed: {e}")
+                outputs, errors = [], len(batch)
+                if stage.on_error is not None:
+                    stage.on_error(batch if stage.batch_size > 1 else batch[0], e)
+            busy_time = time.perf_counter() - start
+            stage.record(items=len(batch), errors=errors, busy_time=busy_time)
+            telemetry.observe('pipeline_stage_seconds', busy_time, stage=stage.name)
+
+            start = time.perf_counter()
+            for output in outputs:
+                if output is not None:
+                    self._put(target, output)
+            blocked_time = time.perf_counter() - start
+            stage.record(blocked_time=blocked_time)
+            telemetry.observe('pipeline_wait_seconds', blocked_time, stage=stage.name, wait='blocked')
+
+        if done:
+            # Let the other workers of the stage see the end of the input as well
+            self._put(source, _DONE)
+        if stage.worker_finished():
+            self._put(target, _DONE)
+
+    def run(self, items):
+        """
+        Runs the items through every stage and yields the outputs of the last stage as they are ready.
+
+        The order of the outputs follows completion, not the order of the items.
+        """
+        self._stop.clear()
+        for stage in self.stages:
+            stage.reset()
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        # The output of the last stage is consumed by the caller
+        queues.append(queue.Queue(maxsize=self.stages[-1].queue_size))
+
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), name='pipeline-input', daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads += [threading.Thread(target=self._work, args=(stage, queues[i], queues[i + 1]),
+                                         name=f'pipeline-{stage.name}-{worker}', daemon=True)
+                        for worker in range(stage.workers)]
+
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                output = self._get(queues[-1])
+                if output is _DONE:
+                    break
+                yield output
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.perf_counter() - start_time
+            logging.info(f"Pipeline report:\n{self.report()}")
+
+    def report(self):
+        """
+        Returns the items processed and the time spent by each stage.
+
+        Utilization is the share of the wall time the stage's workers spent working. Starved time is spent waiting
+        for input, blocked time waiting for room in the next queue, so the bottleneck is the stage with the highest
+        utilization while the others are starved or blocked.
+
+        Returns:
+        -------
+        pd.DataFrame
+            One row per stage.
+        """
+        rows = []
+        for stage in self.stages:
+            capacity = self.elapsed * stage.workers
+            rows.append({'stage': stage.name, 'workers': stage.workers, 'items': stage.items,
+                         'errors': stage.errors, 'busy_s': round(stage.busy_time, 2),
+                         'starved_s': round(stage.starved_time, 2), 'blocked_s': round(stage.blocked_time, 2),
+                         'utilization': round(stage.busy_time / capacity, 3) if capacity > 0 else 0.0})
+        return pd.DataFrame(rows).set_index('stage')
@@ -0,0 +1,255 @@
+import logging
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import wraps
+
+import requests
+from dotenv import load_dotenv
+from retrying import RetryError
+
+from text_analysis.telemetry import telemetry
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock (Windows) the state stays in memory and is only shared by the threads of the process
+    fcntl = None
+
+load_dotenv()
+
+# Shared state: next free request slot, current rate, end of a Retry-After block, time of the last decrease
+_STATE = struct.Struct('<4d')
+
+
+def parse_retry_after(value, default=None):
+    """
+    Returns the seconds to wait from a Retry-After header, given in seconds or as an HTTP date.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=30.0):
+    """
+    Returns a random delay below base_delay * 2 ** attempt, capped at max_delay ("full jitter"), so retries of
+    many workers do not line up.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class ThrottledError(Exception):
+    """
+    Raised for a 429 or 503 response, with the seconds the server asked to wait, if any.
+    """
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Throttled with status {status_code}, retry after {retry_after} seconds")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RejectedError(Exception):
+    """
+    Raised for a 4xx response other than 429, such as a 404 for an unknown company, which a retry would not change.
+    """
+
+    def __init__(self, status_code, message=None):
+        super().__init__(message or f"Rejected with status {status_code}")
+        self.status_code = status_code
+
+
+class RateGovernor:
+    """
+    A request rate limit shared by every process on the host, adapting to throttling (AIMD).
+
+    The processes share a small state file locked with flock: each request reserves the next free slot, spaced
+    1 / rate seconds from the previous one. Every successful request raises the rate a little, up to max_rate
+    (additive increase); a 429 or 503 cuts it by decrease_factor (multiplicative decrease) and blocks every process
+    for the Retry-After period. Several throttled responses within one cooldown period count as one.
+
+    Attributes:
+    ----------
+    max_rate : float
+        Highest request rate across all processes, in requests per second.
+    min_rate : float
+        Lowest request rate the decreases go down to.
+    increase : float
+        Requests per second added per second of successful requests.
+    decrease_factor : float
+        Factor applied to the rate on throttling.
+    path : str
+        State file shared by the processes, or None to keep the state in this process.
+    """
+
+    def __init__(self, max_rate=10.0, min_rate=0.5, increase=0.5, decrease_factor=0.5, path=None):
+        """
+        Constructs all the necessary attributes for the RateGovernor object.
+
+        Parameters:
+        ----------
+        max_rate : float
+            Highest request rate across all processes, in requests per second.
+        min_rate : float
+            Lowest request rate the decreases go down to.
+        increase : float
+            Requests per second added per second of successful requests.
+        decrease_factor : float
+            Factor applied to the rate on throttling.
+        path : str
+            State file shared by the processes. Defaults to SEC_RATE_STATE_PATH, or sec_rate_governor.state in the
+            temporary directory.
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.path = path or os.getenv("SEC_RATE_STATE_PATH") or \
+            os.path.join(tempfile.gettempdir(), 'sec_rate_governor.state')
+        if fcntl is None:
+            self.path = None
+        self._lock = threading.Lock()
+        self._fd = None
+        self._fd_pid = None
+        self._state = None
+
+    def _initial_state(self):
+        return [0.0, self.max_rate, 0.0, 0.0]
+
+    def _file(self):
+        # A descriptor opened before a fork would share its lock with the parent
+        if self._fd is None or self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    def _update(self, function):
+        """
+        Applies function to the shared state under the lock and returns its result.
+        """
+        with self._lock:
+            if self.path is None:
+                if self._state is None:
+                    self._state = self._initial_state()
+                return function(self._state)
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(fd, _STATE.size, 0)
+                state = list(_STATE.unpack(data)) if len(data) == _STATE.size else self._initial_state()
+                # Another process may have been configured with a different limit
+                state[1] = min(max(state[1], self.min_rate), self.max_rate)
+                result = function(state)
+                os.pwrite(fd, _STATE.pack(*state), 0)
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self):
+        """
+        Reserves the next request slot of the host and sleeps until it comes.
+        """
+        def reserve(state):
+            now = time.time()
+            slot = max(now, state[0], state[2])
+            state[0] = slot + 1 / state[1]
+            return slot - now
+
+        wait = self._update(reserve)
+        telemetry.observe('rate_limit_wait_seconds', wait)
+        if wait > 0:
+            time.sleep(wait)
+
+    def succeeded(self):
+        def increase(state):
+            state[1] = min(self.max_rate, state[1] + self.increase / state[1])
+
+        self._update(increase)
+
+    def throttled(self, retry_after=None):
+        """
+        Lowers the rate after a 429 or 503 response and blocks every process for retry_after seconds.
+        """
+        def decrease(state):
+            now = time.time()
+            if retry_after:
+                state[2] = max(state[2], now + retry_after)
+            # Responses to requests sent before the last decrease took effect do not decrease again
+            if now - state[3] < max(1.0, retry_after or 0):
+                return state[1]
+            state[1] = max(self.min_rate, state[1] * self.decrease_factor)
+            state[3] = now
+            return state[1]
+
+        rate = self._update(decrease)
+        telemetry.count('sec_throttled_total')
+        logging.warning(f"EDGAR throttled the request rate, lowered to {rate:.2f} requests per second"
+                        + (f" and paused for {retry_after:.0f} seconds" if retry_after else ""))
+
+    def reset(self, max_rate=None):
+        """
+        Resets the shared state, e.g. to start a benchmark at a given rate.
+        """
+        if max_rate is not None:
+            self.max_rate = max_rate
+
+        def clear(state):
+            state[:] = self._initial_state()
+
+        self._update(clear)
+
+    @property
+    def rate(self):
+        return self._update(lambda state: state[1])
+
+
+def governed_request(governor, max_attempts=4, base_delay=0.5, max_delay=30.0):
+    """
+    Sends the decorated request function through the governor and retries it with exponential backoff and jitter.
+    The governor is a RateGovernor, or a function returning it from the arguments of the decorated function, e.g. to
+    use the governor of the instance a method is called on.
+
+    The function raises ThrottledError on a 429 or 503 response, which slows the governor down before the retry,
+    RejectedError on other 4xx responses, which are not retried, and RetryError or a requests exception on other
+    failures. A rejection, or the last error after max_attempts, is raised as a RetryError.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            active = governor if isinstance(governor, RateGovernor) else governor(*args, **kwargs)
+            last_error = None
+            for attempt in range(max_attempts):
+                if attempt:
+                    telemetry.count('sec_retries_total', function=func.__name__)
+                    time.sleep(backoff_delay(attempt, base_delay, max_delay))
+                active.acquire()
+                try:
+                    result = func(*args, **kwargs)
+                except ThrottledError as e:
+                    active.throttled(e.retry_after)
+                    last_error = e
+                    continue
+                except RejectedError as e:
+                    raise RetryError(f"{func.__name__} was rejected: {e}")
+                except (RetryError, requests.RequestException) as e:
+                    last_error = e
+                    continue
+                active.succeeded()
+                return result
+            raise RetryError(f"{func.__name__} failed after {max_attempts} attempts: {last_error}")
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,201 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from textstat import textstat
+
+# Flesch reading ease constants of textstat for English
+FRE_BASE = 206.835
+FRE_SENTENCE_LENGTH = 1.015
+FRE_SYLLABLES_PER_WORD = 84.6
+
+
+def legacy_round(values, points=0):
+    """
+    Rounds half away from zero like textstat's _legacy_round, element-wise.
+    """
+    p = 10 ** points
+    return np.floor(values * p + np.copysign(0.5, values)) / p
+
+
+def flesch_reading_ease_from_totals(words, sentences, syllables):
+    """
+    Computes the Flesch reading ease from word, sentence and syllable totals, as textstat.flesch_reading_ease does
+    from the text: both averages are rounded to one decimal and the score to two.
+
+    Parameters:
+    ----------
+    words : np.ndarray
+        Words of every text.
+    sentences : np.ndarray
+        Sentences of every text.
+    syllables : np.ndarray
+        Syllables of every text.
+
+    Returns:
+    -------
+    np.ndarray
+        The reading ease of every text, 0 for texts without words.
+    """
+    words = np.asarray(words, dtype=np.float64)
+    sentences = np.asarray(sentences, dtype=np.float64)
+    syllables = np.asarray(syllables, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sentence_length = np.where(sentences > 0, legacy_round(words / sentences, 1), 0.0)
+        syllables_per_word = np.where(words > 0, legacy_round(syllables / words, 1), 0.0)
+    scores = legacy_round(FRE_BASE - FRE_SENTENCE_LENGTH * sentence_length
+                          - FRE_SYLLABLES_PER_WORD * syllables_per_word, 2)
+    return np.where(words > 0, scores, 0.0)
+
+
+class SyllableTable:
+    """
+    A bounded table of syllable counts per word, shared by every section scored in the process.
+
+    Counts are computed with textstat's pyphen dictionary the first time a word is seen. When the table is full,
+    the half of the words seen in the fewest sections is dropped. The table can be saved to and loaded from a CSV
+    file so later runs start warm.
+
+    Attributes:
+    ----------
+    max_words : int
+        Maximum number of words kept.
+    path : str
+        CSV file the table is loaded from and saved to, or None to keep it in memory only.
+    """
+
+    def __init__(self, max_words=500000, path=None):
+        """
+        Constructs all the necessary attributes for the SyllableTable object.
+
+        Parameters:
+        ----------
+        max_words : int
+            Maximum number of words kept.
+        path : str
+            CSV file the table is loaded from and saved to, or None to keep it in memory only.
+        """
+        self.max_words = max_words
+        self.path = path
+        self.syllables = {}
+        self.uses = {}
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            table = pd.read_csv(path, keep_default_na=False, dtype={'word': str})
+            self.syllables = dict(zip(table['word'], table['syllables'].astype(int)))
+            self.uses = dict(zip(table['word'], table['uses'].astype(int)))
+            logging.info(f"Loaded {len(self.syllables)} syllable counts from {path}")
+
+    @staticmethod
+    def count(word):
+        """
+        Counts the syllables of one word as textstat.syllable_count does.
+        """
+        return len(textstat.pyphen.positions(word)) + 1
+
+    def lookup(self, words):
+        """
+        Returns the syllable counts of distinct words, computing and storing the missing ones.
+
+        Parameters:
+        ----------
+        words : iterable
+            Distinct lowercase words without punctuation.
+
+        Returns:
+        -------
+        np.ndarray
+            The syllable count of every word.
+        """
+        counts = []
+        for word in words:
+            syllables = self.syllables.get(word)
+            if syllables is None:
+                syllables = self.syllables[word] = self.count(word)
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.uses[word] = self.uses.get(word, 0) + 1
+            counts.append(syllables)
+        if len(self.syllables) > self.max_words:
+            self._evict()
+        return np.array(counts, dtype=np.int64)
+
+    def _evict(self):
+        keep = sorted(self.uses, key=self.uses.get, reverse=True)[:self.max_words // 2]
+        self.syllables = {word: self.syllables[word] for word in keep}
+        self.uses = {word: self.uses[word] for word in keep}
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        words = list(self.syllables)
+        pd.DataFrame({'word': words, 'syllables': [self.syllables[word] for word in words],
+                      'uses': [self.uses.get(word, 0) for word in words]}).to_csv(path, index=False)
+        logging.info(f"Saved {len(words)} syllable counts to {path}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"words": len(self.syllables), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class ReadabilityEngine:
+    """
+    A class to compute Flesch reading ease scores of tokenized sections from word, sentence and syllable totals.
+
+    Every token of a section is mapped to its syllable count in one pass over its distinct words, so the scores of
+    all chunks and of the whole section come from sums over arrays instead of re-reading the text. The scores match
+    textstat.flesch_reading_ease on the chunk texts. Preprocessed sections have no punctuation left, so textstat
+    counts every chunk as a single sentence, and so does the engine.
+
+    Attributes:
+    ----------
+    syllable_table : SyllableTable
+        The shared syllable counts.
+    """
+
+    def __init__(self, syllable_table=None):
+        self.syllable_table = syllable_table if syllable_table is not None else SyllableTable()
+
+    def token_syllables(self, section):
+        """
+        Returns the syllable count of every token of a TokenizedSection.
+        """
+        if not len(section):
+            return np.zeros(0, dtype=np.int64)
+        codes, words = pd.factorize(pd.Series(section.tokens, dtype=object))
+        return self.syllable_table.lookup(words)[codes]
+
+    def totals(self, section, max_length=512):
+        """
+        Returns the word, sentence and syllable totals of every chunk of at most max_length tokens.
+
+        Returns:
+        -------
+        tuple
+            Words, sentences and syllables, one entry per chunk.
+        """
+        if not len(section):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        starts = np.arange(0, len(section), max_length)
+        words = np.diff(np.append(starts, len(section)))
+        syllables = np.add.reduceat(self.token_syllables(section), starts)
+        return words, np.ones(len(starts), dtype=np.int64), syllables
+
+    def chunk_scores(self, section, max_length=512):
+        """
+        Returns the Flesch reading ease of every chunk of at most max_length tokens.
+        """
+        return flesch_reading_ease_from_totals(*self.totals(section, max_length))
+
+    def section_score(self, section, max_length=512):
+        """
+        Returns the Flesch reading ease of the whole section, from the totals of its chunks.
+        """
+        words, sentences, syllables = self.totals(section, max_length)
+        return float(flesch_reading_ease_from_totals(words.sum(), sentences.sum(), syllables.sum()))
@@ -0,0 +1,138 @@
+import logging
+import os
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+class ParquetResultSink:
+    """
+    An append-only sink writing result rows to a Parquet dataset partitioned by year (root/year=2020/part-*.parquet).
+
+    Rows are buffered and written as new files, never rewriting earlier ones. Every file is written under a hidden
+    temporary name and renamed into place, so readers and resumed runs only ever see complete files.
+
+    Attributes:
+    ----------
+    root : str
+        Directory of the dataset.
+    partition_column : str
+        Column whose values name the partitions.
+    batch_rows : int
+        Number of buffered rows that triggers a write.
+    """
+
+    def __init__(self, root, partition_column='year', batch_rows=1000):
+        """
+        Constructs all the necessary attributes for the ParquetResultSink object.
+
+        Parameters:
+        ----------
+        root : str
+            Directory of the dataset, created if it does not exist.
+        partition_column : str
+            Column whose values name the partitions.
+        batch_rows : int
+            Number of buffered rows that triggers a write.
+        """
+        self.root = root
+        self.partition_column = partition_column
+        self.batch_rows = batch_rows
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.files_written = 0
+        self.rows_written = 0
+        self._rows = []
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, rows):
+        """
+        Buffers result rows (dictionaries) and writes them once batch_rows are buffered.
+        """
+        self._rows.extend(rows)
+        if len(self._rows) >= self.batch_rows:
+            self.flush()
+
+    @staticmethod
+    def _to_table(frame):
+        # Numbers are stored as float64 and everything else as strings, so files written from batches where a
+        # column happened to be integer still share one schema. Empty columns stay untyped (null) and take the type
+        # of the other files when the dataset is read
+        for column in frame.columns:
+            if frame[column].isna().all():
+                frame[column] = frame[column].astype(object)
+            elif pd.api.types.is_numeric_dtype(frame[column]):
+                frame[column] = frame[column].astype('float64')
+            else:
+                frame[column] = frame[column].astype('string')
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def flush(self):
+        """
+        Writes the buffered rows, one new file per partition.
+        """
+        if not self._rows:
+            return
+        frame = pd.DataFrame(self._rows)
+        if self.partition_column not in frame:
+            raise ValueError(f"Result rows need a '{self.partition_column}' column")
+        for value, partition in frame.groupby(self.partition_column, sort=True):
+            directory = os.path.join(self.root, f"{self.partition_column}={value}")
+            os.makedirs(directory, exist_ok=True)
+            file_name = f"part-{self.run_id}-{self.files_written:05d}.parquet"
+            # Files starting with a dot are ignored by dataset readers until renamed
+            temporary_path = os.path.join(directory, f".{file_name}.tmp")
+            pq.write_table(self._to_table(partition.drop(columns=[self.partition_column])), temporary_path)
+            os.replace(temporary_path, os.path.join(directory, file_name))
+            self.files_written += 1
+            self.rows_written += len(partition)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        logging.info(f"Wrote {self.rows_written} result rows in {self.files_written} files to {self.root}")
+
+
+def open_result_dataset(root, partition_column='year'):
+    """
+    Opens a dataset written by ParquetResultSink lazily; only file footers are read.
+
+    Files written from different batches may have different columns, so the dataset uses their unified schema.
+
+    Returns:
+    -------
+    pyarrow.dataset.Dataset
+        The dataset, with the partition column typed as an integer.
+    """
+    partitioning = ds.partitioning(pa.schema([(partition_column, pa.int32())]), flavor='hive')
+    dataset = ds.dataset(root, format='parquet', partitioning=partitioning)
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    if not schemas:
+        return dataset
+    schema = pa.unify_schemas(schemas + [partitioning.schema], promote_options='permissive')
+    return ds.dataset(root, schema=schema, format='parquet', partitioning=partitioning)
+
+
+def read_results(root, columns=None, filter=None, partition_column='year'):
+    """
+    Reads the selected columns and rows of a result dataset into a DataFrame.
+
+    Parameters:
+    ----------
+    root : str
+        Directory of the dataset.
+    columns : list
+        Columns to read, all when None.
+    filter : pyarrow.dataset.Expression
+        Row filter, e.g. ds.field('year') == 2020, which also skips the other partitions.
+
+    Returns:
+    -------
+    pd.DataFrame
+        The selected results.
+    """
+    dataset = open_result_dataset(root, partition_column)
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
@@ -0,0 +1,189 @@
+import logging
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+FETCHED = 'fetched'
+PARSED = 'parsed'
+SCORED = 'scored'
+FAILED = 'failed'
+STATES = (PENDING, FETCHED, PARSED, SCORED, FAILED)
+
+
+class RunManifest:
+    """
+    A transactional record of a corpus run, stored in SQLite, so a crashed or restarted job resumes where it stopped.
+
+    Every (CIK, accession) filing moves through pending -> fetched -> parsed -> scored, or to failed with the error.
+    (CIK, year) work items are marked once their filings have been listed, so a resumed run does not list them again.
+    Work items whose listing failed stay unlisted and are retried by later runs, up to max_attempts times.
+
+    Attributes:
+    ----------
+    path : str
+        Path of the SQLite database.
+    max_attempts : int
+        Number of attempts after which a failed filing or work item listing is no longer retried.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        """
+        Constructs all the necessary attributes for the RunManifest object.
+
+        Parameters:
+        ----------
+        path : str
+            Path of the SQLite database, created if it does not exist.
+        max_attempts : int
+            Number of attempts after which a failed filing or work item listing is no longer retried.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.start_time = time.time()
+        self._scored_at_start = None
+        self._lock = threading.Lock()
+        # Worker processes of a sharded run share the manifest, so writers wait for each other's transactions
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS filings (cik TEXT NOT NULL, accession TEXT NOT NULL, '
+                                     'year INTEGER, filing_date TEXT, primary_document TEXT, state TEXT NOT NULL, '
+                                     'attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated REAL NOT NULL, '
+                                     'PRIMARY KEY (cik, accession))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS work_items (cik TEXT NOT NULL, year INTEGER NOT NULL, '
+                                     'listed REAL NOT NULL, PRIMARY KEY (cik, year))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS listing_failures (cik TEXT NOT NULL, '
+                                     'year INTEGER NOT NULL, attempts INTEGER NOT NULL, error TEXT, '
+                                     'updated REAL NOT NULL, PRIMARY KEY (cik, year))')
+        self._scored_at_start = self.counts()[SCORED]
+
+    def is_listed(self, cik_code, year):
+        """
+        Returns True when the filings of the (CIK, year) work item were already added to the manifest.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT 1 FROM work_items WHERE cik = ? AND year = ?',
+                                           (str(cik_code), int(year))).fetchone()
+        return row is not None
+
+    def can_list(self, cik_code, year):
+        """
+        Returns True when listing the filings of the (CIK, year) work item has attempts left.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT attempts FROM listing_failures WHERE cik = ? AND year = ?',
+                                           (str(cik_code), int(year))).fetchone()
+        return row is None or row[0] < self.max_attempts
+
+    def mark_listing_failed(self, cik_code, year, error=None):
+        """
+        Records a failed listing of the (CIK, year) work item, which stays unlisted so a later run lists it again.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT INTO listing_failures VALUES (?, ?, 1, ?, ?) ON CONFLICT (cik, year) '
+                'DO UPDATE SET attempts = attempts + 1, error = excluded.error, updated = excluded.updated',
+                (str(cik_code), int(year), error, time.time()))
+
+    def add_filings(self, cik_code, year, submissions):
+        """
+        Adds the filings of a (CIK, year) work item as pending and marks the work item as listed, in one transaction.
+
+        Parameters:
+        ----------
+        cik_code : str
+            The CIK code of the company.
+        year : int
+            The year of the work item.
+        submissions : list
+            The filings, as returned by SECScraper.get_10_k_descriptions.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO filings (cik, accession, year, filing_date, primary_document, state, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(str(cik_code), submission['accessionNumber'], int(year), submission['filingDate'],
+                  submission.get('primaryDocument'), PENDING, now) for submission in submissions])
+            self._connection.execute('INSERT OR REPLACE INTO work_items VALUES (?, ?, ?)', (str(cik_code), int(year), now))
+
+    def mark(self, cik_code, accession_number, state, error=None):
+        """
+        Moves a filing to a new state. Failures increase its attempt count and keep the error message.
+        """
+        if state not in STATES:
+            raise ValueError(f"Unknown state {state}")
+        with self._lock, self._connection:
+            self._connection.execute(
+                'UPDATE filings SET state = ?, error = ?, updated = ?, attempts = attempts + ? '
+                'WHERE cik = ? AND accession = ?',
+                (state, error, time.time(), int(state == FAILED), str(cik_code), accession_number))
+
+    def mark_many(self, filings, state):
+        """
+        Moves several (CIK, accession) filings to the same state in one transaction.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany('UPDATE filings SET state = ?, error = NULL, updated = ? '
+                                         'WHERE cik = ? AND accession = ?',
+                                         [(state, now, str(cik_code), accession) for cik_code, accession in filings])
+
+    def filings_to_process(self, cik_code, year):
+        """
+        Returns the filings of a (CIK, year) work item that are not scored yet and have attempts left.
+
+        Returns:
+        -------
+        list
+            One dictionary per filing, with the keys of SECScraper.get_10_k_descriptions.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT accession, filing_date, primary_document FROM filings WHERE cik = ? AND year = ? '
+                'AND state != ? AND attempts < ? ORDER BY filing_date',
+                (str(cik_code), int(year), SCORED, self.max_attempts)).fetchall()
+        return [{'accessionNumber': accession, 'filingDate': filing_date, 'primaryDocument': primary_document}
+                for accession, filing_date, primary_document in rows]
+
+    def counts(self):
+        """
+        Returns the number of filings in each state.
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT state, COUNT(*) FROM filings GROUP BY state').fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def progress(self):
+        """
+        Returns the filing counts per state, the scoring rate of this run and the estimated time left.
+
+        Returns:
+        -------
+        dict
+            Counts per state, 'total', 'rate' (filings scored per second in this run) and 'eta' (seconds).
+        """
+        counts = self.counts()
+        total = sum(counts.values())
+        elapsed = time.time() - self.start_time
+        rate = (counts[SCORED] - self._scored_at_start) / elapsed if elapsed > 0 else 0.0
+        # Failed filings with attempts left are retried, the others will not be processed again
+        with self._lock:
+            exhausted = self._connection.execute('SELECT COUNT(*) FROM filings WHERE state = ? AND attempts >= ?',
+                                                 (FAILED, self.max_attempts)).fetchone()[0]
+        remaining = total - counts[SCORED] - exhausted
+        eta = remaining / rate if rate > 0 else None
+        return {**counts, "total": total, "rate": rate, "eta": eta}
+
+    def log_progress(self):
+        progress = self.progress()
+        eta = f"{progress['eta'] / 3600:.1f} h" if progress['eta'] is not None else 'unknown'
+        logging.info(f"Run manifest: {progress[SCORED]}/{progress['total']} filings scored, "
+                     f"{progress[FAILED]} failed, {progress['rate'] * 3600:.0f} filings/h, ETA {eta}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
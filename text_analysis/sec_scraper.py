@@ -1,18 +1,44 @@
+import json
 import random
 import string
-import sys
-from retrying import retry, RetryError
+from retrying import RetryError
+import pandas as pd
 import requests
 import logging
 import os
-import re
+import threading
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from text_analysis.utils import rate_limiter
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from text_analysis.cik_resolver import CIKResolver, strip_company_suffix
+from text_analysis.document_stream import TenKDocumentParser, extract_ten_k_document
+from text_analysis.filing_index import FilingIndex
+from text_analysis.sec_transport import mount_transport
+from text_analysis.rate_governor import RateGovernor, RejectedError, ThrottledError, governed_request, \
+    parse_retry_after
+from text_analysis.telemetry import telemetry
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
+# Submissions indexes grow with every new filing, so cached copies are refreshed after this many seconds
+SUBMISSIONS_MAX_AGE = int(os.getenv("SUBMISSIONS_MAX_AGE", 24 * 60 * 60))
+
+# SEC fair access policy: at most 10 requests per second from the host, shared by every process running on it
+SEC_MAX_REQUESTS_PER_SECOND = 10
+sec_rate_governor = RateGovernor(SEC_MAX_REQUESTS_PER_SECOND)
+# Attempts per request, and (connect, read) timeouts so a stalled connection cannot hang a worker
+SEC_MAX_ATTEMPTS = int(os.getenv("SEC_MAX_ATTEMPTS", 3))
+SEC_REQUEST_TIMEOUT = (float(os.getenv("SEC_CONNECT_TIMEOUT", 10)), float(os.getenv("SEC_READ_TIMEOUT", 60)))
+
+_shared_session = None
+_session_lock = threading.Lock()
+
+
+def scraper_governor(scraper, *args, **kwargs):
+    return scraper.governor
+
 
 def generate_random_string(length):
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
@@ -51,12 +77,47 @@ def generate_headers():
     return headers
 
 
+def create_session(pool_size=16):
+    """
+    Creates a requests session that keeps up to pool_size connections alive per host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Records EDGAR responses or replays them from a local stand-in when SEC_TRANSPORT asks for it
+    return mount_transport(session, pool_size=pool_size)
+
+
+def get_shared_session():
+    """
+    Returns the process-wide pooled session, creating it on first use.
+    """
+    global _shared_session
+    with _session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
 class SECScraper:
-    def __init__(self):
+    def __init__(self, cache=None, offline=False, session=None, governor=None):
+        """
+        :param cache: FilingCache used for submissions and filings, or None to always download
+        :param offline: serve only from the cache and never touch the network
+        :param session: requests session to send requests through, defaults to the shared pooled session
+        :param governor: RateGovernor the requests draw from, defaults to the host-wide sec_rate_governor
+        """
+        if offline and cache is None:
+            raise ValueError("Offline mode needs a FilingCache")
         self.headers = generate_headers()
         self.cookies = generate_cookies_submissions()
         self.base_url = 'https://data.sec.gov'
         self.cik_code = None
+        self.cache = cache
+        self.offline = offline
+        self.session = session or get_shared_session()
+        self.governor = governor or sec_rate_governor
 
 
     def setup_request(self, endpoint):
@@ -69,24 +130,21 @@ class SECScraper:
             headers = self.headers
         return cookies, headers
 
-    @retry(stop_max_attempt_number=3, wait_fixed=1000)
+    @governed_request(scraper_governor, max_attempts=SEC_MAX_ATTEMPTS)
     def _lookup_company_name(self, company_name):
         url = 'https://www.sec.gov/cgi-bin/cik_lookup'
         data = {'company': company_name}
         cookies, headers = self.setup_request('cik_lookup')
-        response = requests.post(url, cookies=cookies, headers=headers, data=data)
-        if response.status_code != 200:
-            raise RetryError(f"Error in company {company_name}: {response.status_code}")
+        with telemetry.span('sec_request', kind='cik_lookup'):
+            response = self.session.post(url, cookies=cookies, headers=headers, data=data,
+                                         timeout=SEC_REQUEST_TIMEOUT)
+        self._record_response('cik_lookup', response.status_code, len(response.content))
+        self._check_response(response, company_name)
         return response.text
 
-    @rate_limiter(10)
     def lookup_company_name(self, company_name):
         # check if company has ending /DE/ or /TX/ etc. and remove it
-        expression = r'(.+?)(\([^\)]*\)|/[A-Z]{2,3}/?|(US MARKET AGGREGATE)|(THE)|,|\.)'
-        match = re.match(expression, company_name)
-        if match:
-            company_name = match.group(1)
-            # logging.info(f"Removed ending from company name: {company_name}")
+        company_name = strip_company_suffix(company_name)
 
         try:
             response = self._lookup_company_name(company_name)
@@ -95,82 +153,215 @@ class SECScraper:
             cik_code_strip_zeros = cik_code.lstrip('0')
             return cik_code_strip_zeros
         except (RetryError, ConnectionError) as e:
-            logging.error(f"Failed to fetch data for company {company_name} after 3 retries: {e}")
+            logging.error(f"Failed to fetch data for company {company_name}: {e}")
             return None
 
-    @retry(stop_max_attempt_number=3, wait_fixed=1000)
-    def _download_submissions_response(self, endpoint):
+    def lookup_company_names(self, company_names, resolver=None):
+        """
+        Resolves a column of company names to CIK codes. Uses the local EDGAR company list (a CIKResolver, or the
+        file at CIK_LOOKUP_PATH) when available, and one cik_lookup request per company otherwise.
+        :param company_names: pd.Series of company names
+        :param resolver: CIKResolver to use instead of loading CIK_LOOKUP_PATH
+        :return: pd.Series of CIK codes aligned with company_names, None when unresolved
+        """
+        if resolver is None and os.getenv("CIK_LOOKUP_PATH"):
+            resolver = CIKResolver.from_file()
+        if resolver is not None:
+            return resolver.resolve_series(company_names)
+
+        cik_codes = []
+        for company in tqdm(company_names.tolist()):
+            cik_code = self.lookup_company_name(company)
+            if cik_code == 'Perform another Company-CIK Lookup.':
+                cik_code = None
+            cik_codes.append(cik_code)
+        return pd.Series(cik_codes, index=company_names.index, dtype=object)
+
+    @governed_request(scraper_governor, max_attempts=SEC_MAX_ATTEMPTS)
+    def _download_submissions_response(self, endpoint, file_name=None):
         # add initial zeros to the cik_code to make it 10 characters long
         cik_code_long = str(self.cik_code).zfill(10)
-        url = f'{self.base_url}/{endpoint}/CIK{cik_code_long}.json'
+        # Older filings are listed in extra pages such as CIK##########-submissions-001.json
+        url = f'{self.base_url}/{endpoint}/{file_name or f"CIK{cik_code_long}.json"}'
         cookies, headers = self.setup_request(endpoint)
-        response = requests.get(url, cookies=cookies, headers=headers)
+        with telemetry.span('sec_request', kind='submissions', cik=self.cik_code, url=url):
+            response = self.session.get(url, cookies=cookies, headers=headers, timeout=SEC_REQUEST_TIMEOUT)
+        self._record_response('submissions', response.status_code, len(response.content))
         # Check if the response is valid
-        if response.status_code != 200:
-            raise RetryError(f"Error in company {self.cik_code}: {response.status_code}")
-        response_size = sys.getsizeof(response.content)
-        # logging.info(f"Downloaded {response_size/1024:.2f} KB for company {self.cik_code}")
+        self._check_response(response, self.cik_code)
         return response.json()
 
-    def get_submissions(self, endpoint="submissions"):
+    def get_submissions_json(self, endpoint="submissions", file_name=None):
         """
-        Extracts all submissions for a given company
+        Returns the submissions JSON of the company, or one of its extra pages when file_name is given
         :param endpoint:
+        :param file_name: name of an extra page listed in 'filings' -> 'files'
         :return:
         """
+        document_id = file_name or endpoint
+        # Extra pages only list old filings and never change, the main index is refreshed periodically
+        max_age = None if file_name else SUBMISSIONS_MAX_AGE
+        response = self._get_cached(self.cik_code, document_id, max_age=max_age)
+        if response is not None:
+            return json.loads(response)
+        if self.offline:
+            logging.warning(f"Submissions {document_id} of company {self.cik_code} are not in the filing cache")
+            return None
         try:
-            response = self._download_submissions_response(endpoint)
-            # Extract the 'filings' -> 'recent' data
-            submissions = response['filings']['recent']
-            return submissions
+            response = self._download_submissions_response(endpoint, file_name)
         except (RetryError, ConnectionError) as e:
-            logging.error(f"Failed to fetch data for company {self.cik_code} after 3 retries: {e}")
+            logging.error(f"Failed to fetch data for company {self.cik_code}: {e}")
+            return None
+        if self.cache is not None:
+            self.cache.put(self.cik_code, document_id, json.dumps(response), kind='json')
+        return response
+
+    def get_submissions(self, endpoint="submissions"):
+        """
+        Extracts all submissions for a given company
+        :param endpoint:
+        :return:
+        """
+        response = self.get_submissions_json(endpoint)
+        if response is None:
             return None
+        # Extract the 'filings' -> 'recent' data
+        submissions = response['filings']['recent']
+        return submissions
+
+    def _get_cached(self, cik_code, document_id, kind='json', max_age=None):
+        """
+        Looks a download up in the cache. Age limits are ignored offline, where the cache is the only source.
+        """
+        if self.cache is None:
+            return None
+        cached = self.cache.get(cik_code, document_id, kind=kind, max_age=None if self.offline else max_age)
+        telemetry.count('filing_cache_lookups_total', kind=kind, status='miss' if cached is None else 'hit')
+        return cached
+
+    @staticmethod
+    def _check_response(response, subject):
+        """
+        Raises ThrottledError for responses asking to slow down, RejectedError for other client errors, which a
+        retry would not fix, and RetryError for other failed responses.
+        """
+        if response.status_code in (429, 503):
+            raise ThrottledError(response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+        if 400 <= response.status_code < 500:
+            raise RejectedError(response.status_code, f"Error in company {subject}: {response.status_code}")
+        if response.status_code != 200:
+            raise RetryError(f"Error in company {subject}: {response.status_code}")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=1000)
+    @staticmethod
+    def _record_response(kind, status_code, num_bytes):
+        # Every attempt is counted, so failed attempts that were retried show up as non-200 statuses
+        telemetry.count('sec_requests_total', kind=kind, status=status_code)
+        telemetry.count('sec_bytes_downloaded_total', num_bytes, kind=kind)
+
+    @governed_request(scraper_governor, max_attempts=SEC_MAX_ATTEMPTS)
     def _download_10k_response(self, endpoint):
         url = f'https://www.sec.gov/{endpoint}'
         cookies, headers = self.setup_request(endpoint)
-        response = requests.get(url, cookies=cookies, headers=headers)
-
-        if response.status_code != 200:
-            raise RetryError(f"Error in company {self.cik_code}: {response.status_code}")
+        with telemetry.span('sec_request', kind='document', cik=self.cik_code, url=url):
+            response = self.session.get(url, cookies=cookies, headers=headers, timeout=SEC_REQUEST_TIMEOUT)
+        self._record_response('document', response.status_code, len(response.content))
+        self._check_response(response, self.cik_code)
         return response.text
 
-    def get_10_k_descriptions(self, cik_code, date_start, date_end):
+    def get_10_k_descriptions(self, cik_code, date_start, date_end, forms=('10-K',)):
         """
         Extracts only the 10-K descriptions for a given company, within a given date range
         :param cik_code:
-        :return:
+        :param forms: form types to keep, see filing_index.TEN_K_FORMS for the whole 10-K family
+        :return: list of filings, empty when the company filed none in the range, or None when the submissions
+            could not be fetched (failed request, unknown company, or a cache miss offline)
         """
-
         self.cik_code = cik_code
-        submissions = self.get_submissions()
+        filing_index = FilingIndex.for_company(cik_code, self)
 
-        if submissions is None:
+        if filing_index is None:
             return None
 
-        ten_k_filings = [
-            {'accessionNumber': submissions['accessionNumber'][i],
-             'filingDate': submissions['filingDate'][i],
-             'primaryDocument': submissions['primaryDocument'][i],
-             'primaryDocDescription': submissions['primaryDocDescription'][i]}
-            for i in range(len(submissions['form']))
-            if submissions['form'][i].lower() == '10-k'
-               and date_start <= submissions['filingDate'][i] <= date_end]
-
-        return ten_k_filings
+        return filing_index.query(date_start, date_end, forms)
 
     def download_10k(self, cik_code, accession_number):
         self.cik_code = cik_code
-        endpoint = f'/Archives/edgar/data/{cik_code}/{accession_number.replace('-', '')}/{accession_number}.txt'
+        cached = self._get_cached(cik_code, accession_number, kind='full')
+        if cached is not None:
+            return cached
+        if self.offline:
+            logging.warning(f"Filing {accession_number} of company {cik_code} is not in the filing cache")
+            return None
+
+        endpoint = f'/Archives/edgar/data/{cik_code}/{accession_number.replace("-", "")}/{accession_number}.txt'
         try:
             response = self._download_10k_response(endpoint)
-            return response
         except (RetryError, ConnectionError) as e:
-            logging.error(f"Failed to fetch data for company {cik_code} after 3 retries: {e}")
+            logging.error(f"Failed to fetch data for company {cik_code}: {e}")
+            return None
+        if self.cache is not None:
+            self.cache.put(cik_code, accession_number, response, kind='full')
+        return response
+
+
+    @governed_request(scraper_governor, max_attempts=SEC_MAX_ATTEMPTS)
+    def _stream_10k_response(self, endpoint):
+        url = f'https://www.sec.gov/{endpoint}'
+        cookies, headers = self.setup_request(endpoint)
+        parser = TenKDocumentParser()
+        with telemetry.span('sec_request', kind='stream', cik=self.cik_code, url=url), \
+                self.session.get(url, cookies=cookies, headers=headers, stream=True,
+                                 timeout=SEC_REQUEST_TIMEOUT) as response:
+            if response.status_code != 200:
+                self._record_response('stream', response.status_code, 0)
+                self._check_response(response, self.cik_code)
+            response.encoding = response.encoding or 'utf-8'
+            # Stop reading as soon as the 10-K document is complete, the exhibits that follow are never downloaded
+            for chunk in response.iter_content(chunk_size=64 * 1024, decode_unicode=True):
+                if parser.feed(chunk):
+                    break
+        self._record_response('stream', response.status_code, parser.bytes_read)
+        logging.debug(f"Read {parser.bytes_read / 1024:.0f} KB of {endpoint}")
+        return parser.document
+
+    def download_10k_document(self, cik_code, accession_number, primary_document=None):
+        """
+        Downloads only the 10-K document of a filing: the primary document when it is known, otherwise the full
+        submission streamed up to the end of the 10-K
+        :param cik_code:
+        :param accession_number:
+        :param primary_document: file name of the primary document, as listed in the submissions index
+        :return: the 10-K document, or None when it could not be fetched
+        """
+        self.cik_code = cik_code
+        cached = self._get_cached(cik_code, accession_number, kind='10-K')
+        if cached is not None:
+            return cached
+        # A complete submission cached by download_10k already holds the 10-K
+        cached = self._get_cached(cik_code, accession_number, kind='full')
+        if cached is not None:
+            return extract_ten_k_document(cached)
+        if self.offline:
+            logging.warning(f"Filing {accession_number} of company {cik_code} is not in the filing cache")
             return None
 
+        folder = f'/Archives/edgar/data/{cik_code}/{accession_number.replace("-", "")}'
+        document = None
+        if primary_document and primary_document.lower().endswith(('.htm', '.html', '.txt')):
+            try:
+                document = self._download_10k_response(f'{folder}/{primary_document}')
+            except (RetryError, ConnectionError) as e:
+                logging.warning(f"Failed to fetch primary document {primary_document} of company {cik_code}, "
+                                f"falling back to the full submission: {e}")
+        if document is None:
+            try:
+                document = self._stream_10k_response(f'{folder}/{accession_number}.txt')
+            except (RetryError, ConnectionError) as e:
+                logging.error(f"Failed to fetch data for company {cik_code}: {e}")
+                return None
+        if document is not None and self.cache is not None:
+            self.cache.put(cik_code, accession_number, document, kind='10-K')
+        return document
 
 if __name__ == '__main__':
     # Example of extracting 10-K descriptions
@@ -0,0 +1,416 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from text_analysis.utils import TokenBucket
+
+load_dotenv()
+
+LIVE_TRANSPORT = 'live'
+RECORD_TRANSPORT = 'record'
+REPLAY_TRANSPORT = 'replay'
+TRANSPORTS = (LIVE_TRANSPORT, RECORD_TRANSPORT, REPLAY_TRANSPORT)
+# Hosts the scraper talks to; only their requests are recorded or routed to the stand-in
+SEC_HOSTS = ('data.sec.gov', 'www.sec.gov')
+# Response headers worth replaying. The archived body is already decoded, so encoding headers are dropped
+REPLAYED_HEADERS = ('content-type', 'last-modified', 'etag')
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def request_digest(body):
+    if not body:
+        return ''
+    return hashlib.sha256(body if isinstance(body, bytes) else body.encode('utf-8')).hexdigest()
+
+
+class ResponseArchive:
+    """
+    An SQLite archive of HTTP responses keyed by method, URL and request body, e.g. recorded from EDGAR.
+
+    Bodies are stored decoded and gzip-compressed, with the status and the headers needed to replay them.
+
+    Attributes:
+    ----------
+    path : str
+        Path of the SQLite database.
+    """
+
+    def __init__(self, path=None):
+        """
+        Constructs all the necessary attributes for the ResponseArchive object.
+
+        Parameters:
+        ----------
+        path : str
+            Path of the archive. Defaults to SEC_ARCHIVE_PATH, or BASE_PATH/data/sec_archive.sqlite.
+        """
+        self.path = path or os.getenv("SEC_ARCHIVE_PATH") or f'{os.getenv("BASE_PATH")}/data/sec_archive.sqlite'
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses (method TEXT NOT NULL, url TEXT NOT NULL, '
+                                     'body_digest TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, '
+                                     'content BLOB NOT NULL, recorded REAL NOT NULL, '
+                                     'PRIMARY KEY (method, url, body_digest))')
+
+    @classmethod
+    def shared(cls, path=None):
+        """
+        Returns one archive per path for the whole process, so every session records through the same connection.
+        """
+        with _archives_lock:
+            key = path or os.getenv("SEC_ARCHIVE_PATH")
+            if key not in _archives:
+                _archives[key] = cls(path)
+            return _archives[key]
+
+    def put(self, method, url, status, headers, content, body=None):
+        """
+        Stores a response, replacing an earlier one for the same request.
+
+        Parameters:
+        ----------
+        method : str
+            HTTP method of the request.
+        url : str
+            Full URL of the request, with its query.
+        status : int
+            HTTP status of the response.
+        headers : dict
+            Response headers; only those in REPLAYED_HEADERS are kept.
+        content : bytes
+            Decoded response body.
+        body : bytes
+            Body of the request, for POST requests.
+        """
+        headers = {name.lower(): value for name, value in headers.items() if name.lower() in REPLAYED_HEADERS}
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                     (method.upper(), url, request_digest(body), status, json.dumps(headers),
+                                      gzip.compress(content, compresslevel=6), time.time()))
+
+    def get(self, method, url, body=None):
+        """
+        Returns (status, headers, content) of the archived response, or None when the request was not recorded.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT status, headers, content FROM responses WHERE method = ? '
+                                           'AND url = ? AND body_digest = ?',
+                                           (method.upper(), url, request_digest(body))).fetchone()
+        if row is None:
+            return None
+        status, headers, content = row
+        return status, json.loads(headers), gzip.decompress(content)
+
+    def urls(self, method='GET'):
+        """
+        Returns the URLs of every archived request of the given method.
+        """
+        with self._lock:
+            return [url for url, in self._connection.execute('SELECT url FROM responses WHERE method = ? ORDER BY url',
+                                                             (method,))]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    A requests transport adapter that sends requests to the live servers and archives every response.
+
+    Streamed responses are read completely before they are archived, so recording downloads whole submissions even
+    where the scraper would stop at the end of the 10-K. Throttling and server errors (429, 5xx) are not archived,
+    they would be replayed as failures forever.
+    """
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code != 429 and response.status_code < 500:
+            self.archive.put(request.method, request.url, response.status_code, response.headers, response.content,
+                             body=request.body)
+        return response
+
+
+class StandInAdapter(HTTPAdapter):
+    """
+    A requests transport adapter that routes requests for the SEC hosts to an EdgarStandIn server.
+
+    https://data.sec.gov/submissions/CIK0000320193.json is sent as <base_url>/data.sec.gov/submissions/... so one
+    server stands in for every host.
+    """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f'{self.base_url}/{parts.netloc}{parts.path}' + (f'?{parts.query}' if parts.query else '')
+        return super().send(request, **kwargs)
+
+
+def mount_transport(session, mode=None, archive_path=None, stand_in_url=None, pool_size=16):
+    """
+    Mounts the configured transport for the SEC hosts on a requests session.
+
+    Parameters:
+    ----------
+    session : requests.Session
+        The session to configure.
+    mode : str
+        'live' sends requests to EDGAR, 'record' sends them to EDGAR and archives the responses, 'replay' sends them
+        to a local EdgarStandIn. Defaults to SEC_TRANSPORT, or 'live'.
+    archive_path : str
+        Archive the responses are recorded to. Defaults to SEC_ARCHIVE_PATH.
+    stand_in_url : str
+        Base URL of the stand-in server. Defaults to SEC_STAND_IN_URL.
+    pool_size : int
+        Connections kept alive per host.
+
+    Returns:
+    -------
+    requests.Session
+        The session.
+    """
+    mode = mode or os.getenv("SEC_TRANSPORT", LIVE_TRANSPORT)
+    if mode not in TRANSPORTS:
+        raise ValueError(f"Unknown SEC transport {mode}, expected one of {TRANSPORTS}")
+    if mode == RECORD_TRANSPORT:
+        adapter = RecordingAdapter(ResponseArchive.shared(archive_path), pool_connections=4, pool_maxsize=pool_size)
+    elif mode == REPLAY_TRANSPORT:
+        stand_in_url = stand_in_url or os.getenv("SEC_STAND_IN_URL")
+        if not stand_in_url:
+            raise ValueError("The replay transport needs the URL of the stand-in server (SEC_STAND_IN_URL)")
+        adapter = StandInAdapter(stand_in_url, pool_connections=4, pool_maxsize=pool_size)
+    else:
+        return session
+    for host in SEC_HOSTS:
+        session.mount(f'https://{host}/', adapter)
+    return session
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like EDGAR, so the scraper's connection pool behaves as in production
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.stand_in.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.stand_in.handle(self, 'POST')
+
+    def log_message(self, format, *args):
+        logging.debug(f"Stand-in: {format % args}")
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping kept-alive or streamed connections are expected, not errors
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class EdgarStandIn:
+    """
+    A local HTTP server replaying archived EDGAR responses with configurable latency, throttling and bandwidth.
+
+    Requests arrive as /<host>/<path> (see StandInAdapter) and are answered from a ResponseArchive, or with a 404
+    when they were never recorded. Requests beyond max_requests_per_second get a 429 with a Retry-After header, as
+    EDGAR does, and error_rate adds random 429s on top.
+
+    Attributes:
+    ----------
+    archive : ResponseArchive
+        The archived responses.
+    latency : float
+        Seconds added before every response.
+    jitter : float
+        Upper bound of a random delay added to the latency.
+    max_requests_per_second : float
+        Request rate above which the server throttles, or None for no limit.
+    error_rate : float
+        Share of requests answered with a 429 regardless of the rate.
+    retry_after : int
+        Seconds sent in the Retry-After header of throttled responses.
+    bandwidth : float
+        Bytes per second per response, or None for no limit.
+    """
+
+    def __init__(self, archive, latency=0.0, jitter=0.0, max_requests_per_second=None, error_rate=0.0,
+                 retry_after=1, bandwidth=None, host='127.0.0.1', port=0, seed=0):
+        """
+        Constructs all the necessary attributes for the EdgarStandIn object.
+
+        Parameters:
+        ----------
+        archive : ResponseArchive
+            The archived responses.
+        latency : float
+            Seconds added before every response.
+        jitter : float
+            Upper bound of a random delay added to the latency.
+        max_requests_per_second : float
+            Request rate above which the server throttles, or None for no limit.
+        error_rate : float
+            Share of requests answered with a 429 regardless of the rate.
+        retry_after : int
+            Seconds sent in the Retry-After header of throttled responses.
+        bandwidth : float
+            Bytes per second per response, or None for no limit.
+        host : str
+            Interface the server listens on.
+        port : int
+            Port the server listens on, a free one when 0.
+        seed : int
+            Seed of the random delays and errors, so runs are reproducible.
+        """
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.bandwidth = bandwidth
+        self.bucket = TokenBucket(max_requests_per_second) if max_requests_per_second else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.not_found = 0
+        self.bytes_sent = 0
+        self._server = _StandInServer((host, port), _StandInHandler)
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _throttle(self):
+        if self.bucket is not None and not self.bucket.try_acquire():
+            return True
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def handle(self, handler, method):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        body = handler.rfile.read(int(handler.headers.get('Content-Length') or 0)) if method == 'POST' else None
+        time.sleep(delay)
+
+        if self._throttle():
+            with self._lock:
+                self.throttled += 1
+            self._respond(handler, 429, {'Retry-After': str(self.retry_after), 'Content-Type': 'text/plain'},
+                          b'Request Rate Threshold Exceeded')
+            return
+
+        host, _, path = handler.path.lstrip('/').partition('/')
+        archived = self.archive.get(method, f'https://{host}/{path}', body)
+        if archived is None:
+            with self._lock:
+                self.not_found += 1
+            self._respond(handler, 404, {'Content-Type': 'text/plain'}, b'Not Found')
+            return
+        status, headers, content = archived
+        self._respond(handler, status, headers, content)
+
+    def _respond(self, handler, status, headers, content):
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        chunk_size = 16 * 1024
+        try:
+            for start in range(0, len(content), chunk_size):
+                chunk = content[start:start + chunk_size]
+                handler.wfile.write(chunk)
+                if self.bandwidth:
+                    time.sleep(len(chunk) / self.bandwidth)
+                with self._lock:
+                    self.bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # The scraper closes streamed submissions once the 10-K is complete
+            handler.close_connection = True
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "not_found": self.not_found,
+                    "bytes_sent": self.bytes_sent}
+
+    def start(self):
+        """
+        Serves requests on a background thread and returns the base URL of the server.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name='edgar-stand-in', daemon=True)
+        self._thread.start()
+        logging.info(f"EDGAR stand-in serving {len(self.archive)} archived responses at {self.url}")
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Serves a recorded EDGAR archive locally (SEC_TRANSPORT=replay)')
+    parser.add_argument('--archive', help='archive recorded with SEC_TRANSPORT=record')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added before every response')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--max-requests-per-second', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of random 429 responses')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second per response')
+    args = parser.parse_args()
+
+    stand_in = EdgarStandIn(ResponseArchive(args.archive), latency=args.latency, jitter=args.jitter,
+                            max_requests_per_second=args.max_requests_per_second, error_rate=args.error_rate,
+                            bandwidth=args.bandwidth, port=args.port)
+    with stand_in:
+        print(f"Set SEC_TRANSPORT=replay and SEC_STAND_IN_URL={stand_in.url}")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
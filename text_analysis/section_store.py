@@ -0,0 +1,224 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SectionStore:
+    """
+    A persistent store of parsed 10-K sections keyed by (CIK, filing date, item), with a full-text index.
+
+    Section texts are kept zlib-compressed in SQLite, so a new model or a new Loughran-McDonald category can be run
+    over every stored filing without downloading and parsing it again. A contentless FTS5 table indexes the texts
+    for search without storing them a second time.
+
+    Attributes:
+    ----------
+    path : str
+        Path of the SQLite database.
+    full_text : bool
+        Whether sections are added to the full-text index.
+    """
+
+    def __init__(self, path=None, full_text=True):
+        """
+        Constructs all the necessary attributes for the SectionStore object.
+
+        Parameters:
+        ----------
+        path : str
+            Path of the store. Defaults to SECTION_STORE_PATH, or BASE_PATH/data/sections.sqlite.
+        full_text : bool
+            Whether sections are added to the full-text index. Ignored when SQLite is built without FTS5.
+        """
+        self.path = path or os.getenv("SECTION_STORE_PATH") or f'{os.getenv("BASE_PATH")}/data/sections.sqlite'
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS sections (id INTEGER PRIMARY KEY, '
+                                     'cik TEXT NOT NULL, filing_date TEXT NOT NULL, item TEXT NOT NULL, '
+                                     'year INTEGER NOT NULL, accession TEXT, chars INTEGER NOT NULL, '
+                                     'content BLOB NOT NULL, stored REAL NOT NULL, UNIQUE (cik, filing_date, item))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS sections_year ON sections (year)')
+        self.full_text = full_text and self._create_full_text_index()
+
+    def _create_full_text_index(self):
+        try:
+            with self._connection:
+                self._connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts "
+                                         "USING fts5(text, content='')")
+            return True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite has no FTS5, the section store is not searchable: {e}")
+            return False
+
+    def put_filing(self, cik_code, filing_date, sections, accession_number=None):
+        """
+        Stores the sections of one filing, replacing sections stored before under the same keys.
+
+        Parameters:
+        ----------
+        cik_code : str
+            The CIK code of the company.
+        filing_date : str
+            The filing date, as 'YYYY-MM-DD'.
+        sections : dict
+            Mapping of item to section text, as returned by TenKExtractor.parse_sections.
+        accession_number : str
+            The accession number of the filing.
+        """
+        cik_code = str(int(cik_code))
+        now = time.time()
+        with self._lock, self._connection:
+            for item, text in sections.items():
+                if text is None:
+                    continue
+                previous = self._connection.execute('SELECT id, content FROM sections WHERE cik = ? '
+                                                    'AND filing_date = ? AND item = ?',
+                                                    (cik_code, filing_date, item)).fetchone()
+                if previous is not None:
+                    self._delete(*previous)
+                cursor = self._connection.execute(
+                    'INSERT INTO sections (cik, filing_date, item, year, accession, chars, content, stored) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (cik_code, filing_date, item, int(filing_date[:4]), accession_number, len(text),
+                     zlib.compress(text.encode('utf-8'), 6), now))
+                if self.full_text:
+                    self._connection.execute('INSERT INTO sections_fts (rowid, text) VALUES (?, ?)',
+                                             (cursor.lastrowid, text))
+
+    def _delete(self, section_id, content):
+        if self.full_text:
+            # A contentless index can only forget a text it is given again
+            self._connection.execute("INSERT INTO sections_fts (sections_fts, rowid, text) VALUES ('delete', ?, ?)",
+                                     (section_id, zlib.decompress(content).decode('utf-8')))
+        self._connection.execute('DELETE FROM sections WHERE id = ?', (section_id,))
+
+    def has_filing(self, cik_code, filing_date):
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM sections WHERE cik = ? AND filing_date = ? LIMIT 1',
+                                            (str(int(cik_code)), filing_date)).fetchone() is not None
+
+    def get(self, cik_code, filing_date, item):
+        """
+        Returns the text of one section, or None when it is not stored.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT content FROM sections WHERE cik = ? AND filing_date = ? '
+                                           'AND item = ?', (str(int(cik_code)), filing_date, item)).fetchone()
+        return None if row is None else zlib.decompress(row[0]).decode('utf-8')
+
+    def get_filing(self, cik_code, filing_date, items=None):
+        """
+        Returns the stored sections of one filing as a mapping of item to text, empty when none are stored.
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT item, content FROM sections WHERE cik = ? AND filing_date = ? '
+                                            'ORDER BY id', (str(int(cik_code)), filing_date)).fetchall()
+        return {item: zlib.decompress(content).decode('utf-8') for item, content in rows
+                if items is None or item in items}
+
+    @staticmethod
+    def _where(cik_codes=None, years=None, items=None):
+        clauses, parameters = [], []
+        for column, values in (('cik', cik_codes and [str(int(cik_code)) for cik_code in cik_codes]),
+                               ('year', years and [int(year) for year in years]), ('item', items)):
+            if values:
+                clauses.append(f'{column} IN ({",".join("?" * len(values))})')
+                parameters.extend(values)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), parameters
+
+    def filings(self, cik_codes=None, years=None):
+        """
+        Returns the stored filings as a DataFrame of CIK, filing date, accession number, sections and characters.
+        """
+        where, parameters = self._where(cik_codes, years)
+        with self._lock:
+            return pd.read_sql_query(f'SELECT cik, filing_date, MAX(accession) AS accession, COUNT(*) AS sections, '
+                                     f'SUM(chars) AS chars FROM sections{where} GROUP BY cik, filing_date '
+                                     f'ORDER BY cik, filing_date', self._connection, params=parameters)
+
+    def iter_filings(self, cik_codes=None, years=None, items=None, fetch_size=256):
+        """
+        Streams the stored filings in (CIK, filing date) order, one filing in memory at a time.
+
+        Reads go through their own connection, so the store can keep being written while it is iterated.
+
+        Parameters:
+        ----------
+        cik_codes : list
+            Only yield the filings of these companies.
+        years : list
+            Only yield filings made in these years.
+        items : list
+            Only yield these sections, e.g. ['Item 1A', 'Item 7'].
+        fetch_size : int
+            Number of sections read from the database at once.
+
+        Yields:
+        ------
+        tuple
+            (CIK code, filing date, dict of item to section text).
+        """
+        where, parameters = self._where(cik_codes, years, items)
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            cursor = connection.execute(f'SELECT cik, filing_date, item, content FROM sections{where} '
+                                        f'ORDER BY cik, filing_date, id', parameters)
+            key, sections = None, {}
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for cik_code, filing_date, item, content in rows:
+                    if (cik_code, filing_date) != key:
+                        if key is not None:
+                            yield (*key, sections)
+                        key, sections = (cik_code, filing_date), {}
+                    sections[item] = zlib.decompress(content).decode('utf-8')
+            if key is not None:
+                yield (*key, sections)
+        finally:
+            connection.close()
+
+    def search(self, query, limit=20, items=None):
+        """
+        Searches the sections with an FTS5 query, e.g. '"material weakness"' or 'cybersecurity NEAR(breach, 5)'.
+
+        Returns:
+        -------
+        pd.DataFrame
+            CIK, filing date, item and BM25 rank of the best matching sections, best first.
+        """
+        if not self.full_text:
+            raise RuntimeError("The section store has no full-text index")
+        item_filter = f' AND sections.item IN ({",".join("?" * len(items))})' if items else ''
+        with self._lock:
+            return pd.read_sql_query(f'SELECT sections.cik, sections.filing_date, sections.item, '
+                                     f'bm25(sections_fts) AS rank FROM sections_fts '
+                                     f'JOIN sections ON sections.id = sections_fts.rowid '
+                                     f'WHERE sections_fts MATCH ?{item_filter} ORDER BY rank LIMIT ?',
+                                     self._connection, params=[query, *(items or []), limit])
+
+    def stats(self):
+        """
+        Returns the number of filings and sections, their characters and the size of the database.
+        """
+        with self._lock:
+            filings, sections, chars = self._connection.execute(
+                'SELECT COUNT(DISTINCT cik || filing_date), COUNT(*), COALESCE(SUM(chars), 0) '
+                'FROM sections').fetchone()
+        return {"filings": filings, "sections": sections, "chars": chars,
+                "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,20 +1,23 @@
+import hashlib
 import logging
 import os
-import re
-from dotenv import load_dotenv
-import pandas as pd
+import random
+import time
 
-from collections import Counter
-from nltk.corpus import stopwords
+from collections import defaultdict, OrderedDict
+from dotenv import load_dotenv
 from nltk.tokenize import word_tokenize
 from textstat import flesch_reading_ease
-from transformers import pipeline
-import torch
 import nltk
+from text_analysis.batch_scorer import BatchScorer, ChunkKey
+from text_analysis.model_registry import model_registry, SENTIMENT_MODEL, FINBERT_MODEL
+from text_analysis.readability import ReadabilityEngine
+from text_analysis.subword_chunker import SubwordChunker
+from text_analysis.telemetry import telemetry
+from text_analysis.tokenized_section import TokenizedSection
 from text_analysis.utils import timeit
 
 load_dotenv()
-lm_dictionary_path = os.getenv("LM_DICTIONARY_PATH")
 
 
 class SentimentAnalyzer:
@@ -29,43 +32,98 @@ class SentimentAnalyzer:
         The preprocessed tokens of the text.
     """
 
-    def __init__(self):
+    def __init__(self, registry=None, chunking='words', overlap=0, cache_size=16, inference_cache=None,
+                 truncation_sample=None):
         """
         Constructs all the necessary attributes for the SentimentAnalyzer object.
 
         Parameters:
         ----------
-        sections : dict
-            Dictionary of section names and text content only.
+        registry : ModelRegistry
+            The registry providing the shared models. Defaults to the process-wide model_registry.
+        chunking : str
+            'words' feeds the models the same 512-word chunks used for the text metrics (truncated by the
+            tokenizer), 'subword' packs the text into windows that fit each model's subword budget exactly.
+        overlap : int
+            Number of subword tokens shared by consecutive windows when chunking is 'subword'.
+        cache_size : int
+            Number of tokenized sections kept in memory.
+        inference_cache : InferenceCache
+            Persistent cache of model scores checked before running the models, or None.
+        truncation_sample : float
+            Fraction of the word chunks tokenized again with the models' tokenizers to log the subword tokens the
+            truncation drops. Defaults to TRUNCATION_SAMPLE, or 0 to skip this extra tokenization.
         """
         self.sections = None
         self.tokens = None
-        device = 0 if torch.backends.mps.is_available() else -1  # Use MPS if available
-        logging.info(f"Using device {device} for sentiment analysis")
-        self.sentiment_pipeline = pipeline(
-            'sentiment-analysis',
-            model='soleimanian/financial-roberta-large-sentiment',  # FinRoBERTa model for financial text
-            device=device
-        )
-        self.finbert_pipeline = pipeline(
-            'sentiment-analysis',
-            model='yiyanghkust/finbert-tone',
-            device=device
-        )
+        self.cache_size = cache_size
+        self._tokenized_sections = OrderedDict()
+        self.inference_cache = inference_cache
+        self.registry = registry or model_registry
+        self.sentiment_pipeline = self.registry.get_pipeline(SENTIMENT_MODEL)
+        self.finbert_pipeline = self.registry.get_pipeline(FINBERT_MODEL)
         self.lm_dict = self.load_lm_dictionary()
+        self.lm_scorer = self.registry.get_lm_scorer()
+        self.readability = ReadabilityEngine(self.registry.get_syllable_table())
+        if chunking not in ('words', 'subword'):
+            raise ValueError(f"Unknown chunking mode {chunking}")
+        self.chunkers = {}
+        self.truncation_meters = {}
+        if truncation_sample is None:
+            truncation_sample = float(os.getenv("TRUNCATION_SAMPLE", 0))
+        self.truncation_sample = truncation_sample
+        # Seeded so the same chunks are sampled in every run
+        self._truncation_random = random.Random(0)
+        if chunking == 'subword':
+            self.chunkers = {
+                "finbert_score": SubwordChunker(self.finbert_pipeline.tokenizer, overlap=overlap),
+                "conventional_score": SubwordChunker(self.sentiment_pipeline.tokenizer, overlap=overlap)
+            }
+        elif truncation_sample > 0:
+            # Word chunks are truncated by the pipelines; the models' tokenizers count the subword tokens lost
+            self.truncation_meters = {
+                name: SubwordChunker(pipeline.tokenizer, cache_size=0)
+                for name, pipeline in (("finbert_score", self.finbert_pipeline),
+                                       ("conventional_score", self.sentiment_pipeline))
+                if getattr(pipeline, 'tokenizer', None) is not None
+            }
+
+    def measure_truncation(self, chunk_texts):
+        """
+        Counts the subword tokens the pipelines drop from a sample of the word chunks.
+        """
+        if not self.truncation_meters:
+            return
+        sample = [text for text in chunk_texts if self._truncation_random.random() < self.truncation_sample]
+        if sample:
+            for meter in self.truncation_meters.values():
+                meter.measure_truncation(sample)
+
+    def log_truncation(self):
+        for score_name, meter in self.truncation_meters.items():
+            meter.log_stats(f"{score_name} truncation ({self.truncation_sample:.0%} of the chunks sampled)")
+
+    def tokenize_section(self, text) -> TokenizedSection:
+        """
+        Tokenizes a section once, reusing the cached result when the same text was seen before.
+        """
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if key in self._tokenized_sections:
+            self._tokenized_sections.move_to_end(key)
+            return self._tokenized_sections[key]
+
+        section = TokenizedSection(text)
+        self._tokenized_sections[key] = section
+        if len(self._tokenized_sections) > self.cache_size:
+            self._tokenized_sections.popitem(last=False)
+        return section
 
     def preprocess_text(self, text) -> str:
         """
         Preprocesses the text by removing extra spaces, punctuation, and stopwords, and converting to lowercase.
         """
-        text = re.sub(r'\s+', ' ', text)  # Remove extra spaces
-        text = re.sub(r'[^\w\s]', '', text)  # Remove punctuation
-        text = text.lower()  # Convert to lowercase
-        stop_words = set(stopwords.words('english'))
-        tokens = word_tokenize(text)
-        tokens = [word for word in tokens if word not in stop_words]
-        self.tokens = ' '.join(tokens)
-        return ' '.join(tokens)
+        self.tokens = self.tokenize_section(text).text
+        return self.tokens
 
     def analyze_finbert(self, text) -> dict:
         """
@@ -92,48 +150,29 @@ class SentimentAnalyzer:
         return {"conventional_score": sentiment['score']}
 
     def load_lm_dictionary(self):
-        lm_dict = pd.read_csv(lm_dictionary_path, index_col=0)
-        lm_dict.index = lm_dict.index.str.lower()  # Ensure lowercase index for consistency
-
-        # Convert year values to binary indicators
-        sentiment_columns = ["Positive", "Negative", "Uncertainty", "Litigious", "Constraining", "Strong_Modal",
-                             "Weak_Modal"]
-        for col in sentiment_columns:
-            if col in lm_dict.columns:
-                lm_dict[col] = lm_dict[col].apply(lambda x: 1 if x != 0 else 0)
-        lm_dict.columns = lm_dict.columns.str.lower()
-        return lm_dict
+        return self.registry.get_lm_dictionary()
 
     def analyze_loughran_mcdonald(self, text):
-        tokens = word_tokenize(text)
-        token_counts = Counter(tokens)
-
-        scores = {
-            "positive": 0,
-            "negative": 0,
-            "uncertainty": 0,
-            "litigious": 0,
-            "constraining": 0,
-            "strong_modal": 0,
-            "weak_modal": 0
-        }
+        """
+        Counts the Loughran-McDonald category words in the text.
+        """
+        return self.lm_scorer.score_tokens(word_tokenize(text))
 
-        for word, count in token_counts.items():
-            word = word.lower()
-            if word in self.lm_dict.index:
-                for key in scores.keys():
-                    try:
-                        # Safely add scores
-                        scores[key] += self.lm_dict.at[word, key] * count
-                    except KeyError as e:
-                        logging.warning(f"KeyError: {e} for word '{word}' in column '{key}'")
-                        continue  # Skip problematic words or keys
+    def analyze_loughran_mcdonald_chunks(self, chunks):
+        """
+        Counts the Loughran-McDonald category words of many token chunks with one sparse matrix product.
 
-        # convert to float
-        for key in scores.keys():
-            scores[key] = float(scores[key])
+        Parameters:
+        ----------
+        chunks : list
+            Token lists, e.g. the chunks of every section of a filing.
 
-        return scores
+        Returns:
+        -------
+        list
+            One dictionary of category counts per chunk.
+        """
+        return [self.lm_scorer.to_dict(row) for row in self.lm_scorer.score_batch(chunks)]
 
     def extract_text_metrics(self, text):
         """
@@ -160,18 +199,64 @@ class SentimentAnalyzer:
             "reading_ease": reading_ease
         }
 
-    def process_chunk(self, chunk):
-        truncated_text = ' '.join(chunk)
+    def extract_chunk_text_metrics(self, section, max_length=512):
+        """
+        Extracts the text metrics of every chunk of a tokenized section from its token lengths and syllable counts.
+
+        Returns:
+        -------
+        list
+            One dictionary of text metrics per chunk, as extract_text_metrics returns for the chunk text.
+        """
+        word_counts, avg_word_lengths = section.chunk_word_stats(max_length)
+        reading_ease = self.readability.chunk_scores(section, max_length)
+        return [{"word_count": int(word_count),
+                 "avg_word_length": float(avg_word_length),
+                 "reading_ease": float(score)}
+                for word_count, avg_word_length, score in zip(word_counts, avg_word_lengths, reading_ease)]
+
+    def process_chunk(self, chunk, model_scores=None, lm_metrics=None, text_metrics=None):
+        """
+        Computes all metrics for one chunk of tokens.
+
+        Parameters:
+        ----------
+        chunk : list
+            The tokens of the chunk.
+        model_scores : dict
+            Precomputed 'finbert_score' and 'conventional_score' from the batched path. When omitted, both
+            pipelines are run on the chunk.
+        lm_metrics : dict
+            Precomputed Loughran-McDonald counts of the chunk. When omitted, they are computed from the chunk.
+        text_metrics : dict
+            Precomputed text metrics of the chunk. When omitted, they are computed from the chunk.
+
+        Returns:
+        -------
+        tuple
+            Text, FinBERT, Loughran-McDonald and FinRoBERTa metrics of the chunk.
+        """
+        truncated_text = ' '.join(chunk) if None in (model_scores, lm_metrics, text_metrics) else None
 
         # Collect all metrics
-        text_metrics = self.extract_text_metrics(truncated_text)
-        finbert_metrics = self.analyze_finbert(truncated_text)
-        conventional_metrics = self.analyze_conventional(truncated_text)
-        lm_metrics = self.analyze_loughran_mcdonald(truncated_text)
+        if text_metrics is None:
+            text_metrics = self.extract_text_metrics(truncated_text)
+        if model_scores is None:
+            finbert_metrics = self.analyze_finbert(truncated_text)
+            conventional_metrics = self.analyze_conventional(truncated_text)
+        else:
+            finbert_metrics = {"finbert_score": model_scores["finbert_score"]}
+            conventional_metrics = {"conventional_score": model_scores["conventional_score"]}
+        if lm_metrics is None:
+            lm_metrics = self.analyze_loughran_mcdonald(truncated_text)
 
         return text_metrics, finbert_metrics, lm_metrics, conventional_metrics
 
-    def process_metrics(self, chunks, preprocessed_text, results):
+    def process_metrics(self, chunks, section, results):
+        """
+        Aggregates the chunk metrics of a section: model scores, readability and word lengths are averaged over the
+        chunks, Loughran-McDonald counts are divided by the number of words of the section (a TokenizedSection).
+        """
         # Initialize metrics accumulators
         aggregated_metrics = {
             "word_count": 0,
@@ -210,7 +295,7 @@ class SentimentAnalyzer:
         aggregated_metrics["finbert_score"] /= num_chunks
         aggregated_metrics["polarity_score"] /= num_chunks
 
-        num_words = len(preprocessed_text.split())
+        num_words = len(section)
         aggregated_metrics["positive"] /= num_words
         aggregated_metrics["negative"] /= num_words
         aggregated_metrics["uncertainty"] /= num_words
@@ -221,8 +306,21 @@ class SentimentAnalyzer:
 
         return aggregated_metrics
 
+    def combine_features(self, features):
+        """
+        Flattens the per-section features into one dictionary with keys prefixed by the section name.
+        """
+        all_features = {}
+        for feature in features:
+            # Create a new dictionary with modified keys
+            new_feature = {f"{feature['section']}_{key}": value for key, value in feature.items()}
+            # Update the all_features dictionary with the new_feature dictionary
+            all_features.update(new_feature)
+
+        return all_features
+
     @timeit
-    def analyze_sections(self, sections):
+    def analyze_sections(self, sections, batch_size=None):
         """
         Analyzes the sentiment and text metrics for each section.
 
@@ -230,32 +328,39 @@ class SentimentAnalyzer:
         ----------
         sections : dict
             A dictionary containing text sections to be analyzed.
+        batch_size : int
+            When given, the chunks of all sections are scored in padded batches of this size.
 
         Returns:
         -------
-        list
-            A list of dictionaries containing the extracted features for each section.
+        dict
+            The extracted features of all sections, keyed by '<section>_<feature>'.
         """
+        # Cached scores are handled by the batched path; batches of one chunk score like the unbatched path
+        if batch_size or self.chunkers or self.inference_cache is not None:
+            return self.analyze_filings({None: sections}, batch_size=batch_size or 1)[None]
+
         features = []
-        max_length = 512
 
         for section_name, text in sections.items():
             if not text:
                 continue
-            preprocessed_text = self.preprocess_text(text)
+            section = self.tokenize_section(text)
 
             # Split text into chunks of 512 tokens
-            tokens = word_tokenize(preprocessed_text)
-            chunks = [tokens[i:i + max_length] for i in range(0, len(tokens), max_length)]
-            # Ensure no token exceeds the max_length limit
-            chunks = [token[:512] if len(token) > 512 else token for token in chunks]
+            chunks = section.chunks()
 
             if len(chunks) == 0 or not chunks:
                 continue
-            results = [self.process_chunk(chunk) for chunk in chunks]
-            # with concurrent.futures.ThreadPoolExecutor() as executor:
-            #     results = list(executor.map(self.process_chunk, chunks))
-            aggregated_metrics = self.process_metrics(chunks, preprocessed_text, results)
+            if self.truncation_meters:
+                self.measure_truncation(section.chunk_texts())
+            with telemetry.span('analyze_section', section=section_name, tokens=len(section)):
+                lm_results = self.analyze_loughran_mcdonald_chunks(chunks)
+                text_results = self.extract_chunk_text_metrics(section)
+                results = [self.process_chunk(chunk, lm_metrics=lm_metrics, text_metrics=text_metrics)
+                           for chunk, lm_metrics, text_metrics in zip(chunks, lm_results, text_results)]
+                aggregated_metrics = self.process_metrics(chunks, section, results)
+            telemetry.count('analyzer_tokens_total', len(section), section=section_name)
             # Combine all metrics
             section_features = {
                 "section": section_name,
@@ -263,13 +368,98 @@ class SentimentAnalyzer:
             }
             features.append(section_features)
 
-        all_features = {}
-        for feature in features:
-            # Create a new dictionary with modified keys
-            new_feature = {f"{feature['section']}_{key}": value for key, value in feature.items()}
-            # Update the all_features dictionary with the new_feature dictionary
-            all_features.update(new_feature)
+        self.log_truncation()
+        return self.combine_features(features)
+
+    @timeit
+    def analyze_filings(self, filings, batch_size=16):
+        """
+        Analyzes several filings at once, scoring the chunks of every section of every filing in shared batches.
 
+        Parameters:
+        ----------
+        filings : dict
+            Mapping of a filing key (e.g. the filing date) to its dictionary of sections.
+        batch_size : int
+            Number of chunks per forward pass.
+
+        Returns:
+        -------
+        dict
+            Mapping of filing key to the same features analyze_sections returns for that filing.
+        """
+        scorer = BatchScorer({"finbert_score": self.finbert_pipeline,
+                              "conventional_score": self.sentiment_pipeline}, batch_size=batch_size,
+                             cache=self.inference_cache)
+
+        # Collect the chunks of every section before running the models
+        prepared = {}
+        start_time = time.perf_counter()
+        num_tokens = 0
+        with telemetry.span('analyzer_stage', stage='tokenize'):
+            for filing_key, sections in filings.items():
+                prepared[filing_key] = []
+                for section_name, text in sections.items():
+                    if not text:
+                        continue
+                    section = self.tokenize_section(text)
+                    chunks = section.chunks()
+                    if not chunks:
+                        continue
+                    if self.chunkers:
+                        # Each model gets its own windows, packed to its subword budget
+                        for score_name, chunker in self.chunkers.items():
+                            for i, window in enumerate(chunker.chunk(section.text)):
+                                scorer.add(ChunkKey(filing_key, section_name, i), window, score_name)
+                    else:
+                        chunk_texts = section.chunk_texts()
+                        for i, chunk_text in enumerate(chunk_texts):
+                            scorer.add(ChunkKey(filing_key, section_name, i), chunk_text)
+                        self.measure_truncation(chunk_texts)
+                    prepared[filing_key].append((section_name, section, chunks))
+                    num_tokens += len(section)
+                    telemetry.count('analyzer_tokens_total', len(section), section=section_name)
+                    telemetry.count('analyzer_chunks_total', len(chunks), section=section_name)
+
+        with telemetry.span('analyzer_stage', stage='inference'):
+            model_scores = scorer.score()
+        # Score the Loughran-McDonald categories of every chunk of every filing at once
+        with telemetry.span('analyzer_stage', stage='lexicon'):
+            lm_results = iter(self.analyze_loughran_mcdonald_chunks(
+                [chunk for sections in prepared.values() for _, _, chunks in sections for chunk in chunks]))
+
+        section_scores = defaultdict(lambda: defaultdict(list))
+        if self.chunkers:
+            for key, scores in model_scores.items():
+                for score_name, score in scores.items():
+                    section_scores[(key.filing, key.section)][score_name].append(score)
+        for score_name, chunker in self.chunkers.items():
+            chunker.log_stats(score_name)
+        self.log_truncation()
+
+        all_features = {}
+        for filing_key, sections in prepared.items():
+            features = []
+            for section_name, section, chunks in sections:
+                with telemetry.span('analyze_section', section=section_name, tokens=len(section)):
+                    text_results = self.extract_chunk_text_metrics(section)
+                    if self.chunkers:
+                        # The windows do not line up with the word chunks, so every chunk carries the section mean
+                        window_scores = section_scores[(filing_key, section_name)]
+                        section_mean = {name: sum(values) / len(values) for name, values in window_scores.items()}
+                        results = [self.process_chunk(chunk, section_mean, next(lm_results), text_metrics)
+                                   for chunk, text_metrics in zip(chunks, text_results)]
+                    else:
+                        results = [self.process_chunk(chunk, model_scores[ChunkKey(filing_key, section_name, i)],
+                                                      next(lm_results), text_metrics)
+                                   for i, (chunk, text_metrics) in enumerate(zip(chunks, text_results))]
+                    aggregated_metrics = self.process_metrics(chunks, section, results)
+                    features.append({"section": section_name, **aggregated_metrics})
+            all_features[filing_key] = self.combine_features(features)
+
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Analyzed {num_tokens} tokens of {len(filings)} filings in {elapsed:.2f} seconds "
+                     f"({num_tokens / elapsed if elapsed > 0 else 0:.0f} tokens per second)")
         return all_features
 
 
@@ -284,7 +474,7 @@ if __name__ == '__main__':
         "Item7": "Our consolidated financial statements present a snapshot of..."
     }
 
-    analyzer = SentimentAnalyzer(sections)
+    analyzer = SentimentAnalyzer()
     features = analyzer.analyze_sections(sections)
 
     print(features)
@@ -0,0 +1,236 @@
+import glob
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Columns identifying one scored filing; sort merged results on them when the order matters
+RESULT_KEY_COLUMNS = ['cik_code', 'year', 'date']
+
+
+def shard_of(cik_code, shards):
+    """
+    Returns the shard of a company. All years of a company go to the same shard, in every run.
+    """
+    return int(cik_code) % shards
+
+
+def split_work(work_items, shards):
+    """
+    Splits (CIK code, year) work items into shards, keeping their order within each shard.
+    """
+    split = [[] for _ in range(shards)]
+    for cik_code, year in work_items:
+        split[shard_of(cik_code, shards)].append((cik_code, year))
+    return split
+
+
+# Thread settings read once when a worker starts: OpenMP and MKL size their pools when torch is imported, which
+# happens while the worker imports the main module, and the model registry reads INFERENCE_THREADS on import
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'INFERENCE_THREADS')
+
+
+@contextmanager
+def _worker_environment(threads_per_worker):
+    """
+    Sets the thread variables inherited by the worker processes started inside the block, and restores them after.
+    """
+    previous = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(threads_per_worker) for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _init_worker(threads_per_worker):
+    import torch
+
+    # Each process gets its own share of the cores instead of every process using all of them
+    torch.set_num_threads(threads_per_worker)
+    torch.set_num_interop_threads(1)
+    # The SEC limit applies to the machine; the processes share it through the sec_rate_governor state file
+
+
+def _run_shard(function, shard_id, work_items, kwargs):
+    start_time = time.time()
+    result = function(shard_id, work_items, **kwargs)
+    return shard_id, len(work_items), time.time() - start_time, result
+
+
+class ShardedRunner:
+    """
+    A class to run a scoring function over shards of the work list in separate processes.
+
+    Every worker process loads its own copy of the models and runs with threads_per_worker intra-op threads, so a
+    machine with many cores scores several filings at the same time instead of one.
+
+    Attributes:
+    ----------
+    workers : int
+        Number of worker processes.
+    threads_per_worker : int
+        Number of torch intra-op threads in each worker.
+    shard_stats : list
+        (shard, work items, seconds) of every shard of the last run.
+    elapsed : float
+        Wall time of the last run in seconds.
+    """
+
+    def __init__(self, workers=None, threads_per_worker=None):
+        """
+        Constructs all the necessary attributes for the ShardedRunner object.
+
+        Parameters:
+        ----------
+        workers : int
+            Number of worker processes. Defaults to the number of cores divided by threads_per_worker, or 4.
+        threads_per_worker : int
+            Number of torch intra-op threads in each worker. Defaults to the cores divided by the workers.
+        """
+        cpu_count = os.cpu_count() or 1
+        self.workers = workers or max(1, cpu_count // (threads_per_worker or 4))
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // self.workers)
+        self.shard_stats = []
+        self.elapsed = 0.0
+
+    def run(self, function, work_items, **kwargs):
+        """
+        Runs function(shard_id, shard_work_items, **kwargs) for every non-empty shard, each in a worker process.
+
+        The function must be importable by the workers (defined at module level), and so must its arguments.
+
+        Returns:
+        -------
+        list
+            The results of the function, ordered by shard.
+        """
+        shards = split_work(work_items, self.workers)
+        context = multiprocessing.get_context('spawn')
+        start_time = time.time()
+        # threads_per_worker is the only thread setting of the workers, it overrides INFERENCE_THREADS
+        with _worker_environment(self.threads_per_worker), \
+                ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                    initargs=(self.threads_per_worker,)) as executor:
+            futures = [executor.submit(_run_shard, function, shard_id, shard, kwargs)
+                       for shard_id, shard in enumerate(shards) if shard]
+            outcomes = sorted(future.result() for future in futures)
+        self.elapsed = time.time() - start_time
+        self.shard_stats = [(shard_id, items, seconds) for shard_id, items, seconds, _ in outcomes]
+        logging.info(f"Sharded run report:\n{self.report()}")
+        return [result for *_, result in outcomes]
+
+    def report(self):
+        """
+        Returns the work items and time of every shard of the last run, with the overall throughput.
+
+        Returns:
+        -------
+        pd.DataFrame
+            One row per shard and a 'total' row.
+        """
+        report = pd.DataFrame(self.shard_stats, columns=['shard', 'items', 'seconds']).set_index('shard')
+        report.loc['total'] = [report['items'].sum(), self.elapsed]
+        report['items_per_second'] = report['items'] / report['seconds']
+        return report
+
+
+def measure_scaling(function, work_items, configurations, **kwargs):
+    """
+    Runs the same work items with several (workers, threads per worker) configurations and compares throughputs.
+
+    The function must score the items every time (e.g. with a scratch manifest), otherwise later configurations
+    only skip work already done.
+
+    Returns:
+    -------
+    pd.DataFrame
+        Wall time, throughput and speedup over the first configuration, one row per configuration.
+    """
+    rows = []
+    for workers, threads_per_worker in configurations:
+        runner = ShardedRunner(workers, threads_per_worker)
+        runner.run(function, work_items, **kwargs)
+        rows.append({'workers': workers, 'threads_per_worker': threads_per_worker, 'seconds': runner.elapsed,
+                     'items_per_second': len(work_items) / runner.elapsed})
+    report = pd.DataFrame(rows)
+    report['speedup'] = report['items_per_second'] / report['items_per_second'].iloc[0]
+    logging.info(f"Scaling report:\n{report}")
+    return report
+
+
+def shard_result_path(results_path, shard_id):
+    """
+    Returns the result dataset of one shard of a sharded run writing to results_path.
+    """
+    return os.path.join(f'{results_path}_shards', f'shard-{shard_id:03d}')
+
+
+def shard_result_paths(results_path):
+    """
+    Returns the result datasets of every shard found for results_path, including the shards left by an earlier run
+    with a different number of workers, whose filings the manifest already counts as scored.
+    """
+    return sorted(path for path in glob.glob(os.path.join(f'{results_path}_shards', 'shard-*'))
+                  if os.path.isdir(path))
+
+
+def merge_shard_results(shard_paths, output_path, remove_shards=True):
+    """
+    Merges the result datasets written by the shards into the output dataset, one file at a time.
+
+    The files of a ParquetResultSink dataset are complete and uniquely named, so they are moved into the matching
+    partition of the output without being read: memory does not depend on the number of results, and a merge that
+    stops halfway is finished by the next one, since the files already moved are gone from the shards. The merged
+    rows are in no particular order; sort them on RESULT_KEY_COLUMNS after reading when the order matters.
+
+    Parameters:
+    ----------
+    shard_paths : list
+        The shard datasets, e.g. shard_result_paths(output_path).
+    output_path : str
+        The dataset the results are merged into.
+    remove_shards : bool
+        Move the files and remove the shard datasets. When False, the files are copied and the shards kept;
+        merging the same shards again overwrites the copies instead of duplicating them.
+
+    Returns:
+    -------
+    int
+        Number of merged rows.
+    """
+    merged_rows = 0
+    for shard_path in shard_paths:
+        # Hidden temporary files of a crashed writer are not matched
+        for source in sorted(glob.glob(os.path.join(shard_path, '*', '*.parquet'))):
+            partition = os.path.basename(os.path.dirname(source))
+            directory = os.path.join(output_path, partition)
+            os.makedirs(directory, exist_ok=True)
+            destination = os.path.join(directory, os.path.basename(source))
+            merged_rows += pq.ParquetFile(source).metadata.num_rows
+            if remove_shards:
+                try:
+                    os.replace(source, destination)
+                    continue
+                except OSError:
+                    # The shards are on another file system, the file is copied instead
+                    pass
+            # Copies are renamed into place, so readers never see a partial file
+            temporary_path = os.path.join(directory, f'.{os.path.basename(source)}.tmp')
+            shutil.copyfile(source, temporary_path)
+            os.replace(temporary_path, destination)
+            if remove_shards:
+                os.remove(source)
+        if remove_shards:
+            shutil.rmtree(shard_path, ignore_errors=True)
+    return merged_rows
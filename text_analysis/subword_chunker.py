@@ -0,0 +1,131 @@
+import hashlib
+import logging
+from collections import OrderedDict
+
+
+class SubwordChunker:
+    """
+    A class to split text into windows that fit a model's subword budget exactly.
+
+    The text is tokenized once with the model's own (fast) tokenizer and packed into windows of
+    max_length - special tokens subwords, so no chunk is truncated by the pipeline.
+
+    Attributes:
+    ----------
+    tokenizer : transformers.PreTrainedTokenizerFast
+        The tokenizer of the model the windows are meant for.
+    max_length : int
+        Maximum sequence length of the model, special tokens included.
+    overlap : int
+        Number of subword tokens shared by consecutive windows.
+    stats : dict
+        Running totals of tokens seen, scored and discarded, and of windows produced. Windows always fit the budget,
+        so only the chunks passed to measure_truncation add discarded tokens.
+    """
+
+    def __init__(self, tokenizer, max_length=512, overlap=0, cache_size=256):
+        """
+        Constructs all the necessary attributes for the SubwordChunker object.
+
+        Parameters:
+        ----------
+        tokenizer : transformers.PreTrainedTokenizerFast
+            The tokenizer of the model.
+        max_length : int
+            Maximum sequence length of the model, special tokens included.
+        overlap : int
+            Number of subword tokens shared by consecutive windows.
+        cache_size : int
+            Number of tokenized texts kept in memory, 0 to keep none.
+        """
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.budget = max_length - tokenizer.num_special_tokens_to_add(pair=False)
+        if not 0 <= overlap < self.budget:
+            raise ValueError(f"Overlap must be between 0 and {self.budget - 1}, got {overlap}")
+        self.overlap = overlap
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.stats = {"tokens": 0, "tokens_scored": 0, "tokens_discarded": 0, "windows": 0}
+
+    def encode(self, text):
+        """
+        Tokenizes the text without special tokens, reusing a cached result when the same text was seen before.
+
+        Returns:
+        -------
+        list
+            (start, end) character offsets of every subword token.
+        """
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest() if self.cache_size else None
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False,
+                                  verbose=False)
+        offsets = encoding['offset_mapping']
+        if not self.cache_size:
+            return offsets
+        self._cache[key] = offsets
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return offsets
+
+    def chunk(self, text):
+        """
+        Splits the text into windows of at most budget subword tokens.
+
+        Parameters:
+        ----------
+        text : str
+            The text to split.
+
+        Returns:
+        -------
+        list
+            The window texts, sliced from the original text on token boundaries.
+        """
+        offsets = self.encode(text)
+        stride = self.budget - self.overlap
+        windows = []
+        for start in range(0, len(offsets), stride):
+            end = min(start + self.budget, len(offsets))
+            windows.append(text[offsets[start][0]:offsets[end - 1][1]])
+            if end == len(offsets):
+                break
+
+        self.stats["tokens"] += len(offsets)
+        self.stats["tokens_scored"] += len(offsets)
+        self.stats["windows"] += len(windows)
+        return windows
+
+    def measure_truncation(self, texts):
+        """
+        Counts the subword tokens a pipeline drops when the texts are truncated to max_length, and adds them to the
+        running stats.
+
+        Parameters:
+        ----------
+        texts : list
+            The chunk texts, e.g. the 512-word chunks of the word-based chunking.
+
+        Returns:
+        -------
+        dict
+            Number of tokens in the texts, tokens that fit in the budget and tokens discarded.
+        """
+        report = {"tokens": 0, "tokens_scored": 0, "tokens_discarded": 0}
+        for text in texts:
+            num_tokens = len(self.encode(text))
+            report["tokens"] += num_tokens
+            report["tokens_scored"] += min(num_tokens, self.budget)
+            report["tokens_discarded"] += max(0, num_tokens - self.budget)
+        for name, count in report.items():
+            self.stats[name] += count
+        self.stats["windows"] += len(texts)
+        return report
+
+    def log_stats(self, name):
+        logging.info(f"{name}: {self.stats['windows']} windows, {self.stats['tokens_scored']} of "
+                     f"{self.stats['tokens']} tokens scored, {self.stats['tokens_discarded']} discarded")
@@ -0,0 +1,324 @@
+import atexit
+import bisect
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tags kept as metric labels. Other tags (CIK, accession number, ...) have too many values to aggregate over and
+# are only written to the span records
+METRIC_LABELS = ('stage', 'section', 'kind', 'status', 'model', 'function', 'wait')
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _NoopSpan:
+    """
+    The span returned while telemetry is disabled: entering and leaving it does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **tags):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed operation, e.g. the download of one filing, tagged with what it worked on.
+
+    When the span ends its duration is added to the '<name>_seconds' histogram and, when a JSON-lines file is
+    configured, the span is written to it with its tags, its parent span and whether it raised.
+    """
+
+    def __init__(self, telemetry, name, tags):
+        self.telemetry = telemetry
+        self.name = name
+        self.tags = tags
+        self.span_id = None
+        self.parent_id = None
+
+    def set(self, **tags):
+        """
+        Adds tags known only once the work is done, e.g. the number of bytes read.
+        """
+        self.tags.update(tags)
+
+    def __enter__(self):
+        self.span_id, self.parent_id = self.telemetry._enter_span(self)
+        self.start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self._start
+        self.telemetry._exit_span(self, None if exc_type is None else exc_type.__name__)
+        return False
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _format_labels(labels, extra=()):
+    labels = (*labels, *extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Telemetry:
+    """
+    Process-wide counters, latency histograms and spans, exported to a JSON-lines file and a Prometheus text file.
+
+    Disabled by default: every call then returns right away and spans are a shared no-op, so the instrumentation
+    can stay in the hot paths. Set TELEMETRY_ENABLED=1 (or call configure) to record. Both paths may contain
+    '{pid}', so the worker processes of a sharded run write their own files.
+
+    Attributes:
+    ----------
+    enabled : bool
+        Whether anything is recorded.
+    jsonl_path : str
+        File every span (and, on flush, every metric) is appended to, or None.
+    prometheus_path : str
+        File the metrics are written to in the Prometheus text format on flush, or None.
+    """
+
+    def __init__(self, enabled=None, jsonl_path=None, prometheus_path=None, buckets=DEFAULT_BUCKETS):
+        """
+        Constructs all the necessary attributes for the Telemetry object.
+
+        Parameters:
+        ----------
+        enabled : bool
+            Whether anything is recorded. Defaults to TELEMETRY_ENABLED.
+        jsonl_path : str
+            JSON-lines file of the spans. Defaults to TELEMETRY_JSONL_PATH.
+        prometheus_path : str
+            Prometheus text file of the metrics. Defaults to TELEMETRY_PROMETHEUS_PATH.
+        buckets : tuple
+            Upper bounds of the histogram buckets, in seconds.
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._span_ids = itertools.count(1)
+        self._jsonl_file = None
+        self.reset()
+        self.configure(enabled if enabled is not None else
+                       os.getenv("TELEMETRY_ENABLED", '').lower() in ('1', 'true', 'yes'),
+                       jsonl_path or os.getenv("TELEMETRY_JSONL_PATH"),
+                       prometheus_path or os.getenv("TELEMETRY_PROMETHEUS_PATH"))
+
+    def configure(self, enabled=True, jsonl_path=None, prometheus_path=None):
+        """
+        Enables or disables recording and sets the export files.
+        """
+        with self._lock:
+            if self._jsonl_file is not None:
+                self._jsonl_file.close()
+                self._jsonl_file = None
+            self.enabled = enabled
+            self.jsonl_path = jsonl_path
+            self.prometheus_path = prometheus_path
+
+    def reset(self):
+        with self._lock:
+            self.counters = defaultdict(float)
+            self.histograms = {}
+            self.started = time.time()
+
+    @staticmethod
+    def _labels(tags):
+        return tuple((key, str(tags[key])) for key in METRIC_LABELS if tags.get(key) is not None)
+
+    def count(self, name, value=1, **tags):
+        """
+        Adds value to a counter, e.g. count('sec_bytes_downloaded_total', len(text), kind='10-K').
+        """
+        if not self.enabled:
+            return
+        key = (name, self._labels(tags))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **tags):
+        """
+        Records one value, e.g. a latency in seconds, in a histogram.
+        """
+        if not self.enabled:
+            return
+        key = (name, self._labels(tags))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def span(self, name, **tags):
+        """
+        Returns a context manager timing the operation, e.g.
+
+            with telemetry.span('parse_filing', cik=cik_code, accession=accession_number):
+                ...
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, tags)
+
+    def _enter_span(self, span):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent_id = stack[-1] if stack else None
+        span_id = next(self._span_ids)
+        stack.append(span_id)
+        return span_id, parent_id
+
+    def _exit_span(self, span, error):
+        stack = self._local.stack
+        if stack and stack[-1] == span.span_id:
+            stack.pop()
+        self.observe(f'{span.name}_seconds', span.duration, **span.tags)
+        if error is not None:
+            self.count(f'{span.name}_errors_total', **span.tags)
+        if self.jsonl_path:
+            self._write({'type': 'span', 'name': span.name, 'id': span.span_id, 'parent': span.parent_id,
+                         'start': span.start, 'duration_s': span.duration, 'error': error,
+                         'thread': threading.current_thread().name, 'pid': os.getpid(), 'tags': span.tags})
+
+    def _write(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            if self._jsonl_file is None:
+                self._jsonl_file = open(self.jsonl_path.format(pid=os.getpid()), 'a', encoding='utf-8')
+            self._jsonl_file.write(line)
+
+    def snapshot(self):
+        """
+        Returns the current metrics as a list of records, one per counter or histogram and label set.
+        """
+        records = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                records.append({'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                records.append({'type': 'histogram', 'name': name, 'labels': dict(labels), 'count': histogram.count,
+                                'sum': histogram.sum, 'max': histogram.max,
+                                'buckets': dict(zip([*map(str, histogram.buckets), '+Inf'],
+                                                    itertools.accumulate(histogram.counts)))})
+        return records
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        typed = set()
+        for (name, labels), value in counters:
+            name = _metric_name(name)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_format_labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms:
+            name = _metric_name(name)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            for bound, cumulative in zip([*map(str, histogram.buckets), '+Inf'],
+                                         itertools.accumulate(histogram.counts)):
+                lines.append(f'{name}_bucket{_format_labels(labels, (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=None):
+        path = (path or self.prometheus_path).format(pid=os.getpid())
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            file.write(self.to_prometheus())
+        # Scrapers never see a half written file
+        os.replace(temporary_path, path)
+
+    def report(self):
+        """
+        Returns where the time went: count, total, mean and maximum duration of every histogram, largest total first.
+
+        Returns:
+        -------
+        pd.DataFrame
+            One row per histogram and label set.
+        """
+        rows = [{'name': record['name'], **record['labels'], 'count': record['count'],
+                 'total_s': round(record['sum'], 3), 'mean_s': round(record['sum'] / record['count'], 4),
+                 'max_s': round(record['max'], 4)}
+                for record in self.snapshot() if record['type'] == 'histogram']
+        if not rows:
+            return pd.DataFrame(columns=['name', 'count', 'total_s', 'mean_s', 'max_s'])
+        return pd.DataFrame(rows).sort_values('total_s', ascending=False).reset_index(drop=True)
+
+    def flush(self):
+        """
+        Appends the current metrics to the JSON-lines file and rewrites the Prometheus file.
+        """
+        if not self.enabled:
+            return
+        if self.jsonl_path:
+            now = time.time()
+            for record in self.snapshot():
+                self._write({**record, 'time': now, 'pid': os.getpid()})
+            with self._lock:
+                if self._jsonl_file is not None:
+                    self._jsonl_file.flush()
+        if self.prometheus_path:
+            self.write_prometheus()
+        logging.info(f"Telemetry report:\n{self.report().to_string()}")
+
+    def close(self):
+        with self._lock:
+            if self._jsonl_file is not None:
+                self._jsonl_file.close()
+                self._jsonl_file = None
+
+
+# Shared by every module of the process
+telemetry = Telemetry()
+atexit.register(telemetry.close)
@@ -1,9 +1,13 @@
+import contextlib
 import logging
 import re
 import pandas as pd
 from bs4 import BeautifulSoup
 
+from text_analysis.edgar_fetcher import ConcurrentFetcher
+from text_analysis.html_text import HTMLText
 from text_analysis.sec_scraper import SECScraper
+from text_analysis.telemetry import telemetry
 
 
 class TenKExtractor:
@@ -18,9 +22,22 @@ class TenKExtractor:
         The start year for extracting 10-K filings.
     year_end : str
         The end year for extracting 10-K filings.
+    cache : FilingCache
+        Cache for the EDGAR downloads, or None to always download.
+    offline : bool
+        Serve filings only from the cache.
+    max_workers : int
+        Number of filings downloaded concurrently.
+    fetch_mode : str
+        'primary' downloads only the 10-K document, 'full' the complete submission with every exhibit.
+    section_store : SectionStore
+        Store of parsed sections, read instead of downloading and parsing a filing again, or None.
+    fetcher : ConcurrentFetcher
+        Fetcher shared with other extractors, or None to create one per call of iter_filings.
     """
 
-    def __init__(self, cik_code, year_start, year_end):
+    def __init__(self, cik_code, year_start, year_end, cache=None, offline=False, max_workers=4,
+                 fetch_mode='primary', section_store=None, fetcher=None):
         """
         Constructs all the necessary attributes for the TenKExtractor object.
 
@@ -32,10 +49,31 @@ class TenKExtractor:
             The start year for extracting 10-K filings.
         year_end : str
             The end year for extracting 10-K filings.
+        cache : FilingCache
+            Cache for the EDGAR downloads, or None to always download.
+        offline : bool
+            Serve filings only from the cache.
+        max_workers : int
+            Number of filings downloaded concurrently.
+        fetch_mode : str
+            'primary' downloads only the 10-K document (the primary document, or the full submission streamed up
+            to the end of the 10-K), 'full' downloads the complete submission with every exhibit.
+        section_store : SectionStore
+            Store of parsed sections. Filings found in it are neither downloaded nor parsed, and every filing parsed
+            is added to it.
+        fetcher : ConcurrentFetcher
+            Fetcher the filings are downloaded with, e.g. one created once per run and shared by the extractors of
+            every work item. It is not closed by the extractor. When None, iter_filings creates one per call.
         """
         self.cik_code = cik_code
         self.year_start = year_start
         self.year_end = year_end
+        self.cache = cache
+        self.offline = offline
+        self.max_workers = max_workers
+        self.fetch_mode = fetch_mode
+        self.section_store = section_store
+        self.fetcher = fetcher
 
     def clean_ten_k(self, raw_document):
         """
@@ -111,7 +149,7 @@ class TenKExtractor:
 
         return sections
 
-    def parse_sections(self, raw_document):
+    def parse_sections(self, raw_document, html_parser='fast'):
         """
         Parses the sections of the 10-K filing.
 
@@ -119,6 +157,9 @@ class TenKExtractor:
         ----------
         raw_document : dict
             The cleaned 10-K filing.
+        html_parser : str
+            'fast' extracts the text of the whole document once with HTMLText and slices it at the section
+            boundaries, 'bs4' parses every section separately with BeautifulSoup.
 
         Returns:
         -------
@@ -127,43 +168,192 @@ class TenKExtractor:
         """
         section_boundaries = self.get_section_boundaries(raw_document)
         document = raw_document['10-K']
+        html_text = HTMLText(document) if html_parser == 'fast' and len(section_boundaries) else None
         parsed_sections = {}
         for i in range(len(section_boundaries)):
-            if i + 1 < len(section_boundaries):
-                section_text = document[section_boundaries.iloc[i]['end']:section_boundaries.iloc[i + 1]['start']]
-            else:
-                section_text = document[section_boundaries.iloc[i]['end']:]
+            start = section_boundaries.iloc[i]['end']
+            end = section_boundaries.iloc[i + 1]['start'] if i + 1 < len(section_boundaries) else None
             # Clean the section text
-            section_text = BeautifulSoup(section_text, 'lxml').get_text("\n").replace('\xa0', ' ')
-            parsed_sections[section_boundaries.iloc[i]['item']] = section_text
+            if html_text is not None:
+                section_text = html_text.slice(start, end)
+            else:
+                section_text = BeautifulSoup(document[start:end], 'lxml').get_text("\n")
+            parsed_sections[section_boundaries.iloc[i]['item']] = section_text.replace('\xa0', ' ')
 
         return parsed_sections
 
+    def parse_filing(self, ten_k_filing):
+        """
+        Parses the sections of one downloaded filing, as fetched in the extractor's fetch_mode.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the parsed sections of the 10-K filing.
+        """
+        if self.fetch_mode == 'primary':
+            cleaned_ten_k = {'10-K': ten_k_filing}
+        else:
+            cleaned_ten_k = self.clean_ten_k(ten_k_filing)
+        return self.parse_sections(cleaned_ten_k)
+
+    def get_submissions(self, scraper=None):
+        """
+        Lists the 10-K filings of the company within the date range.
+
+        Returns:
+        -------
+        list
+            The filings, as returned by SECScraper.get_10_k_descriptions: empty when the company filed none in the
+            range, None when the submissions could not be fetched.
+        """
+        scraper = scraper or SECScraper(cache=self.cache, offline=self.offline)
+        return scraper.get_10_k_descriptions(cik_code=self.cik_code, date_start=f"{self.year_start}-01-01",
+                                             date_end=f"{self.year_end}-12-31")
+
+    def iter_filings(self, submissions, on_state=None, session=None):
+        """
+        Downloads and parses the given filings, yielding each one as soon as it is parsed.
+
+        Only the downloads in flight and the filing being yielded are held in memory: the raw text of a filing is
+        released once it is sectioned, so the peak memory does not grow with the number of filings.
+
+        Parameters:
+        ----------
+        submissions : list
+            The filings to extract, as returned by get_submissions.
+        on_state : callable
+            Called as on_state(accession_number, state, error) when a filing is fetched, parsed or failed.
+        session : requests.Session
+            Session for the downloads when the extractor has no fetcher. When None, a pooled session is created and
+            closed once the filings are done.
+
+        Yields:
+        ------
+        tuple
+            (submission, sections) of each successfully extracted filing, in the order the downloads finish.
+        """
+        on_state = on_state or (lambda accession_number, state, error=None: None)
+        submissions_by_accession = {submission['accessionNumber']: submission for submission in submissions}
+        to_fetch = []
+        for submission in submissions:
+            # Filings parsed by an earlier run are read back instead of being downloaded and parsed again
+            sections = None
+            if self.section_store is not None:
+                sections = self.section_store.get_filing(self.cik_code, submission['filingDate'])
+            if sections:
+                on_state(submission['accessionNumber'], 'parsed')
+                yield submission, sections
+            else:
+                to_fetch.append(submission)
+
+        if not to_fetch:
+            return
+        filings = ((self.cik_code, submission['accessionNumber'], submission['primaryDocument'])
+                   for submission in to_fetch)
+        if self.fetcher is not None:
+            # The shared fetcher keeps its threads and connections for the next work item
+            fetcher_context = contextlib.nullcontext(self.fetcher)
+        else:
+            fetcher_context = ConcurrentFetcher(max_workers=self.max_workers, cache=self.cache, offline=self.offline,
+                                                session=session)
+        with fetcher_context as fetcher:
+            # Filings are parsed as soon as their download finishes
+            for _, accession_number, ten_k_filing in fetcher.fetch_filings(filings, fetch_mode=self.fetch_mode):
+                if ten_k_filing is None:
+                    telemetry.count('filings_total', status='download_failed')
+                    on_state(accession_number, 'failed', 'download failed')
+                    continue
+                on_state(accession_number, 'fetched')
+                try:
+                    with telemetry.span('parse_filing', cik=self.cik_code, accession=accession_number,
+                                        bytes=len(ten_k_filing)):
+                        sections = self.parse_filing(ten_k_filing)
+                except Exception as e:
+                    logging.error(f"Failed to parse filing {accession_number} of company {self.cik_code}: {e}")
+                    telemetry.count('filings_total', status='parse_failed')
+                    on_state(accession_number, 'failed', repr(e))
+                    continue
+                finally:
+                    # Release the raw text before the consumer gets the sections, not when the next download arrives
+                    del ten_k_filing
+                submission = submissions_by_accession[accession_number]
+                if self.section_store is not None:
+                    self.section_store.put_filing(self.cik_code, submission['filingDate'], sections,
+                                                  accession_number)
+                telemetry.count('filings_total', status='parsed')
+                on_state(accession_number, 'parsed')
+                yield submission, sections
+
+    def extract_filings(self, submissions, on_state=None, session=None):
+        """
+        Downloads and parses the given filings, reporting the progress of each one.
+
+        Holds every parsed filing in memory; iter_filings yields them one at a time instead.
+
+        Parameters:
+        ----------
+        submissions : list
+            The filings to extract, as returned by get_submissions.
+        on_state : callable
+            Called as on_state(accession_number, state, error) when a filing is fetched, parsed or failed.
+        session : requests.Session
+            Session for the downloads, a new pooled session when None.
+
+        Returns:
+        -------
+        dict
+            The parsed sections of each successfully extracted filing, keyed by accession number.
+        """
+        return {submission['accessionNumber']: sections
+                for submission, sections in self.iter_filings(submissions, on_state, session)}
+
+    def iter_ten_k_filings(self):
+        """
+        Extracts the 10-K filings of the company within the date range, one at a time.
+
+        Yields:
+        ------
+        tuple
+            (filing date, sections 1, 1A, 7, 7A and 9A) of each filing, in the order the downloads finish.
+        """
+        scraper = SECScraper(cache=self.cache, offline=self.offline)
+        submissions = self.get_submissions(scraper)
+        if submissions is None:
+            return
+
+        count = 0
+        for submission, sections in self.iter_filings(submissions, session=scraper.session):
+            count += 1
+            yield submission['filingDate'], sections
+
+        logging.info(f"Extracted {count} 10-K filings for company {self.cik_code} "
+                     f"between {self.year_start} and {self.year_end}")
+
     def get_ten_k_filings(self):
         """
         Extracts and polishes all 10-K filings for a given company within a given date range.
 
+        Holds every filing of the range in memory; iter_ten_k_filings yields them one at a time instead.
+
         Returns:
         -------
         dict
             A dictionary containing sections 1, 1A, 7, 7A, and 9A of all 10-K filings.
         """
-        scraper = SECScraper()
-        submissions = scraper.get_10_k_descriptions(cik_code=self.cik_code, date_start=f"{self.year_start}-01-01",
-                                                    date_end=f"{self.year_end}-12-31")
+        scraper = SECScraper(cache=self.cache, offline=self.offline)
+        submissions = self.get_submissions(scraper)
         if submissions is None:
             return None
 
-        ten_k_filings = {}
-        for submission in submissions:
-            ten_k_filing = scraper.download_10k(cik_code=self.cik_code, accession_number=submission['accessionNumber'])
-            cleaned_ten_k = self.clean_ten_k(ten_k_filing)
-            parsed_sections = self.parse_sections(cleaned_ten_k)
-            ten_k_filings[submission['filingDate']] = parsed_sections
+        parsed_filings = self.extract_filings(submissions, session=scraper.session)
+        # Keep the order of the submissions index
+        ten_k_filings = {submission['filingDate']: parsed_filings[submission['accessionNumber']]
+                         for submission in submissions if submission['accessionNumber'] in parsed_filings}
 
         logging.info(f"Extracted {len(ten_k_filings)} 10-K filings for company {self.cik_code} "
                      f"between {self.year_start} and {self.year_end}")
-        # Dimension of one 10-K filing: 2.1 MB
+        # Dimension of one full 10-K submission: 2.1 MB, the 10-K document alone is a fraction of it
         return ten_k_filings
 
 
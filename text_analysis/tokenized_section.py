@@ -0,0 +1,106 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+
+@lru_cache(maxsize=None)
+def get_stop_words(language='english'):
+    """
+    Returns the NLTK stop words of a language, loaded once per process.
+    """
+    return frozenset(stopwords.words(language))
+
+
+class TokenizedSection:
+    """
+    The tokens of one section, computed once and shared by every metric of the section.
+
+    The text is cleaned like SentimentAnalyzer.preprocess_text (whitespace collapsed, punctuation removed,
+    lowercased, stop words dropped) and tokenized in a single pass. Token lengths and their offsets in the
+    preprocessed text are kept as arrays, so chunk texts and word statistics are sliced out instead of being
+    rebuilt and tokenized again.
+
+    Attributes:
+    ----------
+    tokens : list
+        The tokens, stop words removed.
+    text : str
+        The tokens joined by single spaces (the preprocessed text).
+    offsets : np.ndarray
+        Start offset of every token in text.
+    lengths : np.ndarray
+        Length of every token.
+    """
+
+    def __init__(self, text):
+        """
+        Constructs all the necessary attributes for the TokenizedSection object.
+
+        Parameters:
+        ----------
+        text : str
+            The raw text of the section.
+        """
+        text = WHITESPACE_PATTERN.sub(' ', text)
+        text = PUNCTUATION_PATTERN.sub('', text).lower()
+        stop_words = get_stop_words()
+        # Without punctuation the text is a single sentence, so sentence splitting can be skipped
+        self.tokens = [token for token in word_tokenize(text, preserve_line=True) if token not in stop_words]
+        self.text = ' '.join(self.tokens)
+        self.lengths = np.fromiter((len(token) for token in self.tokens), dtype=np.int64, count=len(self.tokens))
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths + 1)[:-1])).astype(np.int64)
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def chunk_bounds(self, max_length=512):
+        """
+        Returns the (start, end) token indices of consecutive chunks of at most max_length tokens.
+        """
+        return [(start, min(start + max_length, len(self.tokens))) for start in range(0, len(self.tokens), max_length)]
+
+    def chunks(self, max_length=512):
+        """
+        Returns the token lists of consecutive chunks of at most max_length tokens, computed once per length.
+        """
+        if max_length not in self._chunks:
+            self._chunks[max_length] = [self.tokens[start:end] for start, end in self.chunk_bounds(max_length)]
+        return self._chunks[max_length]
+
+    def span_text(self, start, end):
+        """
+        Returns the text of tokens start to end (exclusive), as ' '.join(tokens[start:end]) would.
+        """
+        if start >= end:
+            return ''
+        return self.text[self.offsets[start]:self.offsets[end - 1] + self.lengths[end - 1]]
+
+    def chunk_texts(self, max_length=512):
+        """
+        Returns the text of every chunk of at most max_length tokens.
+        """
+        return [self.span_text(start, end) for start, end in self.chunk_bounds(max_length)]
+
+    def chunk_word_stats(self, max_length=512):
+        """
+        Returns the word count and the average word length (characters of the chunk text per word, spaces
+        included) of every chunk, computed from the token lengths.
+
+        Returns:
+        -------
+        tuple
+            Word counts and average word lengths, one entry per chunk.
+        """
+        if not self.tokens:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        starts = np.arange(0, len(self.tokens), max_length)
+        word_counts = np.diff(np.append(starts, len(self.tokens)))
+        char_counts = np.add.reduceat(self.lengths, starts) + word_counts - 1
+        return word_counts, char_counts / word_counts
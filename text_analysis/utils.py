@@ -1,6 +1,8 @@
 import logging
+import threading
 import time
-from functools import wraps
+
+from text_analysis.telemetry import telemetry
 
 
 def timeit(func):
@@ -8,28 +10,44 @@ def timeit(func):
         start_time = time.time()
         result = func(*args, **kwargs)
         end_time = time.time()
+        telemetry.observe('function_seconds', end_time - start_time, function=func.__name__)
         logging.info(f"Function {func.__name__} took {end_time - start_time:.4f} seconds")
         return result
 
     return wrapper
 
 
-def rate_limiter(max_requests_per_second):
-    min_interval = 1 / max_requests_per_second  # Minimum time between requests
-    last_call_time = 0  # Track the last call time
-
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            nonlocal last_call_time
-            current_time = time.time()
-            elapsed = current_time - last_call_time
-            if elapsed < min_interval:
-                time.sleep(min_interval - elapsed)
-            last_call_time = time.time()
-            return func(*args, **kwargs)
-
-        return wrapper
-
-    return decorator
-
+class TokenBucket:
+    """
+    A thread-safe token bucket shared by every caller that draws from the same request budget.
+
+    Attributes:
+    ----------
+    rate : float
+        Tokens added per second, i.e. the sustained request rate.
+    capacity : float
+        Maximum number of tokens, i.e. the largest burst allowed.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available, without waiting. Returns whether a token was taken.
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False